@@ -6,7 +6,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import config
 from app.api.routes import router
-from app.database.client import cache_manager
+from app.database.client import cache_manager, cache_refresher, health_probe
 from app.core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -16,12 +16,23 @@ logger = get_logger(__name__)
 async def lifespan(app: FastAPI):
     """
     Lifecycle events для приложения
-    - При старте: загружаем данные в кэш
-    - При остановке: очистка ресурсов (если нужно)
+    - При старте: поднимаем кэш из файла снимка (догружая изменения в фоне)
+      или загружаем из БД, затем запускаем фоновое обновление.
+      Воркер, форкнутый из мастера (app.server), получает каталог готовым
+      и фоновую проверку доступности источника для /api/health
+    - При остановке: останавливаем фоновые потоки и отдаём аренду лидера
     """
     # Startup: загружаем данные в кэш
     logger.info("Starting application... Loading data into cache...")
-    success = cache_manager.refresh_cache()
+    if cache_manager.is_loaded:
+        # Каталог загружен в мастере до fork и общий с ним через copy-on-write
+        success = True
+    elif cache_manager.load_from_file():
+        # Снимок уже обслуживает запросы, изменения с его водяного знака догрузим в фоне
+        cache_refresher.trigger(trigger="startup")
+        success = True
+    else:
+        success = cache_manager.refresh_cache()
     if success:
         cache_info = cache_manager.get_cache_info()
         logger.info(
@@ -31,10 +42,18 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("Failed to load cache on startup. Cache will be loaded on first request.")
     
+    if config.CACHE_REFRESH_ENABLED:
+        cache_refresher.start()
+    health_probe.start()
+    
     yield
     
-    # Shutdown: очистка ресурсов (если нужно)
+    # Shutdown: останавливаем фоновое обновление
     logger.info("Shutting down application...")
+    cache_refresher.stop()
+    health_probe.stop()
+    cache_manager.flush_writes()
+    cache_manager.release_leadership()
 
 
 def create_app() -> FastAPI:
@@ -0,0 +1,72 @@
+"""
+Метрики кэша в текстовом формате Prometheus
+"""
+from typing import Any, Dict, List, Optional
+
+
+def _line(name: str, value: Optional[float], labels: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Строка метрики (None, если значения нет)"""
+    if value is None:
+        return None
+    label_str = ""
+    if labels:
+        label_str = "{" + ",".join(f'{key}="{val}"' for key, val in labels.items()) + "}"
+    return f"{name}{label_str} {float(value):g}"
+
+
+def render_cache_metrics(cache_info: Dict[str, Any]) -> str:
+    """
+    Сформировать метрики кэша из get_cache_info()
+
+    Args:
+        cache_info: Результат CacheManager.get_cache_info()
+
+    Returns:
+        Текст в формате Prometheus exposition
+    """
+    memory = cache_info.get("memory") or {}
+    details = cache_info.get("details") or {}
+    normalizer = cache_info.get("normalizer") or {}
+    metrics: List[tuple] = [
+        ("korzina_cache_generation", "gauge", "Поколение текущего снимка кэша",
+         [_line("korzina_cache_generation", cache_info.get("generation"))]),
+        ("korzina_cache_offers", "gauge", "Количество офферов в кэше",
+         [_line("korzina_cache_offers", cache_info.get("offers_count"))]),
+        ("korzina_cache_sellers", "gauge", "Количество продавцов в кэше",
+         [_line("korzina_cache_sellers", cache_info.get("sellers_count"))]),
+        ("korzina_cache_age_seconds", "gauge", "Возраст снимка кэша",
+         [_line("korzina_cache_age_seconds", cache_info.get("cache_age_seconds"))]),
+        ("korzina_cache_memory_bytes", "gauge", "Память снимка кэша по структурам",
+         [
+             _line("korzina_cache_memory_bytes", size, {"structure": structure})
+             for structure, size in (memory.get("structures") or {}).items()
+         ]),
+        ("korzina_cache_memory_total_bytes", "gauge", "Память снимка кэша всего",
+         [_line("korzina_cache_memory_total_bytes", memory.get("total_bytes"))]),
+        ("korzina_cache_memory_budget_bytes", "gauge", "Бюджет памяти снимка",
+         [_line("korzina_cache_memory_budget_bytes", memory.get("budget_bytes"))]),
+        ("korzina_cache_rejected_snapshots_total", "counter", "Снимки, отклонённые по бюджету памяти",
+         [_line("korzina_cache_rejected_snapshots_total", memory.get("rejected_snapshots"))]),
+        ("korzina_cache_details_entries", "gauge", "Офферы с холодными полями в LRU",
+         [_line("korzina_cache_details_entries", details.get("size"))]),
+        ("korzina_cache_details_hits_total", "counter", "Попадания в LRU холодных полей",
+         [_line("korzina_cache_details_hits_total", details.get("hits"))]),
+        ("korzina_cache_details_misses_total", "counter", "Промахи LRU холодных полей",
+         [_line("korzina_cache_details_misses_total", details.get("misses"))]),
+        ("korzina_title_normalize_cache_entries", "gauge", "Нормализованные названия в LRU",
+         [_line("korzina_title_normalize_cache_entries", normalizer.get("size"))]),
+        ("korzina_title_normalize_cache_hits_total", "counter", "Попадания в LRU нормализованных названий",
+         [_line("korzina_title_normalize_cache_hits_total", normalizer.get("hits"))]),
+        ("korzina_title_normalize_cache_misses_total", "counter", "Промахи LRU нормализованных названий",
+         [_line("korzina_title_normalize_cache_misses_total", normalizer.get("misses"))]),
+    ]
+
+    lines: List[str] = []
+    for name, metric_type, help_text, samples in metrics:
+        samples = [sample for sample in samples if sample is not None]
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,13 @@
 """
 FastAPI роуты
 """
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+import base64
+import hmac
+import json
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Any, Dict, Iterable, Iterator, List, Mapping
 
 from app.models import (
     SearchRequest,
@@ -13,10 +18,16 @@ from app.models import (
     ProductMatch,
     AlternativesRequest,
     AlternativesResponse,
+    OffersBatchRequest,
+    OfferChangesRequest,
     offer_to_response,
 )
+from app.api.metrics import render_cache_metrics
+from app.cache.cache_manager import ChangesRejected
+from app.cache.memory import MemoryBudgetExceeded
+from app.config import config
 from app.services.shop_search_service import ShopSearchService
-from app.database.client import cache_manager
+from app.database.client import cache_manager, cache_refresher, health_probe
 from app.core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -27,20 +38,32 @@ router = APIRouter(prefix="/api", tags=["api"])
 # Инициализируем сервис
 shop_search_service = ShopSearchService()
 
+# Сколько строк NDJSON отправлять одним чанком при выгрузке
+EXPORT_BATCH_SIZE = 500
+
 
 @router.api_route(
     "/health",
     methods=["GET", "POST"],
     response_model=HealthResponse,
     summary="Проверка работы сервера",
-    description="Health check endpoint для проверки состояния сервера и подключения к базе данных"
+    description="Health check endpoint для проверки состояния сервера и подключения к базе данных. Состояние БД берётся из фоновой проверки, запрос к БД на каждый вызов не выполняется"
 )
 async def health_check() -> HealthResponse:
     """Проверка работы сервера"""
     try:
-        db_healthy = cache_manager.health_check()
+        probe = health_probe.get_status()
+        if probe is None:
+            # Фоновая проверка ещё не отработала (например, сразу после старта)
+            probe = await run_in_threadpool(health_probe.probe)
+        
+        if probe.get("is_stale"):
+            raise HTTPException(
+                status_code=500,
+                detail="Database health is unknown: background probe is stale"
+            )
         
-        if db_healthy:
+        if probe["healthy"]:
             return HealthResponse(
                 status="success",
                 message="Shop Finder API работает!",
@@ -90,51 +113,89 @@ async def get_stats() -> StatsResponse:
         )
 
 
+async def _hydrate(offers: Iterable[Mapping[str, Any]]) -> List[Mapping[str, Any]]:
+    """Догрузить холодные поля офферов вне event loop (запрос к источнику блокирующий)"""
+    if not cache_manager.has_cold_tier:
+        return list(offers)
+    return await run_in_threadpool(cache_manager.hydrate_offers, list(offers))
+
+
+def _encode_cursor(generation: int, offer_id: Any) -> str:
+    """Курсор keyset-пагинации: последний выданный offer_id и поколение снимка"""
+    raw = json.dumps({"g": generation, "a": offer_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Разобрать курсор (ValueError, если он некорректен)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(data, dict) or "a" not in data or not isinstance(data.get("g"), int):
+        raise ValueError("Invalid cursor")
+    return data
+
+
 @router.get(
     "/offers",
     summary="Получить список офферов",
-    description="Получить список офферов с пагинацией и фильтрацией"
+    description=(
+        "Получить список офферов с пагинацией и фильтрацией. Офферы упорядочены по offer_id. "
+        "Для обхода всего каталога используйте cursor из next_cursor предыдущей страницы — "
+        "он остаётся корректным и после обновления кэша"
+    )
 )
 async def get_offers(
-    limit: int = Query(20, description="Количество офферов на странице", ge=1, le=100),
+    limit: int = Query(20, description="Количество офферов на странице", ge=1, le=1000),
     offset: int = Query(0, description="Смещение для пагинации", ge=0),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor)"),
     seller: Optional[str] = Query(None, description="Фильтр по продавцу"),
     category: Optional[str] = Query(None, description="Фильтр по категории"),
+    tag: Optional[str] = Query(None, description="Фильтр по тегу"),
     q: Optional[str] = Query(None, description="Поиск по названию")
 ):
     """Получить список офферов с пагинацией"""
     try:
-        all_offers = cache_manager.get_all_offers()
-        logger.info(f"Total offers: {len(all_offers)}")  # <-- ДОБАВИТЬ
-
-        filtered_offers = all_offers
-
-        if seller:
-            filtered_offers = [o for o in filtered_offers if o.get("seller_name") == seller]
-            logger.info(f"After seller filter: {len(filtered_offers)}")  # <-- ДОБАВИТЬ
+        cursor_data = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        ) from e
 
-        if category:
-            filtered_offers = [o for o in filtered_offers if o.get("category_name") == category]
-            logger.info(f"After category filter: {len(filtered_offers)}")  # <-- ДОБАВИТЬ
+    try:
+        snapshot = cache_manager.get_snapshot()
+        after = None
+        if cursor_data is not None:
+            after = cursor_data["a"]
+            if cursor_data["g"] != snapshot.generation:
+                # Курсор по offer_id остаётся корректным и в новом снимке
+                logger.info(f"Cursor from generation {cursor_data['g']}, serving generation {snapshot.generation}")
+
+        # Фильтры — пересечение posting lists снимка, страница берётся срезом индекса
+        page = snapshot.postings.page(
+            limit, offset=offset, after=after, seller=seller, category=category, tag=tag, q=q
+        )
+        paginated_offers = snapshot.offers.rows(page.rows)
+        logger.info(
+            f"Offers page: {len(paginated_offers)} of {page.total} "
+            f"(seller={seller!r}, category={category!r}, tag={tag!r}, q={q!r})"
+        )
 
-        if q:
-            q_lower = q.lower()
-            filtered_offers = [
-                o for o in filtered_offers
-                if q_lower in str(o.get("title", "")).lower()
-            ]
-            logger.info(f"After q filter '{q}': {len(filtered_offers)}")
-        
-        # Применяем пагинацию
-        total = len(filtered_offers)
-        paginated_offers = filtered_offers[offset:offset + limit]
+        next_cursor = None
+        if page.has_more and paginated_offers:
+            next_cursor = _encode_cursor(snapshot.generation, paginated_offers[-1].get("offer_id"))
         
         return {
-            "total": total,
+            "total": page.total,
             "limit": limit,
             "offset": offset,
             "count": len(paginated_offers),
-            "offers": paginated_offers
+            "generation": snapshot.generation,
+            "next_cursor": next_cursor,
+            "offers": await _hydrate(paginated_offers)
         }
         
     except Exception as e:
@@ -145,6 +206,46 @@ async def get_offers(
         )
 
 
+@router.get(
+    "/offers/export",
+    summary="Выгрузить офферы (NDJSON)",
+    description=(
+        "Потоковая выгрузка офферов в формате NDJSON (один JSON-объект на строку) "
+        "из одного снимка кэша. Поддерживает те же фильтры, что и /offers"
+    )
+)
+async def export_offers(
+    seller: Optional[str] = Query(None, description="Фильтр по продавцу"),
+    category: Optional[str] = Query(None, description="Фильтр по категории"),
+    tag: Optional[str] = Query(None, description="Фильтр по тегу"),
+    q: Optional[str] = Query(None, description="Поиск по названию")
+):
+    """Выгрузить офферы построчно, не собирая весь ответ в памяти"""
+    snapshot = cache_manager.get_snapshot()
+    logger.info(f"Offers export started (generation {snapshot.generation})")
+
+    def render(rows: List[int]) -> str:
+        # Холодные поля догружаются одним запросом на пачку
+        offers = cache_manager.hydrate_offers(snapshot.offers.rows(rows))
+        return "\n".join(json.dumps(dict(offer), ensure_ascii=False, default=str) for offer in offers) + "\n"
+
+    def generate_rows() -> Iterator[str]:
+        batch: List[int] = []
+        for row in snapshot.postings.iter_rows(seller=seller, category=category, tag=tag, q=q):
+            batch.append(row)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield render(batch)
+                batch.clear()
+        if batch:
+            yield render(batch)
+
+    return StreamingResponse(
+        generate_rows(),
+        media_type="application/x-ndjson",
+        headers={"X-Catalog-Generation": str(snapshot.generation)}
+    )
+
+
 @router.get(
     "/offer",
     summary="Получить информацию об оффере",
@@ -155,15 +256,12 @@ async def get_offer(
 ):
     """Получить полную информацию об оффере по ID"""
     try:
-        all_offers = cache_manager.get_all_offers()
-        
-        # Ищем оффер по ID
-        for offer in all_offers:
-            if str(offer.get("offer_id")) == str(offer_id):
-                return {
-                    "status": "success",
-                    "offer": offer
-                }
+        offer = cache_manager.get_offer(offer_id)
+        if offer is not None:
+            return {
+                "status": "success",
+                "offer": (await _hydrate([offer]))[0]
+            }
         
         # Если не нашли
         raise HTTPException(
@@ -181,6 +279,77 @@ async def get_offer(
         )
 
 
+@router.post(
+    "/offers/batch",
+    summary="Получить несколько офферов по ID",
+    description="Получить полную информацию о нескольких офферах за один запрос (до 1000 ID)"
+)
+async def get_offers_batch(request: OffersBatchRequest):
+    """Получить офферы по списку ID"""
+    try:
+        found = cache_manager.get_offers_by_ids(request.offer_ids)
+        missing_ids = [offer_id for offer_id in request.offer_ids if offer_id not in found]
+
+        return {
+            "status": "success",
+            "count": len(found),
+            "offers": await _hydrate(found.values()),
+            "missing_ids": missing_ids
+        }
+
+    except Exception as e:
+        logger.error(f"Error getting offers batch: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
+@router.post(
+    "/offers/ingest",
+    summary="Применить изменения офферов",
+    description="Применить пачку изменений офферов (upsert и удаление) к кэшу без полной перезагрузки. Требует заголовок X-Ingest-Token; выключен, если INGEST_TOKEN не задан"
+)
+async def ingest_offers(
+    request: OfferChangesRequest,
+    x_ingest_token: Optional[str] = Header(None, description="Токен приёма изменений (INGEST_TOKEN)")
+):
+    """Применить изменения офферов к кэшу"""
+    if not config.INGEST_TOKEN:
+        raise HTTPException(
+            status_code=503,
+            detail="Ingest is disabled"
+        )
+    if not x_ingest_token or not hmac.compare_digest(x_ingest_token, config.INGEST_TOKEN):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid ingest token"
+        )
+
+    try:
+        result = await run_in_threadpool(cache_manager.apply_changes, request.upserts, request.deletes)
+        return {
+            "status": "success",
+            **result
+        }
+    except ChangesRejected as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e)
+        ) from e
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(
+            status_code=507,
+            detail=str(e)
+        ) from e
+    except Exception as e:
+        logger.error(f"Error applying offer changes: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
 @router.get(
     "/products",
     summary="Получить предложения продавца",
@@ -198,21 +367,22 @@ async def get_products(
                 detail="Missing 'shop' parameter"
             )
 
-        seller_info = cache_manager.get_seller_info(shop)
+        snapshot = cache_manager.get_snapshot()
+        seller_info = snapshot.seller_info.get(shop)
         if not seller_info:
             raise HTTPException(
                 status_code=404,
                 detail="Seller not found"
             )
 
-        offers = cache_manager.get_offers_by_seller(shop)
-
-        # Формируем список предложений
-        offers_list = [offer_to_response(offer) for offer in offers]
+        offers = snapshot.get_offers_by_seller(shop)
 
         if q:
             qlower = q.lower()
-            offers_list = [o for o in offers_list if qlower in str(o["name"]).lower()]
+            offers = [o for o in offers if qlower in str(o.get("title", "")).lower()]
+
+        # Формируем список предложений
+        offers_list = [offer_to_response(offer) for offer in await _hydrate(offers)]
 
         return {
             "status": "success",
@@ -327,7 +497,7 @@ async def search_products_get(
             for p in result.found_products:
                 if p.found != "НЕ НАЙДЕН" and p.offer_data:
                     found_offers.append(p.offer_data)
-            return found_offers
+            return await _hydrate(found_offers)
         else:
             # Если ничего не найдено - возвращаем пустой массив
             return []
@@ -358,14 +528,8 @@ async def compare_prices(
                 detail="Missing 'offer_ids' parameter"
             )
 
-        # Получаем все офферы
-        all_offers = cache_manager.get_all_offers()
-
-        # Фильтруем нужные офферы
-        selected_offers = [
-            offer for offer in all_offers
-            if offer.get("offer_id") in offer_ids
-        ]
+        # Получаем нужные офферы по индексу offer_id
+        selected_offers = list(cache_manager.get_offers_by_ids(offer_ids).values())
 
         if not selected_offers:
             raise HTTPException(
@@ -386,19 +550,23 @@ async def compare_prices(
                 shop_products[shop_name] = []
 
             shop_totals[shop_name] += price
-            shop_products[shop_name].append(offer_to_response(offer))
+            shop_products[shop_name].append(offer)
 
         # Находим самый дешевый магазин
         cheapest_shop = min(shop_totals.items(), key=lambda x: x[1])
         cheapest_shop_name = cheapest_shop[0]
         cheapest_total_price = cheapest_shop[1]
+        products = [
+            offer_to_response(offer)
+            for offer in await _hydrate(shop_products[cheapest_shop_name])
+        ]
 
         return {
             "status": "success",
             "shop_name": cheapest_shop_name,
             "total_price": cheapest_total_price,
-            "products_count": len(shop_products[cheapest_shop_name]),
-            "products": shop_products[cheapest_shop_name]
+            "products_count": len(products),
+            "products": products
         }
 
     except HTTPException:
@@ -452,7 +620,8 @@ async def get_cache_info():
         cache_info = cache_manager.get_cache_info()
         return {
             "status": "success",
-            **cache_info
+            **cache_info,
+            "refresher": cache_refresher.get_status()
         }
     except Exception as e:
         logger.error(f"Error getting cache info: {e}")
@@ -462,31 +631,50 @@ async def get_cache_info():
         )
 
 
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    summary="Метрики кэша",
+    description="Метрики кэша (поколение, размер, память по структурам) в формате Prometheus"
+)
+async def get_metrics():
+    """Метрики кэша для Prometheus"""
+    try:
+        return PlainTextResponse(
+            render_cache_metrics(cache_manager.get_cache_info()),
+            media_type="text/plain; version=0.0.4"
+        )
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error"
+        )
+
+
 @router.post(
     "/cache/refresh",
+    status_code=202,
     summary="Обновить кэш",
-    description="Принудительно обновить кэш, загрузив данные из базы данных"
+    description="Поставить обновление кэша в очередь: full — полная перезагрузка, delta — только изменения, auto — delta с периодической полной сверкой. Возвращает ID задачи для опроса статуса"
 )
-async def refresh_cache():
-    """Обновить кэш"""
+async def refresh_cache(
+    mode: str = Query("auto", description="Режим обновления: auto, full или delta")
+):
+    """Запустить обновление кэша в фоне"""
     try:
-        logger.info("Manual cache refresh requested")
-        success = cache_manager.refresh_cache()
-        
-        if success:
-            cache_info = cache_manager.get_cache_info()
-            return {
-                "status": "success",
-                "message": "Cache refreshed successfully",
-                **cache_info
-            }
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to refresh cache"
-            )
-    except HTTPException:
-        raise
+        logger.info(f"Manual cache refresh requested (mode: {mode})")
+        job = cache_refresher.trigger(mode)
+        return {
+            "status": "accepted",
+            "message": "Cache refresh scheduled",
+            "job": job.to_dict()
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        ) from e
     except Exception as e:
         logger.error(f"Error refreshing cache: {e}")
         raise HTTPException(
@@ -495,6 +683,25 @@ async def refresh_cache():
         )
 
 
+@router.get(
+    "/cache/refresh/{job_id}",
+    summary="Статус обновления кэша",
+    description="Получить статус задачи обновления кэша по её ID"
+)
+async def get_refresh_job(job_id: str):
+    """Получить статус задачи обновления кэша"""
+    job = cache_refresher.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Refresh job '{job_id}' not found"
+        )
+    return {
+        "status": "success",
+        "job": job.to_dict()
+    }
+
+
 @router.get(
     "/offers/similar",
     summary="Похожие офферы в том же магазине",
@@ -2,6 +2,26 @@
 Модуль кэширования данных в памяти
 """
 from app.cache.cache_manager import CacheManager
+from app.cache.catalog_index import CatalogIndex
+from app.cache.leader import FileLease, LeaderLease, register_lease_backend
+from app.cache.offer_store import OfferRow, OfferStore, normalize_offer_id
+from app.cache.snapshot import CatalogSnapshot
+from app.cache.refresher import CacheRefresher, RefreshJob
+from app.cache.sources import CatalogDataSource, LocalCatalogSource, SupabaseCatalogSource
 
-__all__ = ["CacheManager"]
-
+__all__ = [
+    "CacheManager",
+    "CacheRefresher",
+    "CatalogDataSource",
+    "CatalogIndex",
+    "CatalogSnapshot",
+    "FileLease",
+    "LeaderLease",
+    "LocalCatalogSource",
+    "OfferRow",
+    "OfferStore",
+    "RefreshJob",
+    "SupabaseCatalogSource",
+    "normalize_offer_id",
+    "register_lease_backend",
+]
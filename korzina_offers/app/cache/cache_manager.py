@@ -1,39 +1,127 @@
 """
 Менеджер кэша для хранения данных в памяти
 """
-from typing import List, Dict, Any, Optional
+import os
+import time
+from collections import deque
+from typing import List, Dict, AbstractSet, Any, Optional, Iterable, Mapping, Sequence, Set, Tuple, Union
 from datetime import datetime
-from threading import Lock
+from threading import Lock, RLock, Thread
 from supabase import Client
+from app.cache.catalog_index import CatalogIndex
+from app.cache.details import OfferDetailsCache
+from app.cache.leader import LeaderLease, create_lease, read_worker_statuses, worker_id, write_worker_status
+from app.cache.memory import MemoryBudgetExceeded, measure_structures, register_memory_source
+from app.cache.offer_store import OfferStore, normalize_offer_id
+from app.cache.snapshot import CatalogSnapshot
+from app.cache.shared_segment import SegmentError, mark_verified, open_segment, read_current, write_segment
+from app.cache.snapshot_file import SnapshotFileError, read_snapshot_file, write_snapshot_file
+from app.cache.sources import CatalogDataSource, SupabaseCatalogSource
+from app.config import config
 from app.core.logger import get_logger
+from app.services.title_normalizer import get_normalizer, get_title_cache
 
 logger = get_logger(__name__)
 
+# LRU нормализованных названий учитывается в памяти вместе со снимком
+register_memory_source("title_normalize_cache", get_title_cache)
+
+# Режимы обновления кэша
+REFRESH_MODE_FULL = "full"
+REFRESH_MODE_DELTA = "delta"
+REFRESH_MODE_AUTO = "auto"
+REFRESH_MODE_FILE = "file"  # только для статуса: снимок поднят из файла
+REFRESH_MODE_SHARED = "shared"  # только для статуса: подключён общий сегмент
+REFRESH_MODE_INGEST = "ingest"  # только для статуса: применены присланные изменения
+REFRESH_MODES = (REFRESH_MODE_AUTO, REFRESH_MODE_FULL, REFRESH_MODE_DELTA)
+
+# Роли процесса при общем сегменте каталога (CACHE_SHARED_DIR)
+SHARED_ROLE_WRITER = "writer"  # загружает каталог из источника и пишет сегменты
+SHARED_ROLE_READER = "reader"  # только подключается к сегментам
+SHARED_ROLE_AUTO = "auto"  # писатель или читатель по результату выбора лидера
+SHARED_ROLES = (SHARED_ROLE_WRITER, SHARED_ROLE_READER, SHARED_ROLE_AUTO)
+
+
+class ChangesRejected(Exception):
+    """Процесс не может применить присланные изменения к своему каталогу"""
+
 
 class CacheManager:
     """Менеджер кэша для хранения данных в памяти"""
     
-    def __init__(self, db_client: Client):
+    def __init__(
+            self,
+            data_source: Union[CatalogDataSource, Client],
+            snapshot_path: Optional[str] = None,
+            shared_dir: Optional[str] = None,
+            shared_role: str = SHARED_ROLE_READER
+    ):
         """
         Инициализация кэш-менеджера
         
         Args:
-            db_client: Клиент Supabase для загрузки данных
+            data_source: Источник каталога (клиент Supabase оборачивается
+                в SupabaseCatalogSource)
+            snapshot_path: Файл, в который сохраняется каждый опубликованный снимок
+                (None — не сохранять)
+            shared_dir: Каталог общего сегмента (None — каталог только в памяти процесса)
+            shared_role: "writer" — загружать из источника и писать сегменты,
+                "reader" — только подключаться к сегментам писателя,
+                "auto" — писать сегменты, пока процесс держит аренду лидера
+                (CACHE_LEADER_BACKEND), иначе читать их
         """
-        self.db_client = db_client
-        self._lock = Lock()
+        if not isinstance(data_source, CatalogDataSource):
+            data_source = SupabaseCatalogSource(data_source)
+        if shared_role not in SHARED_ROLES:
+            raise ValueError(f"Unknown shared cache role: {shared_role}")
+        self.data_source = data_source
+        self.snapshot_path = snapshot_path
+        self.shared_dir = shared_dir
+        self.shared_role = shared_role
+        
+        # Аренда лидера: при роли auto загружает из источника только её держатель
+        self.lease: Optional[LeaderLease] = (
+            create_lease(config.CACHE_LEADER_BACKEND, shared_dir)
+            if shared_dir and shared_role == SHARED_ROLE_AUTO else None
+        )
+        self._last_source_refresh: Optional[float] = None
+        
+        # Загрузки выполняются по одной (single-flight), читатели блокировку не берут
+        self._load_lock = RLock()
+        self._load_attempts = 0
         
-        # Кэшированные данные
-        self._all_offers: List[Dict[str, Any]] = []
-        self._offers_by_seller: Dict[str, List[Dict[str, Any]]] = {}
-        self._unique_sellers: List[str] = []
-        self._seller_info: Dict[str, Dict[str, Any]] = {}
+        # Текущий снимок каталога, подменяется атомарно при каждой загрузке
+        self._snapshot: CatalogSnapshot = CatalogSnapshot.empty()
         
-        # Метаданные кэша
-        self._last_update: Optional[datetime] = None
-        self._is_loaded = False
+        # Состояние инкрементальных обновлений
+        self._deltas_since_full = 0
+        # Когда данные снимка последний раз сверялись с источником (в том числе
+        # delta-обновлением без изменений); по нему считаются возраст и is_stale
+        self._verified_at: Optional[datetime] = None
+        self._last_refresh: Dict[str, Any] = {}
         
-        logger.info("CacheManager initialized")
+        # Учёт памяти снимков по поколениям и отказы по бюджету
+        self._memory_history: "deque[Dict[str, Any]]" = deque(maxlen=config.CACHE_MEMORY_HISTORY)
+        self._memory_rejections = 0
+        self._last_memory_rejection: Optional[Dict[str, Any]] = None
+        # Последний точный замер (между замерами размер снимка оценивается по нему)
+        self._last_measured: Optional[Dict[str, Any]] = None
+        self._last_measured_time = 0.0
+        # Когда снимок последний раз сохранялся в файл (time.monotonic) и какое поколение
+        self._last_persist_time: Optional[float] = None
+        self._persisted_generation = 0
+
+        # Файл снимка и общий сегмент после небольших изменений пишет фоновый поток
+        self._write_lock = Lock()
+        self._written_generation = 0
+        self._pending_lock = Lock()
+        self._pending_write: Optional[CatalogSnapshot] = None
+        self._writer: Optional[Thread] = None
+        
+        # Холодные поля офферов (при заданных CACHE_HOT_COLUMNS), догружаемые для ответов
+        self.details = OfferDetailsCache(self.data_source, max_size=config.CACHE_DETAILS_CACHE_SIZE)
+        
+        logger.info(f"CacheManager initialized ({self.data_source!r})")
 
     def load_all_data(self) -> bool:
         """
@@ -42,91 +130,753 @@ class CacheManager:
         Returns:
             True если загрузка успешна, False в противном случае
         """
+        with self._load_lock:
+            self._load_attempts += 1
+            return self._load_all_data_locked()
+
+    @property
+    def is_loaded(self) -> bool:
+        """Каталог уже загружен (без попытки загрузки)"""
+        return self._snapshot.is_loaded
+
+    @property
+    def is_leader(self) -> bool:
+        """Процесс загружает каталог из источника и пишет общий сегмент"""
+        if self.lease is not None:
+            return self.lease.is_held
+        return bool(self.shared_dir) and self.shared_role == SHARED_ROLE_WRITER
+
+    @property
+    def is_shared_reader(self) -> bool:
+        """Процесс читает каталог из общего сегмента, а не из источника"""
+        return bool(self.shared_dir) and not self.is_leader
+
+    def _elect(self) -> None:
+        """
+        Попытаться стать лидером (роль auto, вызывается под self._load_lock)
+
+        Новый лидер сначала подключает последний сегмент прежнего лидера,
+        чтобы продолжить его поколения и водяной знак, а не грузить всё заново.
+        """
+        if self.lease is None or self.lease.is_held:
+            return
+        try:
+            acquired = self.lease.try_acquire()
+        except Exception as e:
+            logger.error(f"Leader election failed ({self.lease!r}): {e}")
+            return
+        if acquired:
+            logger.info(f"Process {worker_id()} became catalog refresh leader ({self.lease!r})")
+            self._attach_shared_locked()
+            self._last_source_refresh = None
+
+    def release_leadership(self) -> None:
+        """Отдать аренду лидера (при остановке процесса)"""
+        if self.lease is not None and self.lease.is_held:
+            with self._load_lock:
+                self.lease.release()
+            logger.info(f"Process {worker_id()} released catalog refresh leadership")
+
+    def _load_all_data_locked(self) -> bool:
+        """Загрузка данных из БД (вызывается под self._load_lock)"""
+        self._elect()
+        if self.is_shared_reader:
+            return self._attach_shared_locked()
+        started = time.monotonic()
         try:
             logger.info("Loading all data into cache...")
 
-            # Загружаем все офферы с пагинацией
-            # Supabase ограничивает до 1000 записей за запрос
-            all_offers = []
-            page_size = 1000
-            offset = 0
+            rows = self.data_source.load_all(self._hot_columns())
+            all_offers = [offer for offer in rows if not self._is_tombstone(offer)]
+
+            snapshot = self._publish(all_offers, watermark=self._advance_watermark(None, all_offers))
+            self.details.clear()
+            self._deltas_since_full = 0
+            self._verified_at = snapshot.loaded_at
+            self._record_refresh(REFRESH_MODE_FULL, started, snapshot, changed=len(all_offers), deleted=0)
+
+            logger.info(
+                f"Cache loaded successfully: {len(snapshot.offers)} offers, "
+                f"{len(snapshot.unique_sellers)} sellers (generation {snapshot.generation})"
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"Error loading data into cache: {e}")
+            return False
+
+    def load_delta(self) -> bool:
+        """
+        Догрузить только изменившиеся с последнего водяного знака офферы
+
+        Изменённые строки сливаются с текущим снимком, производные поля
+        неизменившихся офферов переиспользуются. Удаления видны через
+        колонку-признак (CACHE_TOMBSTONE_COLUMN) или при периодической
+        полной сверке (CACHE_FULL_REFRESH_EVERY).
+
+        Returns:
+            True если обновление успешно, False в противном случае
+        """
+        with self._load_lock:
+            self._load_attempts += 1
+            self._elect()
+            if self.is_shared_reader:
+                return self._attach_shared_locked()
+            current = self._snapshot
+            if not current.is_loaded or current.watermark is None:
+                logger.info("No watermark for delta refresh, falling back to full load")
+                return self._load_all_data_locked()
+
+            started = time.monotonic()
+            column, value = current.watermark
+            try:
+                logger.info(f"Loading cache delta: {column} >= {value}")
+
+                # Без колонки времени изменения (водяной знак по offer_id)
+                # источник отдаёт только новые офферы
+                changed = self.data_source.load_changes(column, value, self._hot_columns())
+                self.details.invalidate(offer.get("offer_id") for offer in changed)
+
+                replaced, added, deleted, changed_count, deleted_count = self._merge_changes(current.offers, changed)
 
-            while True:
-                result = self.db_client.table("analog_offers") \
-                    .select("*") \
-                    .range(offset, offset + page_size - 1) \
-                    .execute()
+                snapshot = current
+                if changed_count or deleted_count:
+                    snapshot = self._publish_changes(
+                        current, replaced, added, deleted,
+                        watermark=self._advance_watermark(current.watermark, changed)
+                    )
+                    self._verified_at = snapshot.loaded_at
+                else:
+                    # Источник подтвердил, что снимок актуален, хотя поколение не сменилось
+                    self._verified_at = datetime.now()
+                    self._share_verified(snapshot)
+                self._deltas_since_full += 1
+                self._record_refresh(REFRESH_MODE_DELTA, started, snapshot, changed_count, deleted_count)
 
-                batch = result.data or []
-                if not batch:
-                    break
+                logger.info(
+                    f"Cache delta applied: {changed_count} changed, {deleted_count} deleted "
+                    f"(generation {snapshot.generation})"
+                )
+                return True
+
+            except Exception as e:
+                logger.error(f"Error loading cache delta: {e}")
+                return False
+
+    def apply_changes(
+            self,
+            upserts: Iterable[Mapping[str, Any]] = (),
+            deletes: Iterable[Any] = ()
+    ) -> Dict[str, Any]:
+        """
+        Применить присланные изменения офферов без загрузки из источника
 
-                all_offers.extend(batch)
-                logger.info(f"Loaded {len(all_offers)} offers so far...")
+        Upsert дополняет существующий оффер переданными полями (достаточно
+        offer_id и новой цены) или добавляет новый. Новый снимок собирается
+        из текущего как при delta-обновлении: нормализуются только присланные
+        офферы, правятся только затронутые ими группы и индексы. Файл снимка
+        и общий сегмент пишутся в фоне. Водяной знак не сдвигается —
+        следующая сверка с источником подтвердит изменения.
 
-                # Если получили меньше page_size, значит это последняя страница
-                if len(batch) < page_size:
-                    break
+        Args:
+            upserts: Новые и изменённые офферы (обязателен offer_id)
+            deletes: ID удалённых офферов
+
+        Returns:
+            {"generation": N, "changed": N, "deleted": N}
 
-                offset += page_size
+        Raises:
+            ValueError: upsert без offer_id
+            ChangesRejected: каталог ещё не загружен или процесс только читает общий сегмент
+            MemoryBudgetExceeded: новый снимок не помещается в бюджет памяти
+        """
+        upserts = list(upserts)
+        deletes = list(deletes)
+        if any(offer.get("offer_id") is None for offer in upserts):
+            raise ValueError("Every upserted offer must have offer_id")
+
+        with self._load_lock:
+            self._elect()
+            if self.is_shared_reader:
+                raise ChangesRejected("This process only reads the shared catalog segment; send changes to the writer")
+            current = self._snapshot
+            if not current.is_loaded:
+                raise ChangesRejected("Catalog is not loaded yet")
+
+            started = time.monotonic()
+            changed = []
+            for upsert in upserts:
+                existing = current.get_offer(upsert["offer_id"])
+                changed.append({**existing, **upsert} if existing is not None else dict(upsert))
+            self.details.invalidate([*(offer["offer_id"] for offer in changed), *deletes])
+
+            replaced, added, deleted, changed_count, deleted_count = self._merge_changes(
+                current.offers, changed, deletes
+            )
+            snapshot = current
+            if changed_count or deleted_count:
+                snapshot = self._publish_changes(
+                    current, replaced, added, deleted, watermark=current.watermark, background=True
+                )
+            self._record_refresh(REFRESH_MODE_INGEST, started, snapshot, changed_count, deleted_count)
 
-            with self._lock:
-                # Сохраняем все офферы
-                self._all_offers = all_offers
+        logger.info(
+            f"Applied pushed changes: {changed_count} changed, {deleted_count} deleted "
+            f"(generation {snapshot.generation})"
+        )
+        return {"generation": snapshot.generation, "changed": changed_count, "deleted": deleted_count}
 
-                # Группируем по продавцам
-                self._offers_by_seller = {}
-                self._seller_info = {}
-                sellers_set = set()
+    def load_from_file(self) -> bool:
+        """
+        Поднять кэш из файла снимка (тёплый старт без обращения к БД)
 
-                for offer in all_offers:
-                    seller_name = offer.get("seller_name")
-                    if seller_name:
-                        sellers_set.add(seller_name)
+        Снимок восстанавливается с тем же поколением и водяным знаком,
+        поэтому следующее обновление догружает только изменения.
 
-                        # Группируем офферы по продавцам
-                        if seller_name not in self._offers_by_seller:
-                            self._offers_by_seller[seller_name] = []
-                        self._offers_by_seller[seller_name].append(offer)
+        Returns:
+            True если снимок восстановлен, False если файла нет или он непригоден
+        """
+        if not self.snapshot_path or self.is_shared_reader:
+            return False
 
-                        # Сохраняем информацию о продавце (первый оффер)
-                        if seller_name not in self._seller_info:
-                            self._seller_info[seller_name] = {
-                                "name": seller_name,
-                                "id": seller_name
-                            }
+        with self._load_lock:
+            started = time.monotonic()
+            try:
+                snapshot = read_snapshot_file(self.snapshot_path)
+            except SnapshotFileError as e:
+                logger.warning(f"Snapshot file is not usable: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Error restoring cache from snapshot file: {e}")
+                return False
 
-                # Сохраняем уникальных продавцов
-                self._unique_sellers = sorted(list(sellers_set))
+            try:
+                self._check_memory(snapshot)
+            except MemoryBudgetExceeded as e:
+                logger.error(f"Snapshot file rejected: {e}")
+                return False
 
-                # Обновляем метаданные
-                self._last_update = datetime.now()
-                self._is_loaded = True
+            self._snapshot = snapshot
+            self._verified_at = snapshot.loaded_at
+            self._share(snapshot)
+            self._record_refresh(REFRESH_MODE_FILE, started, snapshot, changed=len(snapshot.offers), deleted=0)
 
             logger.info(
-                f"Cache loaded successfully: {len(all_offers)} offers, "
-                f"{len(self._unique_sellers)} sellers"
+                f"Cache restored from {self.snapshot_path}: {len(snapshot.offers)} offers "
+                f"(generation {snapshot.generation}) in {time.monotonic() - started:.3f}s"
             )
             return True
 
+    def attach_shared(self) -> bool:
+        """
+        Подключиться к новому поколению общего сегмента, если оно появилось
+
+        Returns:
+            True если подключён актуальный сегмент, False если сегмента нет
+            или он непригоден (текущий снимок продолжает обслуживаться)
+        """
+        with self._load_lock:
+            self._load_attempts += 1
+            return self._attach_shared_locked()
+
+    def _attach_shared_locked(self) -> bool:
+        """Подключение к сегменту (вызывается под self._load_lock)"""
+        started = time.monotonic()
+        try:
+            current = read_current(self.shared_dir)
+            if current is None:
+                logger.warning(f"No shared catalog segment in {self.shared_dir} yet")
+                return False
+            if current["generation"] <= self._snapshot.generation:
+                self._verified_at = self._shared_verified_at(current) or self._verified_at
+                return True
+
+            snapshot = open_segment(os.path.join(self.shared_dir, current["file"]))
+            self._check_memory(snapshot)
+        except (SegmentError, MemoryBudgetExceeded) as e:
+            logger.error(f"Shared catalog segment is not usable: {e}")
+            return False
         except Exception as e:
-            logger.error(f"Error loading data into cache: {e}")
+            logger.error(f"Error attaching shared catalog segment: {e}")
             return False
+
+        self._snapshot = snapshot
+        self._verified_at = self._shared_verified_at(current) or snapshot.loaded_at
+        self.details.clear()
+        self._record_refresh(REFRESH_MODE_SHARED, started, snapshot, changed=len(snapshot.offers), deleted=0)
+        logger.info(
+            f"Attached shared catalog segment generation {snapshot.generation}: "
+            f"{len(snapshot.offers)} offers in {time.monotonic() - started:.3f}s"
+        )
+        return True
+
+    def _share(self, snapshot: CatalogSnapshot) -> None:
+        """Записать снимок в общий сегмент (только писатель)"""
+        if not self.shared_dir or not self.is_leader:
+            return
+        try:
+            path = write_segment(self.shared_dir, snapshot)
+            logger.info(f"Shared catalog segment generation {snapshot.generation} written to {path}")
+        except Exception as e:
+            logger.warning(f"Failed to write shared catalog segment to {self.shared_dir}: {e}")
+
+    def _share_verified(self, snapshot: CatalogSnapshot) -> None:
+        """Отметить в общем сегменте, что текущее поколение сверено с источником (только писатель)"""
+        if not self.shared_dir or not self.is_leader or self._verified_at is None:
+            return
+        try:
+            mark_verified(self.shared_dir, snapshot.generation, self._verified_at)
+        except Exception as e:
+            logger.warning(f"Failed to mark shared catalog segment as verified in {self.shared_dir}: {e}")
+
+    @staticmethod
+    def _shared_verified_at(current: Dict[str, Any]) -> Optional[datetime]:
+        """Время последней сверки писателя с источником из CURRENT (None — не записано)"""
+        try:
+            return datetime.fromisoformat(current["verified_at"]) if current.get("verified_at") else None
+        except (TypeError, ValueError):
+            return None
+
+    def _persist(self, snapshot: CatalogSnapshot, force: bool = True) -> None:
+        """
+        Сохранить снимок в файл; ошибка записи не мешает обслуживать запросы
+
+        Без force файл перезаписывается не чаще CACHE_SNAPSHOT_PERSIST_INTERVAL:
+        отставший файл безопасен — после тёплого старта delta-обновление
+        догрузит изменения от его водяного знака.
+        """
+        if not self.snapshot_path:
+            return
+        now = time.monotonic()
+        if (
+                not force and self._last_persist_time is not None
+                and now - self._last_persist_time < config.CACHE_SNAPSHOT_PERSIST_INTERVAL
+        ):
+            return
+        try:
+            size = write_snapshot_file(self.snapshot_path, snapshot)
+            self._last_persist_time = now
+            self._persisted_generation = snapshot.generation
+            logger.info(f"Snapshot generation {snapshot.generation} saved to {self.snapshot_path} ({size} bytes)")
+        except Exception as e:
+            logger.warning(f"Failed to save snapshot to {self.snapshot_path}: {e}")
+
+    @staticmethod
+    def _hot_columns() -> Optional[List[str]]:
+        """
+        Колонки, загружаемые в снимок (None — все)
+
+        К CACHE_HOT_COLUMNS всегда добавляются offer_id и служебные колонки
+        водяного знака и признака удаления.
+        """
+        columns = config.cache_hot_columns_list
+        if not columns:
+            return None
+        required = ["offer_id", config.CACHE_DELTA_COLUMN, config.CACHE_TOMBSTONE_COLUMN]
+        return [column for column in dict.fromkeys([*required, *columns]) if column]
+
+    @property
+    def has_cold_tier(self) -> bool:
+        """Часть полей офферов не хранится в снимке и догружается из источника"""
+        return bool(config.cache_hot_columns_list and config.cache_cold_columns_list)
+
+    def hydrate_offers(self, offers: Iterable[Mapping[str, Any]]) -> List[Mapping[str, Any]]:
+        """
+        Дополнить офферы ответа холодными полями (CACHE_COLD_COLUMNS)
+
+        Без CACHE_HOT_COLUMNS снимок содержит все поля и офферы
+        возвращаются как есть. Недоступность источника не ломает ответ:
+        офферы отдаются без холодных полей.
+
+        Args:
+            offers: Офферы из снимка
+
+        Returns:
+            Список офферов (dict для дополненных)
+        """
+        offers = list(offers)
+        if not offers or not self.has_cold_tier:
+            return offers
+        cold_columns = config.cache_cold_columns_list
+
+        try:
+            details = self.details.get_many((offer.get("offer_id") for offer in offers), cold_columns)
+        except Exception as e:
+            logger.warning(f"Failed to load offer details: {e}")
+            return offers
+
+        hydrated: List[Mapping[str, Any]] = []
+        for offer in offers:
+            extra = details.get(normalize_offer_id(offer.get("offer_id")))
+            hydrated.append({**offer, **extra} if extra else offer)
+        return hydrated
+
+    @staticmethod
+    def _is_tombstone(offer: Dict[str, Any]) -> bool:
+        """Оффер помечен удалённым"""
+        column = config.CACHE_TOMBSTONE_COLUMN
+        return bool(column and offer.get(column))
+
+    def _merge_changes(
+            self,
+            store: OfferStore,
+            changed: List[Dict[str, Any]],
+            deleted_ids: Iterable[Any] = ()
+    ) -> Tuple[Dict[int, Mapping[str, Any]], List[Mapping[str, Any]], Set[int], int, int]:
+        """
+        Разложить изменённые строки по строкам хранилища текущего снимка
+
+        Args:
+            store: Хранилище текущего снимка
+            changed: Изменённые и новые строки (строки-признаки удаления удаляют оффер)
+            deleted_ids: ID удалённых офферов
+
+        Returns:
+            (номер строки → новое содержимое, новые офферы, номера удалённых строк,
+            кол-во изменённых, кол-во удалённых)
+        """
+        deleted = {normalize_offer_id(offer_id) for offer_id in deleted_ids}
+        deleted_rows: Set[int] = set()
+        for offer_id in deleted:
+            row = store.find_row(offer_id)
+            if row is not None:
+                deleted_rows.add(row)
+
+        replaced: Dict[int, Mapping[str, Any]] = {}
+        added: Dict[Any, Mapping[str, Any]] = {}
+        for offer in changed:
+            offer_id = normalize_offer_id(offer.get("offer_id"))
+            if offer_id in deleted:
+                continue
+            row = store.find_row(offer_id)
+            if row is None:
+                # Последняя версия нового оффера выигрывает, признак удаления его отменяет
+                added.pop(offer_id, None)
+                if not self._is_tombstone(offer):
+                    added[offer_id] = offer
+            elif self._is_tombstone(offer):
+                replaced.pop(row, None)
+                deleted_rows.add(row)
+            elif offer == store.row(row):
+                # Строка попала на границу водяного знака, но не менялась
+                replaced.pop(row, None)
+            else:
+                replaced[row] = offer
+
+        return replaced, list(added.values()), deleted_rows, len(replaced) + len(added), len(deleted_rows)
+
+    @staticmethod
+    def _advance_watermark(
+            watermark: Optional[Tuple[str, Any]],
+            offers: Iterable[Dict[str, Any]]
+    ) -> Optional[Tuple[str, Any]]:
+        """
+        Сдвинуть водяной знак по загруженным строкам
+
+        Используется CACHE_DELTA_COLUMN, а если её нет в данных — offer_id.
+        """
+        offers = list(offers)
+        for column in (config.CACHE_DELTA_COLUMN, "offer_id"):
+            if watermark is not None and watermark[0] != column:
+                continue
+            values = [offer[column] for offer in offers if offer.get(column) is not None]
+            if watermark is not None:
+                values.append(watermark[1])
+            if values:
+                return column, max(values)
+        return watermark
+
+    def _publish(
+            self,
+            all_offers: Iterable[Mapping[str, Any]],
+            watermark: Optional[Tuple[str, Any]] = None
+    ) -> CatalogSnapshot:
+        """Построить снимок целиком и атомарно подменить текущий (вызывается под self._load_lock)"""
+        snapshot = CatalogSnapshot.build(
+            all_offers,
+            generation=self._snapshot.generation + 1,
+            watermark=watermark
+        )
+        return self._swap(snapshot, incremental=False)
+
+    def _publish_changes(
+            self,
+            current: CatalogSnapshot,
+            replaced: Mapping[int, Mapping[str, Any]],
+            added: Sequence[Mapping[str, Any]],
+            deleted: AbstractSet[int],
+            watermark: Optional[Tuple[str, Any]],
+            background: bool = False
+    ) -> CatalogSnapshot:
+        """
+        Собрать снимок из текущего с заменой изменившихся строк и подменить (вызывается под self._load_lock)
+
+        Args:
+            background: Точный замер памяти, файл снимка и общий сегмент — в фоновом
+                потоке (приём изменений: запрос не ждёт обхода структур и записи на диск)
+        """
+        snapshot = CatalogSnapshot.patch(
+            current, replaced, added, deleted,
+            generation=self._snapshot.generation + 1,
+            watermark=watermark
+        )
+        return self._swap(snapshot, incremental=True, background=background)
+
+    def _swap(self, snapshot: CatalogSnapshot, incremental: bool, background: bool = False) -> CatalogSnapshot:
+        """
+        Проверить бюджет памяти, подменить снимок, сохранить его и записать в общий сегмент
+
+        После небольших изменений (incremental) память оценивается по последнему
+        замеру, а файл снимка перезаписывается не чаще CACHE_SNAPSHOT_PERSIST_INTERVAL.
+        """
+        # Снимок сверх бюджета памяти не публикуется: продолжаем обслуживать текущий
+        self._check_memory(snapshot, estimate=incremental)
+        self._snapshot = snapshot
+        if background:
+            self._schedule_write(snapshot)
+        else:
+            self._finish_publish(snapshot, force=not incremental)
+        return snapshot
+
+    def _finish_publish(self, snapshot: CatalogSnapshot, force: bool) -> None:
+        """Точный замер памяти (если пора), файл снимка и общий сегмент для опубликованного снимка"""
+        self._measure_if_due(snapshot)
+        self._write_snapshot(snapshot, force=force)
+
+    def _schedule_write(self, snapshot: CatalogSnapshot) -> None:
+        """Отдать снимок фоновому потоку записи (ждущий запись снимок заменяется более новым)"""
+        with self._pending_lock:
+            self._pending_write = snapshot
+            if self._writer is None:
+                self._writer = Thread(target=self._write_pending, name="cache-snapshot-writer", daemon=True)
+                self._writer.start()
+
+    def _write_pending(self) -> None:
+        """Цикл фонового потока записи: пишет последний отданный снимок, пока они есть"""
+        while True:
+            with self._pending_lock:
+                snapshot = self._pending_write
+                self._pending_write = None
+                if snapshot is None:
+                    self._writer = None
+                    return
+            self._finish_publish(snapshot, force=False)
+
+    def _write_snapshot(self, snapshot: CatalogSnapshot, force: bool) -> None:
+        """Сохранить снимок в файл и записать общий сегмент, если не записан более новый"""
+        with self._write_lock:
+            if snapshot.generation < self._written_generation:
+                return
+            self._persist(snapshot, force=force)
+            self._share(snapshot)
+            self._written_generation = snapshot.generation
+
+    def flush_writes(self, timeout: Optional[float] = None) -> None:
+        """
+        Дождаться фоновой записи и сохранить в файл последний снимок (при остановке процесса)
+
+        Args:
+            timeout: Сколько ждать фоновый поток, секунды (None — без ограничения)
+        """
+        with self._pending_lock:
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
+        snapshot = self._snapshot
+        if snapshot.is_loaded and snapshot.generation != self._persisted_generation:
+            with self._write_lock:
+                self._persist(snapshot)
+
+    def _measure_if_due(self, snapshot: CatalogSnapshot) -> None:
+        """Точно замерить память опубликованного снимка, если с прошлого замера прошло CACHE_MEMORY_MEASURE_INTERVAL"""
+        if time.monotonic() - self._last_measured_time < config.CACHE_MEMORY_MEASURE_INTERVAL:
+            return
+        if snapshot is not self._snapshot:
+            return
+        report = self._memory_report(snapshot, estimate=False)
+        self._remember_memory(report)
+        budget_mb = config.CACHE_MEMORY_BUDGET_MB
+        if budget_mb is not None and report["total_bytes"] > budget_mb * 1024 * 1024:
+            logger.warning(
+                f"Snapshot generation {snapshot.generation} grew over the memory budget "
+                f"({report['total_bytes']} bytes); the next full load will be rejected"
+            )
+
+    def _memory_report(self, snapshot: CatalogSnapshot, estimate: bool) -> Dict[str, Any]:
+        """Отчёт о памяти снимка: точный замер или оценка по байтам на оффер последнего замера"""
+        started = time.monotonic()
+        measured = self._last_measured
+        if estimate and measured is not None:
+            structures = dict(measured["structures"])
+            total_bytes = measured["bytes_per_offer"] * len(snapshot.offers)
+        else:
+            structures = measure_structures(snapshot.memory_structures())
+            total_bytes = sum(structures.values())
+            estimate = False
+        return {
+            "generation": snapshot.generation,
+            "offers_count": len(snapshot.offers),
+            "total_bytes": total_bytes,
+            "bytes_per_offer": round(total_bytes / len(snapshot.offers)) if len(snapshot.offers) else 0,
+            "structures": structures,
+            "estimated": estimate,
+            "measured_at": datetime.now().isoformat(),
+            "measure_seconds": round(time.monotonic() - started, 3),
+        }
+
+    def _remember_memory(self, report: Dict[str, Any]) -> None:
+        """Записать отчёт о памяти в историю"""
+        self._memory_history.append(report)
+        if not report["estimated"]:
+            self._last_measured = report
+            self._last_measured_time = time.monotonic()
+
+    def _check_memory(self, snapshot: CatalogSnapshot, estimate: bool = False) -> Dict[str, Any]:
+        """
+        Измерить память снимка, записать в историю и проверить бюджет
+
+        Args:
+            snapshot: Снимок
+            estimate: Оценить размер по байтам на оффер последнего точного замера
+                вместо обхода всех структур (точный замер делает фоновый поток
+                записи не чаще CACHE_MEMORY_MEASURE_INTERVAL)
+
+        Raises:
+            MemoryBudgetExceeded: снимок больше CACHE_MEMORY_BUDGET_MB
+        """
+        report = self._memory_report(snapshot, estimate)
+        total_bytes = report["total_bytes"]
+
+        budget_mb = config.CACHE_MEMORY_BUDGET_MB
+        if budget_mb is not None and total_bytes > budget_mb * 1024 * 1024:
+            self._memory_rejections += 1
+            self._last_memory_rejection = {**report, "rejected_at": report["measured_at"]}
+            raise MemoryBudgetExceeded(total_bytes, int(budget_mb * 1024 * 1024))
+
+        self._remember_memory(report)
+        logger.info(
+            f"Snapshot generation {snapshot.generation} uses {total_bytes / 1024 / 1024:.1f} MB "
+            f"({report['bytes_per_offer']} bytes/offer)"
+        )
+        return report
+
+    def get_memory_info(self) -> Dict[str, Any]:
+        """
+        Память, занимаемая кэшем: текущий снимок по структурам и история по поколениям
+        
+        Returns:
+            Словарь с размерами в байтах
+        """
+        history = list(self._memory_history)
+        current = history[-1] if history else None
+        budget_mb = config.CACHE_MEMORY_BUDGET_MB
+        return {
+            "total_bytes": current["total_bytes"] if current else 0,
+            "bytes_per_offer": current["bytes_per_offer"] if current else 0,
+            "structures": dict(current["structures"]) if current else {},
+            "budget_bytes": int(budget_mb * 1024 * 1024) if budget_mb is not None else None,
+            "rejected_snapshots": self._memory_rejections,
+            "last_rejected": self._last_memory_rejection,
+            "history": [
+                {key: value for key, value in report.items() if key != "structures"}
+                for report in history
+            ],
+        }
+
+    def _record_refresh(
+            self,
+            mode: str,
+            started: float,
+            snapshot: CatalogSnapshot,
+            changed: int,
+            deleted: int
+    ) -> None:
+        """Запомнить сведения о последнем обновлении для /api/cache/info"""
+        self._last_refresh = {
+            "mode": mode,
+            "generation": snapshot.generation,
+            "changed": changed,
+            "deleted": deleted,
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "finished_at": datetime.now().isoformat(),
+        }
+
+    def publish_offers(self, all_offers: Iterable[Dict[str, Any]]) -> CatalogSnapshot:
+        """
+        Опубликовать загруженные офферы в кэш вместе с производными структурами
+
+        Новый снимок (индекс offer_id, группировка по продавцам и категориям,
+        нормализованные названия) строится целиком, после чего подменяет
+        текущий одной операцией присваивания.
+
+        Args:
+            all_offers: Офферы из БД
+
+        Returns:
+            Опубликованный снимок
+        """
+        with self._load_lock:
+            snapshot = self._publish(all_offers)
+            self._verified_at = snapshot.loaded_at
+            return snapshot
+
+    def get_snapshot(self) -> CatalogSnapshot:
+        """
+        Получить текущий снимок каталога (без копирования)
+        
+        Если кэш ещё не загружен, загружает его. Параллельные запросы
+        на холодном старте ждут одну общую загрузку.
+        
+        Returns:
+            Неизменяемый CatalogSnapshot
+        """
+        snapshot = self._snapshot
+        if snapshot.is_loaded:
+            return snapshot
+        
+        attempts_seen = self._load_attempts
+        with self._load_lock:
+            # Пока ждали блокировку, другой поток уже выполнил загрузку
+            if not self._snapshot.is_loaded and self._load_attempts == attempts_seen:
+                logger.warning("Cache not loaded, attempting to load...")
+                self._load_attempts += 1
+                self._load_all_data_locked()
+            return self._snapshot
     
-    def get_all_offers(self) -> List[Dict[str, Any]]:
+    def get_all_offers(self) -> Sequence[Mapping[str, Any]]:
         """
         Получить все офферы из кэша
         
         Returns:
-            Список всех офферов
+            Неизменяемая последовательность всех офферов (строки OfferRow)
         """
-        with self._lock:
-            if not self._is_loaded:
-                logger.warning("Cache not loaded, attempting to load...")
-                self.load_all_data()
-            return self._all_offers.copy()
+        return self.get_snapshot().offers
+    
+    def get_offer(self, offer_id: Any) -> Optional[Mapping[str, Any]]:
+        """
+        Получить оффер по ID за O(1)
+        
+        Args:
+            offer_id: ID оффера (int или числовая строка)
+            
+        Returns:
+            Оффер или None
+        """
+        return self.get_snapshot().get_offer(offer_id)
     
-    def get_offers_by_seller(self, seller_name: str) -> List[Dict[str, Any]]:
+    def get_offers_by_ids(self, offer_ids: Iterable[Any]) -> Dict[Any, Mapping[str, Any]]:
+        """
+        Получить несколько офферов по ID за один вызов
+        
+        Args:
+            offer_ids: ID офферов (int или числовые строки)
+            
+        Returns:
+            Словарь {offer_id: оффер} в порядке запроса, только найденные офферы
+        """
+        return self.get_snapshot().get_offers_by_ids(offer_ids)
+    
+    def get_offers_by_seller(self, seller_name: str) -> Sequence[Mapping[str, Any]]:
         """
         Получить офферы конкретного продавца из кэша
         
@@ -136,24 +886,16 @@ class CacheManager:
         Returns:
             Список офферов продавца
         """
-        with self._lock:
-            if not self._is_loaded:
-                logger.warning("Cache not loaded, attempting to load...")
-                self.load_all_data()
-            return self._offers_by_seller.get(seller_name, []).copy()
+        return self.get_snapshot().get_offers_by_seller(seller_name)
     
-    def get_unique_sellers(self) -> List[str]:
+    def get_unique_sellers(self) -> Sequence[str]:
         """
         Получить список уникальных продавцов из кэша
         
         Returns:
             Список уникальных продавцов
         """
-        with self._lock:
-            if not self._is_loaded:
-                logger.warning("Cache not loaded, attempting to load...")
-                self.load_all_data()
-            return self._unique_sellers.copy()
+        return self.get_snapshot().unique_sellers
     
     def get_seller_info(self, seller_name: str) -> Optional[Dict[str, Any]]:
         """
@@ -165,35 +907,122 @@ class CacheManager:
         Returns:
             Информация о продавце или None
         """
-        with self._lock:
-            if not self._is_loaded:
-                logger.warning("Cache not loaded, attempting to load...")
-                self.load_all_data()
-            return self._seller_info.get(seller_name)
+        return self.get_snapshot().seller_info.get(seller_name)
+    
+    def get_catalog_index(self) -> CatalogIndex:
+        """
+        Получить предрассчитанный индекс каталога (продавцы → офферы → категории)
+        
+        Returns:
+            Неизменяемый CatalogIndex текущей версии кэша
+        """
+        return self.get_snapshot().catalog_index
     
     def health_check(self) -> bool:
         """
-        Проверка подключения к базе данных (минимальный запрос)
+        Проверка доступности источника каталога (минимальный запрос)
         
         Returns:
-            True если подключение работает
+            True если источник отвечает
         """
         try:
-            self.db_client.table("analog_offers").select("offer_id").limit(1).execute()
+            self.data_source.ping()
             return True
         except Exception as e:
             logger.error(f"Database health check failed: {e}")
             return False
     
-    def refresh_cache(self) -> bool:
+    def refresh_cache(self, mode: str = REFRESH_MODE_AUTO) -> bool:
         """
-        Обновить кэш (перезагрузить данные из БД)
+        Обновить кэш
+        
+        Args:
+            mode: "full" — перезагрузить всё, "delta" — только изменения,
+                "auto" — delta, но каждые CACHE_FULL_REFRESH_EVERY раз полная сверка
+        
+        При роли auto обновление вызывается с периодом опроса сегмента:
+        лидер ходит в источник в режиме auto не чаще CACHE_REFRESH_INTERVAL,
+        остальные процессы подхватывают опубликованное им поколение.
         
         Returns:
             True если обновление успешно
         """
-        logger.info("Refreshing cache...")
-        return self.load_all_data()
+        if mode not in REFRESH_MODES:
+            raise ValueError(f"Unknown refresh mode: {mode}")
+        
+        try:
+            if self.lease is not None:
+                with self._load_lock:
+                    self._elect()
+            
+            if self.is_shared_reader:
+                # Читатель не ходит в источник: только подхватывает новое поколение сегмента
+                return self.attach_shared()
+            
+            if mode == REFRESH_MODE_AUTO and self.lease is not None and self._last_source_refresh is not None:
+                if time.monotonic() - self._last_source_refresh < config.CACHE_REFRESH_INTERVAL:
+                    return True
+            
+            if mode == REFRESH_MODE_AUTO:
+                needs_full = self._deltas_since_full >= config.CACHE_FULL_REFRESH_EVERY
+                mode = REFRESH_MODE_FULL if needs_full else REFRESH_MODE_DELTA
+            
+            logger.info(f"Refreshing cache ({mode})...")
+            success = self.load_delta() if mode == REFRESH_MODE_DELTA else self.load_all_data()
+            if success:
+                self._last_source_refresh = time.monotonic()
+            return success
+        finally:
+            self._report_status()
+    
+    def _report_status(self) -> None:
+        """Записать состояние процесса в общий каталог (для /api/cache/info)"""
+        if not self.shared_dir:
+            return
+        try:
+            write_worker_status(self.shared_dir, {
+                "role": self._effective_role(),
+                "generation": self._snapshot.generation,
+                "last_update": self._snapshot.loaded_at.isoformat() if self._snapshot.loaded_at else None,
+            })
+        except OSError as e:
+            logger.warning(f"Failed to write worker status to {self.shared_dir}: {e}")
+    
+    def _effective_role(self) -> str:
+        """Текущая роль процесса: writer или reader"""
+        return SHARED_ROLE_WRITER if self.is_leader else SHARED_ROLE_READER
+    
+    def get_shared_info(self) -> Optional[Dict[str, Any]]:
+        """
+        Состояние общего каталога: лидер и поколения, которые обслуживают процессы
+
+        Returns:
+            None если общий сегмент не используется
+        """
+        if not self.shared_dir:
+            return None
+        if self.lease is not None:
+            leader = self.lease.holder()
+        else:
+            writers = [
+                status for status in self._worker_statuses()
+                if status.get("role") == SHARED_ROLE_WRITER
+            ]
+            leader = {"worker_id": writers[0]["worker_id"]} if writers else None
+        return {
+            "dir": self.shared_dir,
+            "role": self.shared_role,
+            "effective_role": self._effective_role(),
+            "is_leader": self.is_leader,
+            "leader": leader,
+            "worker_id": worker_id(),
+            "workers": self._worker_statuses(),
+        }
+    
+    def _worker_statuses(self) -> List[Dict[str, Any]]:
+        """Недавно отчитавшиеся процессы (не обновлявшиеся три периода считаются остановленными)"""
+        max_age = 3 * max(config.CACHE_SHARED_POLL_INTERVAL, config.CACHE_REFRESH_INTERVAL)
+        return read_worker_statuses(self.shared_dir, max_age)
     
     def get_cache_info(self) -> Dict[str, Any]:
         """
@@ -202,15 +1031,33 @@ class CacheManager:
         Returns:
             Словарь с информацией о кэше
         """
-        with self._lock:
-            return {
-                "is_loaded": self._is_loaded,
-                "last_update": self._last_update.isoformat() if self._last_update else None,
-                "offers_count": len(self._all_offers),
-                "sellers_count": len(self._unique_sellers),
-                "cache_age_seconds": (
-                    (datetime.now() - self._last_update).total_seconds()
-                    if self._last_update else None
-                )
-            }
-
+        snapshot = self._snapshot
+        verified_at = self._verified_at or snapshot.loaded_at
+        cache_age = (
+            (datetime.now() - verified_at).total_seconds()
+            if verified_at else None
+        )
+        return {
+            "is_loaded": snapshot.is_loaded,
+            "data_source": self.data_source.name,
+            "shared": self.get_shared_info(),
+            "generation": snapshot.generation,
+            "last_update": snapshot.loaded_at.isoformat() if snapshot.loaded_at else None,
+            "verified_at": verified_at.isoformat() if verified_at else None,
+            "offers_count": len(snapshot.offers),
+            "sellers_count": len(snapshot.unique_sellers),
+            "cache_age_seconds": cache_age,
+            "is_stale": cache_age is not None and cache_age > config.CACHE_MAX_STALENESS,
+            "watermark": (
+                {"column": snapshot.watermark[0], "value": snapshot.watermark[1]}
+                if snapshot.watermark else None
+            ),
+            "last_refresh": dict(self._last_refresh) or None,
+            "memory": self.get_memory_info(),
+            "details": self.details.get_stats(),
+            "normalizer": {
+                "fingerprint": get_normalizer().fingerprint,
+                "snapshot_fingerprint": snapshot.offers.normalizer_fingerprint,
+                **get_title_cache().get_stats(),
+            },
+        }
@@ -0,0 +1,303 @@
+"""
+Индекс каталога: продавцы → офферы → иерархия категорий
+
+Строится один раз на каждую загрузку кэша и дальше только читается сервисами.
+"""
+from array import array
+from datetime import datetime
+from heapq import merge
+from types import MappingProxyType
+from typing import List, Dict, AbstractSet, Any, Iterable, Mapping, Optional, Set, Tuple
+from app.cache.offer_store import Bucket, OfferStore, patch_postings, tag_values
+from app.cache.token_index import TokenIndex
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_category_hierarchy(category_num: str) -> List[str]:
+    """
+    Получить все уровни иерархии: "1.2.3" -> ["1", "1.2", "1.2.3"]
+    """
+    if not category_num:
+        return []
+    parts = category_num.split(".")
+    return [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def rows_with_any_tag(tag_rows: Mapping[str, array], tags: Iterable[str]) -> array:
+    """
+    Отсортированные номера строк офферов, у которых есть хотя бы один из тегов
+
+    Args:
+        tag_rows: Тег → номера строк продавца (seller["tags"])
+        tags: Теги исходного оффера
+    """
+    postings = [tag_rows[tag] for tag in dict.fromkeys(tags) if tag in tag_rows]
+    if len(postings) == 1:
+        return postings[0]
+    rows = array("I")
+    for row in merge(*postings):
+        if not rows or rows[-1] != row:
+            rows.append(row)
+    return rows
+
+
+class CatalogIndex:
+    """
+    Неизменяемый версионированный индекс каталога
+
+    Структура sellers (только для чтения):
+        {
+            seller_name: {
+                "name": seller_name,
+                "offers": Bucket {offer_id: item},
+                "categories": {category_level: Bucket {offer_id: item}},
+                "tags": {tag: array номеров строк по возрастанию},
+                "search": TokenIndex (слова и триграммы названий → строки),
+            }
+        }
+
+    item (CatalogItem) содержит предрассчитанные поля: name, price, clean_name,
+    normalized_name, category, category_code и исходный offer_data.
+    """
+
+    __slots__ = ("version", "sellers", "offers_count", "built_at")
+
+    def __init__(self, version: int, sellers: Mapping[str, Mapping[str, Any]], offers_count: int):
+        self.version = version
+        self.sellers = sellers
+        self.offers_count = offers_count
+        self.built_at = datetime.now()
+
+    def get_seller(self, seller_name: str) -> Optional[Mapping[str, Any]]:
+        """Получить данные продавца или None"""
+        return self.sellers.get(seller_name)
+
+    def __len__(self) -> int:
+        return len(self.sellers)
+
+
+def _category_levels(category_num: Any, hierarchies: Dict[str, List[str]]) -> List[str]:
+    """Уровни иерархии категории строки (пусто для None и "None")"""
+    if not category_num or category_num == "None":
+        return []
+    levels = hierarchies.get(category_num)
+    if levels is None:
+        levels = hierarchies[category_num] = get_category_hierarchy(category_num)
+    return levels
+
+
+def _build_seller(
+        store: OfferStore,
+        seller_name: str,
+        rows: array,
+        hierarchies: Dict[str, List[str]]
+) -> Mapping[str, Any]:
+    """Группы категорий, теги и индекс слов одного продавца по его строкам (по возрастанию)"""
+    categories_rows: Dict[str, array] = {}
+    tags_rows: Dict[str, array] = {}
+
+    for row in rows:
+        for tag in tag_values(store.value(row, "tags")):
+            tag_rows = tags_rows.get(tag)
+            if tag_rows is None:
+                tag_rows = tags_rows[tag] = array("I")
+            tag_rows.append(row)
+
+        # Добавляем в категории по иерархии (пропускаем None и "None")
+        for level in _category_levels(store.value(row, "category_code", ""), hierarchies):
+            level_rows = categories_rows.get(level)
+            if level_rows is None:
+                level_rows = categories_rows[level] = array("I")
+            level_rows.append(row)
+
+    return MappingProxyType({
+        "name": seller_name,
+        "offers": Bucket(store, rows),
+        "categories": MappingProxyType({
+            level: Bucket(store, level_rows)
+            for level, level_rows in categories_rows.items()
+        }),
+        "tags": MappingProxyType(tags_rows),
+        "search": TokenIndex.build(store, rows),
+    })
+
+
+def _rebind_seller(store: OfferStore, seller: Mapping[str, Any]) -> Mapping[str, Any]:
+    """Данные неизменившегося продавца поверх нового хранилища (строки, теги и индекс слов — те же)"""
+    return MappingProxyType({
+        **seller,
+        "offers": Bucket(store, seller["offers"].rows),
+        "categories": MappingProxyType({
+            level: Bucket(store, bucket.rows)
+            for level, bucket in seller["categories"].items()
+        }),
+    })
+
+
+def build_catalog_index(store: OfferStore, version: int) -> CatalogIndex:
+    """
+    Группировать предложения по продавцам и категориям
+
+    Каждый оффер добавляется во все уровни своей иерархии категорий.
+    Пример: оффер с category_num="1.2.3" будет в categories["1"], ["1.2"], ["1.2.3"]
+
+    Группы хранят только номера строк хранилища, элементы (CatalogItem)
+    создаются при чтении. Теги продавца — отсортированные номера строк,
+    поэтому фильтр по тегам — пересечение с группой без копирования офферов.
+    Индекс слов названий (TokenIndex) отбирает кандидатов для fuzzy-поиска.
+
+    Args:
+        store: Колоночное хранилище офферов снимка
+        version: Версия индекса (растёт с каждой загрузкой кэша)
+
+    Returns:
+        CatalogIndex
+    """
+    sellers_rows: Dict[str, array] = {}
+    offers_count = 0
+
+    for row in range(len(store)):
+        seller_name = store.value(row, "seller_name")
+        if not seller_name:
+            continue
+
+        seller_rows = sellers_rows.get(seller_name)
+        if seller_rows is None:
+            seller_rows = sellers_rows[seller_name] = array("I")
+        seller_rows.append(row)
+        offers_count += 1
+
+    hierarchies: Dict[str, List[str]] = {}
+    frozen_sellers = {
+        seller_name: _build_seller(store, seller_name, rows, hierarchies)
+        for seller_name, rows in sellers_rows.items()
+    }
+
+    for seller_name, data in frozen_sellers.items():
+        categories = list(data["categories"].keys())[:10]
+        logger.debug(f"  {seller_name}: {len(data['offers'])} offers, categories: {categories}")
+
+    logger.info(f"Catalog index v{version} built: {offers_count} offers, {len(frozen_sellers)} sellers")
+    return CatalogIndex(version, MappingProxyType(frozen_sellers), offers_count)
+
+
+def _row_key(store: OfferStore, row: int) -> Optional[Tuple[Any, ...]]:
+    """Поля строки, от которых зависят группы продавца (None — строки нет или у неё нет продавца)"""
+    if row >= len(store):
+        return None
+    seller_name = store.value(row, "seller_name")
+    if not seller_name:
+        return None
+    return (
+        seller_name,
+        store.value(row, "category_code", ""),
+        tuple(tag_values(store.value(row, "tags"))),
+        store.clean_names[row],
+        store.normalized_names[row],
+    )
+
+
+def _patch_seller(
+        seller: Mapping[str, Any],
+        previous_store: OfferStore,
+        store: OfferStore,
+        removed_rows: AbstractSet[int],
+        added_rows: AbstractSet[int],
+        hierarchies: Dict[str, List[str]]
+) -> Optional[Mapping[str, Any]]:
+    """
+    Данные продавца после замены его строк: копируются только затронутые
+    группы категорий, списки тегов и posting lists индекса слов
+
+    Returns:
+        None если у продавца не осталось офферов
+    """
+    removed: Tuple[Dict[str, Set[int]], Dict[str, Set[int]]] = ({}, {})
+    added: Tuple[Dict[str, Set[int]], Dict[str, Set[int]]] = ({}, {})
+    for (categories, tags), source, rows in ((removed, previous_store, removed_rows), (added, store, added_rows)):
+        for row in rows:
+            for level in _category_levels(source.value(row, "category_code", ""), hierarchies):
+                categories.setdefault(level, set()).add(row)
+            for tag in tag_values(source.value(row, "tags")):
+                tags.setdefault(tag, set()).add(row)
+
+    offers = patch_postings({"": seller["offers"].rows}, {"": removed_rows}, {"": added_rows}).get("")
+    if offers is None:
+        return None
+    category_rows = patch_postings(
+        {level: bucket.rows for level, bucket in seller["categories"].items()}, removed[0], added[0]
+    )
+    return MappingProxyType({
+        "name": seller["name"],
+        "offers": Bucket(store, offers),
+        "categories": MappingProxyType({level: Bucket(store, rows) for level, rows in category_rows.items()}),
+        "tags": MappingProxyType(patch_postings(seller["tags"], removed[1], added[1])),
+        "search": TokenIndex.patch(seller["search"], previous_store, store, removed_rows, added_rows),
+    })
+
+
+def patch_catalog_index(
+        previous: CatalogIndex,
+        previous_store: OfferStore,
+        store: OfferStore,
+        touched_rows: AbstractSet[int],
+        version: int
+) -> CatalogIndex:
+    """
+    Индекс каталога после замены отдельных строк хранилища (OfferStore.patch)
+
+    Строка затрагивает продавца, только если у неё изменились продавец,
+    категория, теги или название, — изменение цены или остальных полей
+    видно через хранилище без правки групп. У затронутых продавцов
+    копируются только изменившиеся posting lists групп, тегов и индекса
+    слов; остальные продавцы переносятся как есть (их строки в новом
+    хранилище не менялись), группы лишь привязываются к новому хранилищу.
+
+    Args:
+        previous: Индекс предыдущего снимка
+        previous_store: Хранилище предыдущего снимка
+        store: Новое хранилище
+        touched_rows: Номера строк, содержимое которых изменилось или которые удалены
+        version: Версия нового индекса
+
+    Returns:
+        CatalogIndex
+    """
+    removed_rows: Dict[str, Set[int]] = {}
+    added_rows: Dict[str, Set[int]] = {}
+    for row in touched_rows:
+        old_key = _row_key(previous_store, row)
+        new_key = _row_key(store, row)
+        if old_key == new_key:
+            continue
+        if old_key is not None:
+            removed_rows.setdefault(old_key[0], set()).add(row)
+        if new_key is not None:
+            added_rows.setdefault(new_key[0], set()).add(row)
+    affected = removed_rows.keys() | added_rows.keys()
+
+    # Порядок продавцов — как при полной сборке: по первой строке, новые — в конце
+    sellers: Dict[str, Mapping[str, Any]] = {}
+    hierarchies: Dict[str, List[str]] = {}
+    for seller_name, seller in previous.sellers.items():
+        if seller_name not in affected:
+            sellers[seller_name] = _rebind_seller(store, seller)
+            continue
+        entry = _patch_seller(
+            seller, previous_store, store,
+            removed_rows.get(seller_name, set()), added_rows.get(seller_name, set()), hierarchies
+        )
+        if entry is not None:
+            sellers[seller_name] = entry
+    for seller_name in sorted(affected.difference(previous.sellers), key=lambda name: min(added_rows[name])):
+        rows = array("I", sorted(added_rows[seller_name]))
+        sellers[seller_name] = _build_seller(store, seller_name, rows, hierarchies)
+
+    offers_count = sum(len(seller["offers"]) for seller in sellers.values())
+    logger.info(
+        f"Catalog index v{version} patched: {offers_count} offers, {len(sellers)} sellers, "
+        f"{len(affected)} updated"
+    )
+    return CatalogIndex(version, MappingProxyType(sellers), offers_count)
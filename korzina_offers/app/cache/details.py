@@ -0,0 +1,115 @@
+"""
+Холодный уровень кэша: подробные поля офферов (описание, картинки)
+
+Снимок каталога держит в памяти только горячие колонки, нужные для
+сопоставления (CACHE_HOT_COLUMNS). Холодные поля (CACHE_COLD_COLUMNS)
+догружаются из источника по ID только для офферов, попавших в ответ,
+и хранятся в LRU ограниченного размера.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Dict, Any, Iterable, Sequence
+from app.cache.offer_store import normalize_offer_id
+from app.cache.sources import CatalogDataSource
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class OfferDetailsCache:
+    """LRU холодных полей офферов {offer_id: {колонка: значение}}"""
+
+    def __init__(self, data_source: CatalogDataSource, max_size: int = 10000):
+        """
+        Args:
+            data_source: Источник, из которого догружаются поля
+            max_size: Сколько офферов держать в LRU
+        """
+        self.data_source = data_source
+        self.max_size = max(0, max_size)
+        self._entries: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._lock = Lock()
+        # Увеличивается при каждой инвалидации: результат загрузки, начатой
+        # до неё, в LRU не попадает
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def get_many(self, offer_ids: Iterable[Any], columns: Sequence[str]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Холодные поля офферов (недостающие догружаются одним запросом)
+
+        Args:
+            offer_ids: ID офферов
+            columns: Холодные колонки
+
+        Returns:
+            {нормализованный offer_id: {колонка: значение}}; для офферов,
+            которых нет в источнике, — пустой dict
+        """
+        found: Dict[Any, Dict[str, Any]] = {}
+        missing: List[Any] = []
+        with self._lock:
+            for offer_id in offer_ids:
+                key = normalize_offer_id(offer_id)
+                if key in found:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(key)
+                    found[key] = {}
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = entry
+            self.hits += len(found) - len(missing)
+            self.misses += len(missing)
+            epoch = self._epoch
+
+        if not missing:
+            return found
+
+        loaded = self.data_source.load_details(missing, columns)
+        rows = {normalize_offer_id(offer_id): details for offer_id, details in loaded.items()}
+
+        with self._lock:
+            self.fetches += 1
+            store = epoch == self._epoch and self.max_size > 0
+            for key in missing:
+                details = rows.get(key) or {}
+                found[key] = details
+                if store:
+                    self._entries[key] = details
+                    self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return found
+
+    def invalidate(self, offer_ids: Iterable[Any]) -> None:
+        """Забыть поля изменившихся офферов"""
+        with self._lock:
+            self._epoch += 1
+            for offer_id in offer_ids:
+                self._entries.pop(normalize_offer_id(offer_id), None)
+
+    def clear(self) -> None:
+        """Забыть всё (после полной перезагрузки каталога)"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика LRU"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "fetches": self.fetches,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,231 @@
+"""
+Выбор лидера для обновления общего каталога
+
+При CACHE_SHARED_ROLE=auto все процессы равноправны: тот, кто держит
+аренду (lease), становится лидером — загружает каталог из источника и
+пишет сегменты, остальные подключаются к сегментам как читатели.
+Если лидер завершился, аренду при следующем опросе забирает другой процесс.
+
+Бэкенд аренды подключаемый (CACHE_LEADER_BACKEND):
+    file — flock на файле в CACHE_SHARED_DIR, для процессов одного хоста
+           (или нескольких хостов с общим томом, поддерживающим flock).
+Для другой координации (Redis, БД) достаточно реализовать LeaderLease
+и зарегистрировать фабрику через register_lease_backend.
+
+Каждый процесс также пишет файл состояния в CACHE_SHARED_DIR/workers,
+чтобы /api/cache/info показывал, какое поколение обслуживает каждый воркер.
+"""
+import fcntl
+import json
+import os
+import socket
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+LEASE_FILE = "leader.lock"
+WORKERS_DIR = "workers"
+
+# Имя бэкенда → фабрика аренды по каталогу сегментов
+_lease_backends: Dict[str, Callable[[str], "LeaderLease"]] = {}
+
+
+def worker_id() -> str:
+    """Идентификатор процесса: хост и pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderLease(ABC):
+    """Аренда лидерства: в каждый момент её держит не больше одного процесса"""
+
+    @abstractmethod
+    def try_acquire(self) -> bool:
+        """
+        Взять или продлить аренду без ожидания
+
+        Returns:
+            True если аренда у этого процесса
+        """
+
+    @abstractmethod
+    def release(self) -> None:
+        """Отдать аренду"""
+
+    @property
+    @abstractmethod
+    def is_held(self) -> bool:
+        """Аренда у этого процесса"""
+
+    @abstractmethod
+    def holder(self) -> Optional[Dict[str, Any]]:
+        """Сведения о текущем лидере (None — неизвестно)"""
+
+
+class FileLease(LeaderLease):
+    """
+    Аренда через flock: освобождается ОС, если процесс-лидер завершился
+
+    flock принадлежит открытому файлу, а не процессу: дочерние процессы
+    prefork-сервера наследуют дескриптор мастера вместе с блокировкой.
+    Поэтому аренда помнит pid владельца: в дочернем процессе она не считается
+    взятой, а унаследованный дескриптор только закрывается (без снятия
+    блокировки и очистки файла — они по-прежнему принадлежат мастеру).
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Файл блокировки (в нём же записан текущий лидер)
+        """
+        self.path = path
+        self._fd: Optional[int] = None
+        # pid процесса, открывшего _fd и взявшего блокировку
+        self._owner_pid: Optional[int] = None
+
+    def _drop_inherited(self) -> None:
+        """Закрыть дескриптор, унаследованный через fork от процесса-владельца"""
+        if self._fd is not None and self._owner_pid != os.getpid():
+            fd, self._fd, self._owner_pid = self._fd, None, None
+            os.close(fd)
+
+    def try_acquire(self) -> bool:
+        self._drop_inherited()
+        if self._fd is not None:
+            return True
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        info = json.dumps({"worker_id": worker_id(), "since": datetime.now().isoformat()}).encode("utf-8")
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, info, 0)
+        self._fd = fd
+        self._owner_pid = os.getpid()
+        return True
+
+    def release(self) -> None:
+        self._drop_inherited()
+        if self._fd is None:
+            return
+        fd, self._fd, self._owner_pid = self._fd, None, None
+        try:
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    @property
+    def is_held(self) -> bool:
+        return self._fd is not None and self._owner_pid == os.getpid()
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                content = f.read()
+            return json.loads(content) if content else None
+        except (OSError, ValueError):
+            return None
+
+    def __repr__(self) -> str:
+        return f"FileLease({self.path!r})"
+
+
+def register_lease_backend(name: str, factory: Callable[[str], LeaderLease]) -> None:
+    """
+    Подключить бэкенд аренды
+
+    Args:
+        name: Значение CACHE_LEADER_BACKEND
+        factory: Фабрика аренды, получает каталог сегментов (CACHE_SHARED_DIR)
+    """
+    _lease_backends[name] = factory
+
+
+def create_lease(backend: str, shared_dir: str) -> LeaderLease:
+    """
+    Создать аренду выбранного бэкенда
+
+    Raises:
+        ValueError: неизвестный бэкенд
+    """
+    factory = _lease_backends.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown leader lease backend: {backend} (available: {', '.join(_lease_backends)})")
+    return factory(shared_dir)
+
+
+register_lease_backend("file", lambda shared_dir: FileLease(os.path.join(shared_dir, LEASE_FILE)))
+
+
+def write_worker_status(shared_dir: str, status: Dict[str, Any]) -> None:
+    """Записать состояние этого процесса (атомарно, через временный файл)"""
+    directory = os.path.join(shared_dir, WORKERS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    name = worker_id().replace(":", "-").replace(os.sep, "_") + ".json"
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".worker-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({
+            "worker_id": worker_id(),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "updated_at": time.time(),
+            **status
+        }, f, default=str)
+    os.replace(tmp_path, os.path.join(directory, name))
+
+
+def _pid_alive(pid: Any) -> bool:
+    """Процесс с таким pid существует на этом хосте"""
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_worker_statuses(shared_dir: str, max_age: float) -> List[Dict[str, Any]]:
+    """
+    Состояния процессов, обновлявшиеся не раньше max_age секунд назад
+
+    Файлы давно не отвечающих и завершившихся процессов этого хоста удаляются.
+    """
+    directory = os.path.join(shared_dir, WORKERS_DIR)
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+    now = time.time()
+    host = socket.gethostname()
+    statuses = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            continue
+        age = now - status.get("updated_at", 0)
+        if age > max_age or (status.get("host") == host and not _pid_alive(status.get("pid"))):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            continue
+        status["age_seconds"] = round(age, 1)
+        statuses.append(status)
+    return statuses
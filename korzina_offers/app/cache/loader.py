@@ -0,0 +1,157 @@
+"""
+Параллельная постраничная загрузка таблицы офферов
+
+Сначала запрашивается количество строк, затем страницы забираются
+параллельно (не больше max_workers запросов одновременно), каждая со своими
+повторами и экспоненциальной задержкой, и собираются в исходном порядке.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# build_query(*columns, **select_kwargs) → запрос PostgREST с фильтрами и сортировкой
+QueryFactory = Callable[..., Any]
+
+
+class PageLoadError(Exception):
+    """Не удалось загрузить часть страниц даже после повторов"""
+
+    def __init__(self, failed_pages: List[int], completed: Dict[int, List[Dict[str, Any]]], total: int):
+        super().__init__(f"Failed to load pages {failed_pages} of {total} rows")
+        self.failed_pages = failed_pages
+        self.completed = completed
+        self.total = total
+
+
+class PagedLoader:
+    """Загрузчик страниц с ограниченным параллелизмом и повторами"""
+
+    def __init__(
+            self,
+            page_size: int = 1000,
+            max_workers: int = 4,
+            max_retries: int = 3,
+            backoff_seconds: float = 0.5
+    ):
+        self.page_size = page_size
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max(0, max_retries)
+        self.backoff_seconds = backoff_seconds
+
+    def count_rows(self, build_query: QueryFactory) -> Optional[int]:
+        """Получить количество строк запроса (None, если БД его не вернула)"""
+        result = self._with_retries(
+            "count",
+            lambda: build_query("offer_id", count="exact").limit(1).execute()
+        )
+        count = getattr(result, "count", None)
+        return count if isinstance(count, int) else None
+
+    def load(
+            self,
+            build_query: QueryFactory,
+            resume: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+            expected_total: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Загрузить все строки запроса
+
+        Args:
+            build_query: Фабрика запроса (фильтры и стабильная сортировка, без .range())
+            resume: Уже загруженные страницы прошлой неудачной попытки {номер: строки}
+            expected_total: Количество строк, при котором были загружены страницы resume
+
+        Returns:
+            Все строки по порядку
+
+        Raises:
+            PageLoadError: часть страниц не загрузилась после всех повторов
+        """
+        total = self.count_rows(build_query)
+        if total is None:
+            logger.warning("Row count is unavailable, loading pages sequentially")
+            return self._load_sequential(build_query)
+
+        pages_count = (total + self.page_size - 1) // self.page_size
+        pages: Dict[int, List[Dict[str, Any]]] = {}
+        if resume and expected_total == total:
+            pages.update({page: rows for page, rows in resume.items() if page < pages_count})
+            logger.info(f"Resuming load: {len(pages)}/{pages_count} pages already loaded")
+
+        pending = [page for page in range(pages_count) if page not in pages]
+        failed: List[int] = []
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                futures = {
+                    page: executor.submit(self._fetch_page_with_retries, build_query, page)
+                    for page in pending
+                }
+                for page, future in futures.items():
+                    try:
+                        pages[page] = future.result()
+                    except Exception as e:
+                        logger.error(f"Page {page} failed after {self.max_retries} retries: {e}")
+                        failed.append(page)
+
+        if failed:
+            raise PageLoadError(failed, pages, total)
+
+        rows: List[Dict[str, Any]] = []
+        for page in range(pages_count):
+            rows.extend(pages[page])
+
+        # Строки, добавленные после подсчёта, догружаем хвостом
+        if pages_count and len(pages[pages_count - 1]) == self.page_size:
+            rows.extend(self._load_sequential(build_query, start=pages_count * self.page_size))
+
+        logger.info(f"Loaded {len(rows)} rows in {pages_count} pages ({self.max_workers} workers)")
+        return rows
+
+    def _fetch_page_with_retries(self, build_query: QueryFactory, page: int) -> List[Dict[str, Any]]:
+        """Загрузить одну страницу с повторами"""
+        return self._with_retries(f"page {page}", lambda: self._fetch_page(build_query, page * self.page_size))
+
+    def _fetch_page(self, build_query: QueryFactory, offset: int) -> List[Dict[str, Any]]:
+        """Загрузить страницу начиная с offset"""
+        result = build_query("*").range(offset, offset + self.page_size - 1).execute()
+        return result.data or []
+
+    def _load_sequential(self, build_query: QueryFactory, start: int = 0) -> List[Dict[str, Any]]:
+        """Загрузить страницы одну за другой, пока не придёт неполная"""
+        rows: List[Dict[str, Any]] = []
+        offset = start
+
+        while True:
+            batch = self._with_retries(f"offset {offset}", lambda: self._fetch_page(build_query, offset))
+            if not batch:
+                break
+
+            rows.extend(batch)
+            logger.info(f"Loaded {len(rows)} offers so far...")
+
+            # Если получили меньше page_size, значит это последняя страница
+            if len(batch) < self.page_size:
+                break
+
+            offset += self.page_size
+
+        return rows
+
+    def _with_retries(self, what: str, call: Callable[[], Any]) -> Any:
+        """Выполнить запрос с повторами и экспоненциальной задержкой"""
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt) + random.uniform(0, self.backoff_seconds)
+                attempt += 1
+                logger.warning(f"Loading {what} failed ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
@@ -0,0 +1,93 @@
+"""
+Учёт памяти, занимаемой снимком каталога
+
+deep_sizeof обходит граф объектов (как gc.get_referents) и суммирует
+sys.getsizeof каждого объекта ровно один раз. Структуры снимка меряются
+по очереди с общим множеством уже посчитанных объектов: общие объекты
+(например, интернированные строки или хранилище, на которое ссылаются
+индексы) относятся к первой структуре, в которой встретились.
+"""
+import gc
+import sys
+from types import BuiltinFunctionType, FunctionType, ModuleType
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+# Объекты, которые не принадлежат данным снимка и не обходятся
+_SKIP_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType)
+# Листовые типы: ссылок на другие объекты нет
+_LEAF_TYPES = (str, bytes, int, float, bool, type(None))
+
+# Дополнительные источники памяти (кэши результатов и т.п.): имя → объект
+_extra_sources: Dict[str, Callable[[], Any]] = {}
+
+
+class MemoryBudgetExceeded(Exception):
+    """Новый снимок не помещается в бюджет памяти CACHE_MEMORY_BUDGET_MB"""
+
+    def __init__(self, total_bytes: int, budget_bytes: int):
+        super().__init__(
+            f"Snapshot needs {total_bytes / 1024 / 1024:.1f} MB, "
+            f"budget is {budget_bytes / 1024 / 1024:.1f} MB"
+        )
+        self.total_bytes = total_bytes
+        self.budget_bytes = budget_bytes
+
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    Размер объекта вместе со всем, на что он ссылается, в байтах
+
+    Args:
+        obj: Корневой объект
+        seen: id уже посчитанных объектов (общий между вызовами,
+            чтобы не считать общие объекты дважды)
+
+    Returns:
+        Размер в байтах
+    """
+    if seen is None:
+        seen = set()
+
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        current_id = id(current)
+        if current_id in seen or isinstance(current, _SKIP_TYPES):
+            continue
+        seen.add(current_id)
+        total += sys.getsizeof(current)
+        if isinstance(current, _LEAF_TYPES):
+            continue
+        stack.extend(gc.get_referents(current))
+    return total
+
+
+def register_memory_source(name: str, source: Callable[[], Any]) -> None:
+    """
+    Подключить к учёту памяти дополнительную структуру (например, кэш результатов)
+
+    Args:
+        name: Имя структуры в отчёте
+        source: Функция, возвращающая объект для измерения
+    """
+    _extra_sources[name] = source
+
+
+def measure_structures(structures: Iterable[Tuple[str, Any]]) -> Dict[str, int]:
+    """
+    Размеры структур в байтах с учётом общих объектов
+
+    Args:
+        structures: Пары (имя, объект) в порядке приоритета учёта
+
+    Returns:
+        {имя: байты}, включая зарегистрированные дополнительные источники
+    """
+    seen: Set[int] = set()
+    sizes: Dict[str, int] = {}
+    for name, obj in structures:
+        sizes[name] = deep_sizeof(obj, seen)
+    for name, source in _extra_sources.items():
+        sizes[name] = deep_sizeof(source(), seen)
+    return sizes
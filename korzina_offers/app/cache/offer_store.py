@@ -0,0 +1,806 @@
+"""
+Колоночное хранилище офферов
+
+Вместо словаря на каждый оффер (и второго словаря с производными полями
+в индексе каталога) офферы хранятся по колонкам:
+    - ID и разобранные цены — в компактных массивах array;
+    - повторяющиеся строки (продавец, категория, валюта) — интернированы;
+    - нормализованные названия и атрибуты из названия (жирность, вес, объём,
+      фасовка) — в отдельных колонках, считаются один раз.
+
+Строка читается через лёгкие представления с __slots__ (OfferRow, CatalogItem),
+которые ведут себя как Mapping. Полный dict собирается только при сериализации
+ответа.
+"""
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from typing import List, Dict, AbstractSet, Any, Iterable, Iterator, Optional, Tuple, Union
+from app.core.logger import get_logger
+from app.services.product_service import ProductService
+from app.services.title_attributes import ATTRIBUTE_COUNT, TitleAttributes, parse_normalized_attributes
+from app.services.title_normalizer import normalize_title, refresh_normalizer
+
+logger = get_logger(__name__)
+
+# Колонки с небольшим числом различных значений — строки интернируются
+INTERNED_COLUMNS = ("seller_name", "category_name", "category_code", "currency", "subcategory")
+
+# Поля элемента индекса каталога (CatalogItem)
+ITEM_KEYS = ("name", "price", "clean_name", "normalized_name", "category", "category_code", "offer_data")
+
+
+class _Missing:
+    """Маркер отсутствующего в оффере поля"""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+def normalize_offer_id(offer_id: Any) -> Any:
+    """Привести ID оффера к ключу индекса (числовые строки → int)"""
+    if isinstance(offer_id, str):
+        stripped = offer_id.strip()
+        if stripped.lstrip("-").isdigit():
+            return int(stripped)
+        return stripped
+    return offer_id
+
+
+def tag_values(tags: Any) -> List[str]:
+    """Теги оффера без повторов (одиночная строка — один тег, не строки пропускаются)"""
+    if isinstance(tags, str):
+        return [tags]
+    if not isinstance(tags, (list, tuple)):
+        return []
+    return list(dict.fromkeys(tag for tag in tags if isinstance(tag, str)))
+
+
+def iter_intersection(rows: Sequence, allowed: Sequence) -> Iterator[int]:
+    """
+    Пересечение двух отсортированных списков номеров строк (лениво, по возрастанию)
+
+    Перебирается более короткий список, вхождение в длинный — бинарным поиском.
+    """
+    if len(rows) > len(allowed):
+        rows, allowed = allowed, rows
+    size = len(allowed)
+    for row in rows:
+        i = bisect_left(allowed, row)
+        if i < size and allowed[i] == row:
+            yield row
+
+
+def patch_postings(
+        postings: Mapping[str, array],
+        removed: Mapping[str, AbstractSet[int]],
+        added: Mapping[str, AbstractSet[int]]
+) -> Dict[str, array]:
+    """
+    Копия posting lists (ключ → отсортированные номера строк) с заменой только затронутых списков
+
+    Списки остальных ключей переиспользуются без копирования, опустевшие ключи удаляются.
+
+    Args:
+        postings: Исходные posting lists
+        removed: Ключ → номера строк, которые из него убираются
+        added: Ключ → номера строк, которые в него добавляются
+    """
+    patched = dict(postings)
+    for key in removed.keys() | added.keys():
+        dropped = removed.get(key, frozenset())
+        rows = [row for row in patched.get(key, ()) if row not in dropped]
+        rows.extend(added.get(key, ()))
+        if rows:
+            patched[key] = array("I", sorted(rows))
+        else:
+            patched.pop(key, None)
+    return patched
+
+
+def _contains_sorted(rows: Sequence[int], row: int, size: int) -> bool:
+    """Есть ли номер строки в отсортированном списке (бинарный поиск)"""
+    i = bisect_left(rows, row)
+    return i < size and rows[i] == row
+
+
+def plan_rows(
+        size: int,
+        replaced: Mapping[int, Mapping[str, Any]],
+        added: Sequence[Mapping[str, Any]],
+        deleted: AbstractSet[int]
+) -> Tuple[Dict[int, Union[int, Mapping[str, Any]]], int]:
+    """
+    Разложить изменения по номерам строк так, чтобы сдвинулось как можно меньше строк
+
+    Изменённые офферы остаются на своих строках, новые занимают строки
+    удалённых, а затем дописываются в конец. Если удалённых больше, чем новых,
+    оставшиеся дыры закрываются последними строками хранилища — номера
+    остальных строк не меняются.
+
+    Args:
+        size: Количество строк текущего хранилища
+        replaced: Номер строки → новое содержимое оффера
+        added: Новые офферы
+        deleted: Номера удалённых строк
+
+    Returns:
+        (номер строки → источник: номер строки текущего хранилища или оффер, новое количество строк)
+    """
+    sources: Dict[int, Union[int, Mapping[str, Any]]] = dict(replaced)
+    free = sorted(deleted)
+    filled = min(len(free), len(added))
+    for row, offer in zip(free, added):
+        sources[row] = offer
+    free = free[filled:]
+    for offer in added[filled:]:
+        sources[size] = offer
+        size += 1
+
+    if free:
+        free_set = set(free)
+        new_size = size - len(free)
+        movers = [row for row in range(new_size, size) if row not in free_set]
+        for hole, mover in zip((row for row in free if row < new_size), movers):
+            sources[hole] = sources.get(mover, mover)
+        for row in range(new_size, size):
+            sources.pop(row, None)
+        size = new_size
+    return sources, size
+
+
+def _derived_names(title: str) -> Tuple[str, str, Tuple[float, ...]]:
+    """Очищенное и нормализованное название и атрибуты из него"""
+    normalized_name = normalize_title(title)
+    return (
+        ProductService.remove_stop_words(title),
+        normalized_name,
+        parse_normalized_attributes(normalized_name).to_values()
+    )
+
+
+def _parse_price(offer_id: Any, price_raw: Any) -> float:
+    """Привести цену оффера к float (0 при некорректном значении)"""
+    try:
+        return float(price_raw) if price_raw else 0
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid price format for offer {offer_id}: {price_raw}")
+        return 0
+
+
+class OfferStore(Sequence):
+    """
+    Неизменяемый колоночный набор офферов одного снимка
+
+    Последовательность строк OfferRow в порядке загрузки.
+    """
+
+    __slots__ = (
+        "columns",
+        "offer_ids",
+        "prices",
+        "titles",
+        "clean_names",
+        "normalized_names",
+        "attributes",
+        "normalizer_fingerprint",
+        "row_by_id",
+        "_data",
+        "_column_index",
+    )
+
+    def __init__(
+            self,
+            columns: Tuple[str, ...],
+            data: List[Any],
+            prices: Sequence[float],
+            clean_names: Sequence[str],
+            normalized_names: Sequence[str],
+            attributes: Sequence[float],
+            normalizer_fingerprint: str,
+            row_by_id: Optional[Dict[Any, int]] = None
+    ):
+        self.columns = columns
+        self._data = data
+        self._column_index = {column: i for i, column in enumerate(columns)}
+        self.prices = prices
+        self.clean_names = clean_names
+        self.normalized_names = normalized_names
+        # Атрибуты из названия: ATTRIBUTE_COUNT значений float подряд на строку, NaN — нет значения
+        self.attributes = attributes
+        # Отпечаток словарей нормализатора, которым посчитаны производные колонки
+        self.normalizer_fingerprint = normalizer_fingerprint
+
+        self.offer_ids = self._column("offer_id")
+        self.titles = self._column("title")
+
+        # Индекс offer_id → номер строки (первое вхождение выигрывает)
+        if row_by_id is None:
+            row_by_id = {}
+            for row, offer_id in enumerate(self.offer_ids):
+                row_by_id.setdefault(normalize_offer_id(offer_id), row)
+        self.row_by_id = row_by_id
+
+    def _column(self, name: str) -> Sequence:
+        """Колонка по имени (пустая, если такого поля нет ни у одного оффера)"""
+        index = self._column_index.get(name)
+        if index is None:
+            return (MISSING,) * len(self.prices)
+        return self._data[index]
+
+    @classmethod
+    def build(cls, offers: Iterable[Mapping[str, Any]], previous: Optional["OfferStore"] = None) -> "OfferStore":
+        """
+        Разложить офферы по колонкам и посчитать производные поля
+
+        Args:
+            offers: Офферы (dict из БД или строки OfferRow предыдущего снимка)
+            previous: Предыдущее хранилище; нормализованные названия
+                неизменившихся заголовков берутся из него, если словари
+                нормализатора с тех пор не менялись
+
+        Returns:
+            OfferStore
+        """
+        columns: List[str] = []
+        column_index: Dict[str, int] = {}
+        data: List[List[Any]] = []
+        count = 0
+
+        for offer in offers:
+            for key, value in offer.items():
+                index = column_index.get(key)
+                if index is None:
+                    index = column_index[key] = len(columns)
+                    columns.append(key)
+                    data.append([MISSING] * count)
+                if key in INTERNED_COLUMNS and type(value) is str:
+                    value = sys.intern(value)
+                data[index].append(value)
+            count += 1
+            for column_data in data:
+                if len(column_data) < count:
+                    column_data.append(MISSING)
+
+        # ID — в компактный массив, если все целые
+        id_index = column_index.get("offer_id")
+        if id_index is not None:
+            ids = data[id_index]
+            if all(type(offer_id) is int for offer_id in ids):
+                try:
+                    data[id_index] = array("q", ids)
+                except OverflowError:
+                    pass
+
+        titles = data[column_index["title"]] if "title" in column_index else [MISSING] * count
+        offer_ids = data[id_index] if id_index is not None else [MISSING] * count
+
+        fingerprint = refresh_normalizer()
+        if previous is not None and previous.normalizer_fingerprint != fingerprint:
+            logger.info("Normalizer dictionaries changed, renormalizing all titles")
+            previous = None
+
+        reusable: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        if previous is not None:
+            reusable = {
+                title: (clean_name, normalized_name, previous.attribute_values(row))
+                for row, (title, clean_name, normalized_name)
+                in enumerate(zip(previous.titles, previous.clean_names, previous.normalized_names))
+                if type(title) is str
+            }
+
+        prices = array("d")
+        clean_names: List[str] = []
+        normalized_names: List[str] = []
+        attributes = array("d")
+        price_index = column_index.get("price")
+        reused_count = 0
+
+        for row in range(count):
+            price_raw = data[price_index][row] if price_index is not None else MISSING
+            prices.append(_parse_price(offer_ids[row], None if price_raw is MISSING else price_raw))
+
+            title = titles[row]
+            if type(title) is not str:
+                title = ""
+            names = reusable.get(title)
+            if names is None:
+                names = _derived_names(title)
+            else:
+                reused_count += 1
+            clean_names.append(names[0])
+            normalized_names.append(names[1])
+            attributes.extend(names[2])
+
+        if previous is not None:
+            logger.info(f"Offer store built: {count} offers, {reused_count} normalized titles reused")
+
+        return cls(
+            tuple(columns),
+            [tuple(column_data) if isinstance(column_data, list) else column_data for column_data in data],
+            prices,
+            clean_names,
+            normalized_names,
+            attributes,
+            fingerprint
+        )
+
+    def patch(self, sources: Mapping[int, Union[int, Mapping[str, Any]]], size: int) -> "OfferStore":
+        """
+        Новое хранилище из этого с заменой отдельных строк (см. plan_rows)
+
+        Колонки копируются целиком, но нормализуются только новые офферы,
+        а индекс offer_id правится только по затронутым строкам. Вызывающий
+        проверяет, что словари нормализатора не менялись с построения
+        этого хранилища.
+
+        Args:
+            sources: Номер строки → номер строки этого хранилища или новый оффер
+            size: Количество строк нового хранилища
+
+        Returns:
+            OfferStore
+        """
+        old_size = len(self)
+        columns = list(self.columns)
+        column_index = dict(self._column_index)
+        for source in sources.values():
+            if not isinstance(source, int):
+                for key in source:
+                    if key not in column_index:
+                        column_index[key] = len(columns)
+                        columns.append(key)
+
+        data: List[List[Any]] = []
+        for index in range(len(columns)):
+            column_data = list(self._data[index][:size]) if index < len(self._data) else []
+            column_data.extend([MISSING] * (size - len(column_data)))
+            data.append(column_data)
+        prices = array("d", self.prices[:size])
+        prices.extend([0.0] * (size - len(prices)))
+        clean_names = list(self.clean_names[:size])
+        clean_names.extend([""] * (size - len(clean_names)))
+        normalized_names = list(self.normalized_names[:size])
+        normalized_names.extend([""] * (size - len(normalized_names)))
+        attributes = array("d", self.attributes[:size * ATTRIBUTE_COUNT])
+        attributes.extend([0.0] * (size * ATTRIBUTE_COUNT - len(attributes)))
+
+        for row, source in sources.items():
+            if isinstance(source, int):
+                for index, column_data in enumerate(data):
+                    column_data[row] = self._data[index][source] if index < len(self._data) else MISSING
+                prices[row] = self.prices[source]
+                names = (self.clean_names[source], self.normalized_names[source], self.attribute_values(source))
+            else:
+                for index, column in enumerate(columns):
+                    value = source.get(column, MISSING)
+                    if column in INTERNED_COLUMNS and type(value) is str:
+                        value = sys.intern(value)
+                    data[index][row] = value
+                price_raw = source.get("price")
+                prices[row] = _parse_price(source.get("offer_id"), price_raw)
+                title = source.get("title")
+                names = _derived_names(title if type(title) is str else "")
+            clean_names[row] = names[0]
+            normalized_names[row] = names[1]
+            attributes[row * ATTRIBUTE_COUNT:(row + 1) * ATTRIBUTE_COUNT] = array("d", names[2])
+
+        id_index = column_index.get("offer_id")
+        columns_data: List[Any] = [tuple(column_data) for column_data in data]
+        if id_index is not None and isinstance(self.offer_ids, (array, memoryview)):
+            try:
+                columns_data[id_index] = array("q", data[id_index])
+            except (OverflowError, TypeError):
+                pass
+
+        # Индекс offer_id правится по затронутым строкам, пока в хранилище нет повторов ID
+        row_by_id: Optional[Dict[Any, int]] = None
+        if len(self.row_by_id) == old_size:
+            row_by_id = dict(self.row_by_id)
+            offer_ids = self.offer_ids
+            for row in sources.keys() | range(size, old_size):
+                if row < old_size:
+                    row_by_id.pop(normalize_offer_id(offer_ids[row]), None)
+            new_ids = data[id_index] if id_index is not None else [MISSING] * size
+            for row in sources:
+                offer_id = normalize_offer_id(new_ids[row])
+                row_by_id[offer_id] = min(row_by_id.get(offer_id, row), row)
+
+        return OfferStore(
+            tuple(columns),
+            columns_data,
+            prices,
+            clean_names,
+            normalized_names,
+            attributes,
+            self.normalizer_fingerprint,
+            row_by_id=row_by_id
+        )
+
+    def value(self, row: int, key: str, default: Any = None) -> Any:
+        """Значение поля строки"""
+        index = self._column_index.get(key)
+        if index is None:
+            return default
+        value = self._data[index][row]
+        return default if value is MISSING else value
+
+    def attribute_values(self, row: int) -> Tuple[float, ...]:
+        """Значения атрибутов строки в порядке ATTRIBUTE_FIELDS (NaN — нет значения)"""
+        start = row * ATTRIBUTE_COUNT
+        return tuple(self.attributes[start:start + ATTRIBUTE_COUNT])
+
+    def title_attributes(self, row: int) -> TitleAttributes:
+        """Атрибуты из названия строки (жирность, вес, объём, фасовка)"""
+        return TitleAttributes.from_values(self.attribute_values(row))
+
+    def row(self, row: int) -> "OfferRow":
+        """Представление строки"""
+        return OfferRow(self, row)
+
+    def rows(self, rows: Iterable[int]) -> List["OfferRow"]:
+        """Представления нескольких строк"""
+        return [OfferRow(self, row) for row in rows]
+
+    def find_row(self, offer_id: Any) -> Optional[int]:
+        """Номер строки оффера по ID"""
+        return self.row_by_id.get(normalize_offer_id(offer_id))
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union["OfferRow", List["OfferRow"]]:
+        if isinstance(index, slice):
+            return self.rows(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("offer row out of range")
+        return OfferRow(self, index)
+
+    def __iter__(self) -> Iterator["OfferRow"]:
+        for row in range(len(self)):
+            yield OfferRow(self, row)
+
+
+class OfferRow(Mapping):
+    """Оффер как Mapping поверх строки OfferStore (без собственного dict)"""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: OfferStore, row: int):
+        self._store = store
+        self._row = row
+
+    @property
+    def row(self) -> int:
+        """Номер строки в хранилище"""
+        return self._row
+
+    @property
+    def title_attributes(self) -> TitleAttributes:
+        """Атрибуты из названия, разобранные при загрузке кэша"""
+        return self._store.title_attributes(self._row)
+
+    @property
+    def normalized_title(self) -> str:
+        """Нормализованное название, посчитанное при загрузке кэша"""
+        return self._store.normalized_names[self._row]
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._store.value(self._row, key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._store.value(self._row, key, default)
+
+    def __iter__(self) -> Iterator[str]:
+        store, row = self._store, self._row
+        for column, column_data in zip(store.columns, store._data):
+            if column_data[row] is not MISSING:
+                yield column
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Собрать полный dict оффера (для ответа API)"""
+        store, row = self._store, self._row
+        return {
+            column: column_data[row]
+            for column, column_data in zip(store.columns, store._data)
+            if column_data[row] is not MISSING
+        }
+
+    def __repr__(self) -> str:
+        return f"OfferRow({self.to_dict()!r})"
+
+
+class CatalogItem(Mapping):
+    """
+    Элемент индекса каталога: предрассчитанные поля оффера
+
+    Ключи: name, price, clean_name, normalized_name, category, category_code, offer_data.
+    """
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: OfferStore, row: int):
+        self._store = store
+        self._row = row
+
+    @property
+    def row(self) -> int:
+        """Номер строки в хранилище"""
+        return self._row
+
+    def __getitem__(self, key: str) -> Any:
+        store, row = self._store, self._row
+        if key == "name":
+            return store.value(row, "title", "")
+        if key == "price":
+            return store.prices[row]
+        if key == "clean_name":
+            return store.clean_names[row]
+        if key == "normalized_name":
+            return store.normalized_names[row]
+        if key == "category":
+            return store.value(row, "category_name", "")
+        if key == "category_code":
+            return store.value(row, "category_code", "")
+        if key == "offer_data":
+            return OfferRow(store, row)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(ITEM_KEYS)
+
+    def __len__(self) -> int:
+        return len(ITEM_KEYS)
+
+    def __repr__(self) -> str:
+        return f"CatalogItem({self._store.value(self._row, 'offer_id')!r}, {self['name']!r})"
+
+
+class Bucket(Mapping):
+    """
+    Группа офферов {offer_id: CatalogItem} поверх списка номеров строк
+
+    Номера строк хранятся в array по возрастанию — 4 байта на оффер
+    вместо записи словаря.
+    """
+
+    __slots__ = ("_store", "_rows")
+
+    def __init__(self, store: OfferStore, rows: array):
+        self._store = store
+        self._rows = rows
+
+    @property
+    def store(self) -> OfferStore:
+        """Хранилище, на строки которого ссылается группа"""
+        return self._store
+
+    @property
+    def rows(self) -> array:
+        """Номера строк группы"""
+        return self._rows
+
+    def iter_rows(self) -> Iterator[int]:
+        """Обход номеров строк группы по возрастанию (без копирования)"""
+        return iter(self._rows)
+
+    def _find(self, offer_id: Any) -> Optional[int]:
+        row = self._store.find_row(offer_id)
+        if row is None:
+            return None
+        # Строки идут по возрастанию — бинарный поиск
+        rows = self._rows
+        i = bisect_left(rows, row)
+        return row if i < len(rows) and rows[i] == row else None
+
+    def __getitem__(self, offer_id: Any) -> CatalogItem:
+        row = self._find(offer_id)
+        if row is None:
+            raise KeyError(offer_id)
+        return CatalogItem(self._store, row)
+
+    def __contains__(self, offer_id: Any) -> bool:
+        return self._find(offer_id) is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        offer_ids = self._store.offer_ids
+        for row in self._rows:
+            yield offer_ids[row]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def items(self) -> Iterator[Tuple[Any, CatalogItem]]:
+        store = self._store
+        offer_ids = store.offer_ids
+        for row in self._rows:
+            yield offer_ids[row], CatalogItem(store, row)
+
+    def values(self) -> Iterator[CatalogItem]:
+        store = self._store
+        for row in self._rows:
+            yield CatalogItem(store, row)
+
+    def item(self, row: int) -> CatalogItem:
+        """Элемент по номеру строки хранилища (строка берётся из rows группы)"""
+        return CatalogItem(self._store, row)
+
+    def view(
+            self,
+            allowed_rows: Optional[Sequence] = None,
+            excluded_rows: AbstractSet[int] = frozenset()
+    ) -> "BucketView":
+        """
+        Представление группы без копирования: только строки из allowed_rows
+        (отсортированный список, None — все) и не из excluded_rows
+        """
+        return BucketView(self._store, self._rows, allowed_rows, excluded_rows)
+
+    def __repr__(self) -> str:
+        return f"Bucket({len(self)} offers)"
+
+
+class BucketView(Bucket):
+    """
+    Отфильтрованная группа поверх строк исходной: разрешённые строки
+    (например, офферы с нужными тегами) минус исключённые (например,
+    исходный оффер). Строки не копируются: исключённые пропускаются при
+    обходе, размер считается вычитанием. Копируется только пересечение
+    с allow-list — оно не больше самого allow-list.
+    """
+
+    __slots__ = ("_allowed", "_excluded", "_allowed_rows")
+
+    def __init__(
+            self,
+            store: OfferStore,
+            rows: array,
+            allowed_rows: Optional[Sequence],
+            excluded_rows: AbstractSet[int]
+    ):
+        super().__init__(store, rows)
+        self._allowed = allowed_rows
+        self._excluded = excluded_rows
+        self._allowed_rows: Optional[array] = None
+
+    def _candidate_rows(self) -> Sequence[int]:
+        """Строки исходной группы из allow-list (исключённые ещё не вычтены)"""
+        if self._allowed is None:
+            return self._rows
+        if self._allowed_rows is None:
+            self._allowed_rows = array("I", iter_intersection(self._rows, self._allowed))
+        return self._allowed_rows
+
+    @property
+    def rows(self) -> array:
+        """Номера строк представления (копия; для обхода — iter_rows)"""
+        return array("I", self.iter_rows())
+
+    def iter_rows(self) -> Iterator[int]:
+        """Обход номеров строк представления по возрастанию (без копирования)"""
+        rows = self._candidate_rows()
+        excluded = self._excluded
+        if not excluded:
+            return iter(rows)
+        return (row for row in rows if row not in excluded)
+
+    def _find(self, offer_id: Any) -> Optional[int]:
+        row = super()._find(offer_id)
+        if row is None or row in self._excluded:
+            return None
+        if self._allowed is not None and not _contains_sorted(self._allowed, row, len(self._allowed)):
+            return None
+        return row
+
+    def __iter__(self) -> Iterator[Any]:
+        offer_ids = self._store.offer_ids
+        for row in self.iter_rows():
+            yield offer_ids[row]
+
+    def __len__(self) -> int:
+        # Размер без обхода: строки-кандидаты минус исключённые среди них
+        rows = self._candidate_rows()
+        size = len(rows)
+        return size - sum(1 for row in self._excluded if _contains_sorted(rows, row, size))
+
+    def items(self) -> Iterator[Tuple[Any, CatalogItem]]:
+        store = self._store
+        offer_ids = store.offer_ids
+        for row in self.iter_rows():
+            yield offer_ids[row], CatalogItem(store, row)
+
+    def values(self) -> Iterator[CatalogItem]:
+        store = self._store
+        for row in self.iter_rows():
+            yield CatalogItem(store, row)
+
+    def view(
+            self,
+            allowed_rows: Optional[Sequence] = None,
+            excluded_rows: AbstractSet[int] = frozenset()
+    ) -> "BucketView":
+        """
+        Вложенное представление поверх тех же строк исходной группы:
+        разрешённые строки пересекаются, исключённые объединяются
+        """
+        allowed = self._allowed
+        if allowed_rows is not None:
+            allowed = allowed_rows if allowed is None else array("I", iter_intersection(allowed, allowed_rows))
+        excluded = self._excluded
+        if excluded_rows:
+            excluded = excluded_rows if not excluded else frozenset(excluded) | frozenset(excluded_rows)
+        return BucketView(self._store, self._rows, allowed, excluded)
+
+    def __repr__(self) -> str:
+        return f"BucketView({len(self)} of {len(self._rows)} offers)"
+
+
+class BucketsView(Mapping):
+    """
+    Группы (например, категории продавца) как представления BucketView
+
+    Представление группы создаётся лениво при обращении и запоминается,
+    поэтому поиск, поднимающийся по двум-трём уровням категорий,
+    не трогает остальные группы продавца. Пустые после фильтра группы
+    считаются отсутствующими.
+    """
+
+    __slots__ = ("_buckets", "_allowed", "_excluded", "_views")
+
+    def __init__(
+            self,
+            buckets: Mapping[str, Bucket],
+            allowed_rows: Optional[Sequence] = None,
+            excluded_rows: AbstractSet[int] = frozenset()
+    ):
+        self._buckets = buckets
+        self._allowed = allowed_rows
+        self._excluded = excluded_rows
+        self._views: Dict[str, BucketView] = {}
+
+    def __getitem__(self, key: str) -> BucketView:
+        view = self._views.get(key)
+        if view is None:
+            view = self._buckets[key].view(self._allowed, self._excluded)
+            self._views[key] = view
+        if not view:
+            raise KeyError(key)
+        return view
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._buckets:
+            if key in self:
+                yield key
+
+    def __contains__(self, key: Any) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"BucketsView({len(self._buckets)} groups)"
@@ -0,0 +1,333 @@
+"""
+Вторичные индексы офферов для фильтров /api/offers
+
+Офферы упорядочиваются по offer_id: позиция оффера в этом порядке — его ранг.
+Для каждого значения фильтра (продавец, категория, тег) хранится
+posting list — отсортированный array рангов. Фильтры пересекаются по самому
+короткому списку, проверка вхождения в остальные — бинарным поиском.
+Поиск по названию идёт только по кандидатам и по заранее приведённым
+к нижнему регистру названиям.
+
+Порядок по offer_id даёт стабильную keyset-пагинацию: курсор «после
+offer_id X» указывает на одно и то же место и после обновления кэша.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, AbstractSet, Any, Iterable, Iterator, Mapping, Optional, Sequence
+from app.cache.offer_store import MISSING, OfferStore, normalize_offer_id, tag_values
+
+EMPTY_POSTING = array("I")
+
+
+def posting_contains(ranks: Sequence[int], rank: int) -> bool:
+    """Есть ли ранг в отсортированном posting list"""
+    i = bisect_left(ranks, rank)
+    return i < len(ranks) and ranks[i] == rank
+
+
+def offer_id_key(offer_id: Any) -> Any:
+    """Ключ сортировки offer_id (целые ID раньше строковых)"""
+    offer_id = normalize_offer_id(offer_id)
+    if isinstance(offer_id, int):
+        return 0, offer_id
+    return 1, str(offer_id)
+
+
+class OfferPage:
+    """Страница отфильтрованных офферов"""
+
+    __slots__ = ("total", "rows", "has_more")
+
+    def __init__(self, total: int, rows: List[int], has_more: bool):
+        self.total = total
+        # Номера строк OfferStore в порядке offer_id
+        self.rows = rows
+        self.has_more = has_more
+
+
+class TitleText:
+    """
+    Названия всех строк хранилища одной строкой через перевод строки
+
+    Поиск первой строки с подстрокой — один вызов str.find по общему тексту
+    и бинарный поиск по началам названий вместо перебора строк в Python.
+    """
+
+    __slots__ = ("text", "starts")
+
+    def __init__(self, titles: Iterable[str]):
+        starts = array("q")
+        position = 0
+        parts: List[str] = []
+        for title in titles:
+            starts.append(position)
+            parts.append(title)
+            position += len(title) + 1
+        self.text = "\n".join(parts)
+        # позиция начала названия каждой строки в text
+        self.starts = starts
+
+    def title(self, row: int) -> str:
+        """Название строки"""
+        end = self.starts[row + 1] - 1 if row + 1 < len(self.starts) else len(self.text)
+        return self.text[self.starts[row]:end]
+
+    def first_row(self, needle: str) -> Optional[int]:
+        """Первая по порядку строка, название которой содержит needle (None — такой нет)"""
+        if not self.starts:
+            return None
+        if "\n" in needle:
+            # Такая подстрока нашлась бы и на стыке названий — проверяем по одному
+            return next((row for row in range(len(self.starts)) if needle in self.title(row)), None)
+        position = self.text.find(needle)
+        if position < 0:
+            return None
+        return bisect_right(self.starts, position) - 1
+
+
+class OfferPostings:
+    """Posting lists по продавцу, категории и тегу + названия в нижнем регистре"""
+
+    __slots__ = ("order", "sorted_keys", "by_seller", "by_category", "by_tag", "lower_titles")
+
+    def __init__(
+            self,
+            order: array,
+            sorted_keys: Sequence[Any],
+            by_seller: Mapping[str, array],
+            by_category: Mapping[str, array],
+            by_tag: Mapping[str, array],
+            lower_titles: Sequence[str]
+    ):
+        # ранг → номер строки OfferStore
+        self.order = order
+        # ключи offer_id по рангам (для поиска позиции курсора)
+        self.sorted_keys = sorted_keys
+        self.by_seller = by_seller
+        self.by_category = by_category
+        self.by_tag = by_tag
+        # названия в нижнем регистре по рангам
+        self.lower_titles = lower_titles
+
+    @classmethod
+    def build(cls, store: OfferStore, lower_titles: Optional[Sequence[str]] = None) -> "OfferPostings":
+        """
+        Построить индексы по хранилищу
+
+        Args:
+            store: Колоночное хранилище офферов
+            lower_titles: Готовые названия в нижнем регистре по рангам
+                (например, из общего сегмента)
+
+        Returns:
+            OfferPostings
+        """
+        offer_ids = store.offer_ids
+        if isinstance(offer_ids, (array, memoryview)):
+            # Целочисленные ID: полная загрузка уже идёт по offer_id, сортировка почти бесплатна
+            order = array("I", sorted(range(len(store)), key=offer_ids.__getitem__))
+            sorted_keys: Sequence[Any] = array("q", (offer_ids[row] for row in order))
+        else:
+            keys = [offer_id_key(offer_id) if offer_id is not MISSING else (2, "") for offer_id in offer_ids]
+            order = array("I", sorted(range(len(store)), key=keys.__getitem__))
+            sorted_keys = tuple(keys[row] for row in order)
+
+        by_seller: Dict[str, array] = {}
+        by_category: Dict[str, array] = {}
+        by_tag: Dict[str, array] = {}
+        titles: List[str] = []
+
+        for rank, row in enumerate(order):
+            seller = store.value(row, "seller_name")
+            if seller:
+                by_seller.setdefault(seller, array("I")).append(rank)
+
+            category = store.value(row, "category_name")
+            if category is not None:
+                by_category.setdefault(category, array("I")).append(rank)
+
+            for tag in tag_values(store.value(row, "tags")):
+                by_tag.setdefault(tag, array("I")).append(rank)
+
+            if lower_titles is None:
+                titles.append(str(store.value(row, "title", "")).lower())
+
+        return cls(
+            order, sorted_keys, by_seller, by_category, by_tag,
+            tuple(titles) if lower_titles is None else lower_titles
+        )
+
+    @classmethod
+    def patch(
+            cls,
+            previous: "OfferPostings",
+            previous_store: OfferStore,
+            store: OfferStore,
+            touched_rows: AbstractSet[int]
+    ) -> "OfferPostings":
+        """
+        Индексы после замены отдельных строк хранилища (OfferStore.patch)
+
+        Если у затронутых строк не изменились offer_id, продавец, категория
+        и теги (например, поменялась только цена), ранги и posting lists
+        переносятся как есть, а заменяются только названия этих строк.
+        Иначе индексы строятся заново.
+        """
+        if len(store) != len(previous_store):
+            return cls.build(store)
+        for row in touched_rows:
+            for key in ("offer_id", "seller_name", "category_name"):
+                if previous_store.value(row, key, MISSING) != store.value(row, key, MISSING):
+                    return cls.build(store)
+            if tag_values(previous_store.value(row, "tags")) != tag_values(store.value(row, "tags")):
+                return cls.build(store)
+
+        lower_titles = list(previous.lower_titles)
+        for row in touched_rows:
+            lower_titles[previous.rank_of(previous_store, row)] = str(store.value(row, "title", "")).lower()
+        return cls(
+            previous.order, previous.sorted_keys, previous.by_seller, previous.by_category, previous.by_tag,
+            tuple(lower_titles)
+        )
+
+    def rank_of(self, store: OfferStore, row: int) -> int:
+        """Ранг строки хранилища, по которому построены индексы"""
+        offer_id = store.value(row, "offer_id", MISSING)
+        if isinstance(self.sorted_keys, array):
+            key: Any = offer_id
+        else:
+            key = offer_id_key(offer_id) if offer_id is not MISSING else (2, "")
+        rank = bisect_left(self.sorted_keys, key)
+        # Среди одинаковых offer_id строки идут по возрастанию
+        while self.order[rank] != row:
+            rank += 1
+        return rank
+
+    @property
+    def size(self) -> int:
+        """Количество офферов"""
+        return len(self.order)
+
+    def rank_after(self, offer_id: Any) -> int:
+        """Первый ранг с offer_id строго больше заданного"""
+        if isinstance(self.sorted_keys, array):
+            key = normalize_offer_id(offer_id)
+            if not isinstance(key, int):
+                # Строковый ID больше любого целого
+                return self.size
+        else:
+            key = offer_id_key(offer_id)
+        return bisect_right(self.sorted_keys, key)
+
+    def _postings(
+            self,
+            seller: Optional[str],
+            category: Optional[str],
+            tag: Optional[str]
+    ) -> Optional[List[Sequence[int]]]:
+        """Posting lists выбранных фильтров (None — фильтров нет)"""
+        postings: List[Sequence[int]] = []
+        for index, value in ((self.by_seller, seller), (self.by_category, category), (self.by_tag, tag)):
+            if value:
+                postings.append(index.get(value, EMPTY_POSTING))
+        return postings or None
+
+    def iter_ranks(
+            self,
+            seller: Optional[str] = None,
+            category: Optional[str] = None,
+            tag: Optional[str] = None,
+            q: Optional[str] = None,
+            start: int = 0
+    ) -> Iterator[int]:
+        """Лениво перечислить ранги (начиная со start), прошедшие все фильтры"""
+        postings = self._postings(seller, category, tag)
+        if postings is None:
+            candidates: Iterator[int] = iter(range(start, self.size))
+        else:
+            postings.sort(key=len)
+            smallest, others = postings[0], postings[1:]
+            candidates = (
+                rank for rank in smallest[bisect_left(smallest, start):]
+                if all(posting_contains(other, rank) for other in others)
+            )
+
+        if q:
+            q_lower = q.lower()
+            lower_titles = self.lower_titles
+            candidates = (rank for rank in candidates if q_lower in lower_titles[rank])
+
+        return candidates
+
+    def iter_rows(
+            self,
+            seller: Optional[str] = None,
+            category: Optional[str] = None,
+            tag: Optional[str] = None,
+            q: Optional[str] = None
+    ) -> Iterator[int]:
+        """Лениво перечислить номера строк OfferStore в порядке offer_id"""
+        order = self.order
+        for rank in self.iter_ranks(seller, category, tag, q):
+            yield order[rank]
+
+    def page(
+            self,
+            limit: int,
+            offset: int = 0,
+            after: Optional[Any] = None,
+            seller: Optional[str] = None,
+            category: Optional[str] = None,
+            tag: Optional[str] = None,
+            q: Optional[str] = None
+    ) -> OfferPage:
+        """
+        Страница отфильтрованных офферов в порядке offer_id
+
+        Без поиска по названию и с одним фильтром (или без фильтров)
+        страница — это срез posting list, total — его длина.
+        Иначе ранги перебираются лениво: считаются все, а в память
+        попадают только строки страницы.
+
+        Args:
+            limit: Размер страницы
+            offset: Смещение (для offset-пагинации)
+            after: offer_id, после которого начинается страница (для курсора)
+
+        Returns:
+            OfferPage
+        """
+        start = self.rank_after(after) if after is not None else 0
+        postings = self._postings(seller, category, tag)
+        order = self.order
+
+        if not q and (postings is None or len(postings) == 1):
+            ranks: Sequence[int] = range(self.size) if postings is None else postings[0]
+            begin = bisect_left(ranks, start) + offset
+            return OfferPage(
+                total=len(ranks),
+                rows=[order[rank] for rank in ranks[begin:begin + limit]],
+                has_more=begin + limit < len(ranks)
+            )
+
+        total = 0
+        skipped = 0
+        page_rows: List[int] = []
+        has_more = False
+        for rank in self.iter_ranks(seller, category, tag, q):
+            total += 1
+            if rank < start:
+                continue
+            if skipped < offset:
+                skipped += 1
+            elif len(page_rows) < limit:
+                page_rows.append(order[rank])
+            else:
+                has_more = True
+        return OfferPage(total, page_rows, has_more)
+
+    def __repr__(self) -> str:
+        return (
+            f"OfferPostings({len(self.by_seller)} sellers, {len(self.by_category)} categories, "
+            f"{len(self.by_tag)} tags)"
+        )
@@ -0,0 +1,226 @@
+"""
+Фоновое обновление кэша
+
+Отдельный поток обновляет кэш раз в CACHE_REFRESH_INTERVAL секунд (± джиттер,
+чтобы реплики не ходили в БД одновременно). Пока строится новый снимок,
+запросы обслуживаются текущим. Ручное обновление ставится в очередь
+как задача, статус которой можно опрашивать.
+"""
+import random
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional
+from app.cache.cache_manager import CacheManager, REFRESH_MODE_AUTO, REFRESH_MODE_FULL, REFRESH_MODES
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Статусы задач обновления
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class RefreshJob:
+    """Задача обновления кэша"""
+
+    def __init__(self, mode: str, trigger: str):
+        self.job_id = uuid.uuid4().hex
+        self.mode = mode
+        self.trigger = trigger
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.generation: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def is_done(self) -> bool:
+        """Задача завершена (успешно или с ошибкой)"""
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление задачи для API"""
+        return {
+            "job_id": self.job_id,
+            "mode": self.mode,
+            "trigger": self.trigger,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "generation": self.generation,
+            "error": self.error,
+        }
+
+
+class CacheRefresher:
+    """Планировщик фонового обновления кэша"""
+
+    def __init__(
+            self,
+            cache_manager: CacheManager,
+            interval: float,
+            jitter: float = 0.0,
+            max_staleness: Optional[float] = None,
+            history_size: int = 50
+    ):
+        """
+        Args:
+            cache_manager: Обновляемый кэш
+            interval: Период обновления, секунды
+            jitter: Случайный разброс периода (±), секунды
+            max_staleness: Возраст снимка, после которого он считается устаревшим,
+                а следующее обновление выполняется без ожидания периода
+            history_size: Сколько последних задач хранить для опроса статуса
+        """
+        self.cache_manager = cache_manager
+        self.interval = interval
+        self.jitter = jitter
+        self.max_staleness = max_staleness
+        self.history_size = history_size
+
+        self._jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+        self._pending: Optional[RefreshJob] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- управление потоком ----------------------------------------------
+
+    def start(self) -> None:
+        """Запустить фоновый поток обновления"""
+        if self.is_running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-refresher", daemon=True)
+        self._thread.start()
+        logger.info(f"Cache refresher started (interval {self.interval}s ± {self.jitter}s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Остановить фоновый поток"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("Cache refresher stopped")
+
+    @property
+    def is_running(self) -> bool:
+        """Фоновый поток запущен"""
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---- задачи ------------------------------------------------------------
+
+    def trigger(self, mode: str = REFRESH_MODE_AUTO, trigger: str = "manual") -> RefreshJob:
+        """
+        Поставить обновление в очередь, не дожидаясь его выполнения
+
+        Если задача уже ждёт в очереди, возвращается она же (повторные
+        запросы схлопываются в одно обновление; запрос полной перезагрузки
+        повышает режим ожидающей задачи до full).
+
+        Args:
+            mode: Режим обновления (auto/full/delta)
+            trigger: Источник запуска (для отображения в статусе)
+
+        Returns:
+            Задача обновления
+        """
+        if mode not in REFRESH_MODES:
+            raise ValueError(f"Unknown refresh mode: {mode}")
+
+        with self._lock:
+            if self._pending is not None:
+                if mode == REFRESH_MODE_FULL:
+                    self._pending.mode = REFRESH_MODE_FULL
+                return self._pending
+            job = RefreshJob(mode, trigger)
+            self._pending = job
+            self._remember(job)
+
+        if self.is_running:
+            self._wakeup.set()
+        else:
+            # Планировщик не запущен (например, в тестах) — выполняем в отдельном потоке
+            threading.Thread(target=self._run_pending, name="cache-refresh-job", daemon=True).start()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[RefreshJob]:
+        """Получить задачу по ID"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Состояние планировщика для /api/cache/info"""
+        with self._lock:
+            last_job = next(reversed(self._jobs.values()), None)
+        return {
+            "running": self.is_running,
+            "interval_seconds": self.interval,
+            "jitter_seconds": self.jitter,
+            "max_staleness_seconds": self.max_staleness,
+            "last_job": last_job.to_dict() if last_job else None,
+        }
+
+    # ---- внутреннее --------------------------------------------------------
+
+    def _remember(self, job: RefreshJob) -> None:
+        """Сохранить задачу в ограниченной истории (вызывается под self._lock)"""
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > self.history_size:
+            self._jobs.popitem(last=False)
+
+    def _next_delay(self) -> float:
+        """Задержка до следующего планового обновления"""
+        delay = self.interval + random.uniform(-self.jitter, self.jitter)
+        age = self.cache_manager.get_cache_info().get("cache_age_seconds")
+        if self.max_staleness is not None and age is not None:
+            # Снимок не остаётся без сверки с источником дольше max_staleness
+            delay = min(delay, max(self.max_staleness - age, 0.0))
+        return max(delay, 1.0)
+
+    def _run(self) -> None:
+        """Цикл фонового потока"""
+        while not self._stopping.is_set():
+            woke_up = self._wakeup.wait(self._next_delay())
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+
+            if not woke_up:
+                with self._lock:
+                    if self._pending is None:
+                        self._pending = RefreshJob(REFRESH_MODE_AUTO, "schedule")
+                        self._remember(self._pending)
+            self._run_pending()
+
+    def _run_pending(self) -> None:
+        """Выполнить задачу из очереди, если она есть"""
+        with self._lock:
+            job = self._pending
+            self._pending = None
+        if job is None:
+            return
+
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        try:
+            success = self.cache_manager.refresh_cache(job.mode)
+            job.status = JOB_SUCCEEDED if success else JOB_FAILED
+            if not success:
+                job.error = "Failed to refresh cache"
+        except Exception as e:
+            logger.error(f"Cache refresh job {job.job_id} failed: {e}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            job.generation = self.cache_manager.get_cache_info().get("generation")
+        logger.info(f"Cache refresh job {job.job_id} ({job.trigger}, {job.mode}): {job.status}")
@@ -0,0 +1,58 @@
+"""
+Процесс-загрузчик общего сегмента каталога
+
+Загружает каталог из источника (DATA_SOURCE), пишет каждое поколение
+в CACHE_SHARED_DIR и обновляет его в фоне. API-воркеры с
+CACHE_SHARED_ROLE=reader подключаются к сегментам только на чтение.
+
+Запуск:
+    python -m app.cache.segment_loader
+"""
+import signal
+from threading import Event
+from app.cache.cache_manager import REFRESH_MODE_FULL, SHARED_ROLE_WRITER, CacheManager
+from app.cache.refresher import CacheRefresher
+from app.cache.sources import create_data_source
+from app.config import config
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def main() -> None:
+    """Загрузить каталог, записать сегмент и обновлять его до сигнала остановки"""
+    if not config.CACHE_SHARED_DIR:
+        raise SystemExit("CACHE_SHARED_DIR is not set")
+
+    manager = CacheManager(
+        create_data_source(config),
+        snapshot_path=config.CACHE_SNAPSHOT_PATH,
+        shared_dir=config.CACHE_SHARED_DIR,
+        shared_role=SHARED_ROLE_WRITER
+    )
+    refresher = CacheRefresher(
+        manager,
+        interval=config.CACHE_REFRESH_INTERVAL,
+        jitter=config.CACHE_REFRESH_JITTER,
+        max_staleness=config.CACHE_MAX_STALENESS
+    )
+
+    # Тёплый старт из файла снимка, иначе полная загрузка
+    if manager.load_from_file():
+        refresher.trigger(trigger="startup")
+    elif not manager.refresh_cache(REFRESH_MODE_FULL):
+        logger.warning("Initial catalog load failed, will retry on the refresh schedule")
+
+    stop = Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    refresher.start()
+    logger.info(f"Segment loader is writing catalog segments to {config.CACHE_SHARED_DIR}")
+    stop.wait()
+    refresher.stop()
+    manager.flush_writes()
+
+
+if __name__ == "__main__":
+    main()
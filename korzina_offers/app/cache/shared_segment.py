@@ -0,0 +1,469 @@
+"""
+Общий сегмент каталога в файле, отображаемом в память (mmap)
+
+Один процесс-загрузчик пишет каждое поколение каталога в файл сегмента,
+все API-воркеры и офлайн-инструменты подключаются к нему только на чтение.
+Колонки хранятся в сыром виде, поэтому страницы файла общие для всех
+процессов через page cache ОС, а воркер держит в собственной памяти только
+индексы (номера строк), но не сами данные офферов.
+
+Каталог сегментов:
+    CURRENT                     JSON {"generation": N, "file": "...", "verified_at": "..."} —
+                                текущее поколение и время последней сверки писателя с источником
+    catalog-0000000042.seg      сегмент поколения 42
+
+Поколения подменяются атомарно: новый сегмент пишется во временный файл,
+затем os.replace переключает на него CURRENT. Старые сегменты удаляются
+через поколение; уже подключённые к ним процессы продолжают работать
+(отображение остаётся валидным после unlink).
+
+Формат сегмента:
+    заголовок (HEADER): magic, version, reserved, meta_offset, meta_len
+    блоки колонок, выровненные по 8 байт
+    метаданные (JSON): поколение, водяной знак, описание колонок,
+        sha256 блоков колонок (проверяется при open_segment(verify=True))
+
+Тот же формат использует файл снимка для тёплого старта (snapshot_file):
+write_segment_file пишет один файл, open_segment отображает его в память.
+
+Типы колонок:
+    int64 / float64  — сырые array, читаются через memoryview без копирования;
+    str              — смещения (uint64) + UTF-8 данные, строка декодируется при чтении;
+    dict             — коды (uint32) + словарь значений (для повторяющихся значений);
+    json             — смещения + JSON каждого значения (списки, объекты, смешанные типы).
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Sequence
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union, overload
+from app.cache.offer_store import MISSING, OfferStore
+from app.cache.snapshot import CatalogSnapshot
+from app.core.logger import get_logger
+from app.services.title_normalizer import refresh_normalizer
+
+logger = get_logger(__name__)
+
+MAGIC = b"KRZSEG\0\0"
+FORMAT_VERSION = 4
+HEADER = struct.Struct("<8sHHQQ")
+ALIGNMENT = 8
+CURRENT_FILE = "CURRENT"
+# Код отсутствующего значения в колонке типа dict
+MISSING_CODE = 0xFFFFFFFF
+
+
+class SegmentError(Exception):
+    """Сегмента нет, он повреждён или несовместим"""
+
+
+def segment_file_name(generation: int) -> str:
+    """Имя файла сегмента поколения"""
+    return f"catalog-{generation:010d}.seg"
+
+
+class StrColumn(Sequence):
+    """Колонка строк поверх смещений и UTF-8 данных сегмента"""
+
+    __slots__ = ("_offsets", "_data")
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _value(self, row: int) -> Any:
+        offsets = self._offsets
+        return str(self._data[offsets[row]:offsets[row + 1]], "utf-8")
+
+    @overload
+    def __getitem__(self, row: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, row: slice) -> List[Any]: ...
+
+    def __getitem__(self, row: Union[int, slice]) -> Any:
+        if isinstance(row, slice):
+            return [self._value(i) for i in range(*row.indices(len(self)))]
+        return self._value(row)
+
+    def __iter__(self) -> Iterator[Any]:
+        for row in range(len(self)):
+            yield self._value(row)
+
+
+class JsonColumn(StrColumn):
+    """Колонка произвольных значений (JSON каждого значения, пусто — MISSING)"""
+
+    __slots__ = ()
+
+    def _value(self, row: int) -> Any:
+        offsets = self._offsets
+        start, end = offsets[row], offsets[row + 1]
+        if start == end:
+            return MISSING
+        return json.loads(str(self._data[start:end], "utf-8"))
+
+
+class DictColumn(Sequence):
+    """Колонка повторяющихся значений: коды строк + словарь значений"""
+
+    __slots__ = ("_codes", "_values")
+
+    def __init__(self, codes: memoryview, values: List[Any]):
+        self._codes = codes
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def _value(self, row: int) -> Any:
+        code = self._codes[row]
+        return MISSING if code == MISSING_CODE else self._values[code]
+
+    @overload
+    def __getitem__(self, row: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, row: slice) -> List[Any]: ...
+
+    def __getitem__(self, row: Union[int, slice]) -> Any:
+        if isinstance(row, slice):
+            return [self._value(i) for i in range(*row.indices(len(self)))]
+        return self._value(row)
+
+    def __iter__(self) -> Iterator[Any]:
+        values = self._values
+        for code in self._codes:
+            yield MISSING if code == MISSING_CODE else values[code]
+
+
+def _pack_offsets(chunks: List[bytes]) -> Tuple[bytes, bytes]:
+    """Смещения (uint64, на одно больше числа значений) и склеенные данные"""
+    offsets = array("Q", [0])
+    position = 0
+    for chunk in chunks:
+        position += len(chunk)
+        offsets.append(position)
+    return offsets.tobytes(), b"".join(chunks)
+
+
+def _is_plain(value: Any) -> bool:
+    """Значение можно положить в словарь колонки dict"""
+    return value is None or type(value) in (str, int, float, bool)
+
+
+def _encode_column(values: Sequence) -> Tuple[str, List[bytes], Dict[str, Any]]:
+    """
+    Закодировать колонку
+
+    Returns:
+        (тип, блоки данных, дополнительные метаданные)
+    """
+    if isinstance(values, array) and values.typecode in ("q", "d"):
+        return ("int64" if values.typecode == "q" else "float64"), [values.tobytes()], {}
+    # Колонки уже отображённого сегмента (снимок читателя сохраняется в файл)
+    if isinstance(values, memoryview) and values.format in ("q", "d"):
+        return ("int64" if values.format == "q" else "float64"), [values.tobytes()], {}
+
+    count = len(values)
+    if all(type(value) is str for value in values):
+        distinct = set(values)
+        if len(distinct) > count // 2:
+            return "str", list(_pack_offsets([value.encode("utf-8") for value in values])), {}
+
+    if all(value is MISSING or _is_plain(value) for value in values):
+        codes_by_value: Dict[Any, int] = {}
+        dictionary: List[Any] = []
+        codes = array("I")
+        for value in values:
+            if value is MISSING:
+                codes.append(MISSING_CODE)
+                continue
+            # True и 1 равны как ключи dict — различаем по типу
+            key = (type(value), value)
+            code = codes_by_value.get(key)
+            if code is None:
+                code = codes_by_value[key] = len(dictionary)
+                dictionary.append(value)
+            codes.append(code)
+        if len(dictionary) <= max(1, count // 2):
+            return "dict", [codes.tobytes()], {"values": dictionary}
+
+    chunks = [
+        b"" if value is MISSING else json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+        for value in values
+    ]
+    return "json", list(_pack_offsets(chunks)), {}
+
+
+def _write_blocks(f: Any, blocks: List[bytes], digest: Any) -> List[List[int]]:
+    """Записать блоки с выравниванием (и добавить их в digest), вернуть [[смещение, длина], ...]"""
+    spans = []
+    for block in blocks:
+        padding = -f.tell() % ALIGNMENT
+        if padding:
+            f.write(b"\0" * padding)
+            digest.update(b"\0" * padding)
+        spans.append([f.tell(), len(block)])
+        f.write(block)
+        digest.update(block)
+    return spans
+
+
+def write_segment_file(path: str, snapshot: CatalogSnapshot) -> int:
+    """
+    Записать снимок в файл формата сегмента атомарно (через временный файл и os.replace)
+
+    Args:
+        path: Путь к файлу
+        snapshot: Опубликованный снимок
+
+    Returns:
+        Размер записанного файла в байтах
+    """
+    store = snapshot.offers
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    columns = [(name, store._data[index]) for index, name in enumerate(store.columns)]
+    # Производные колонки тоже в сегменте: воркеры не нормализуют названия заново
+    derived = [
+        ("prices", store.prices),
+        ("clean_names", store.clean_names),
+        ("normalized_names", store.normalized_names),
+        ("attributes", store.attributes),
+        ("lower_titles", snapshot.postings.lower_titles),
+    ]
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".segment-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            digest = hashlib.sha256()
+            described: Dict[str, List[Dict[str, Any]]] = {}
+            for group, items in (("columns", columns), ("derived", derived)):
+                described[group] = []
+                for name, values in items:
+                    kind, blocks, extra = _encode_column(values)
+                    described[group].append(
+                        {"name": name, "kind": kind, "blocks": _write_blocks(f, blocks, digest), **extra}
+                    )
+
+            meta = json.dumps(
+                {
+                    "generation": snapshot.generation,
+                    "loaded_at": snapshot.loaded_at.isoformat() if snapshot.loaded_at else None,
+                    "watermark": list(snapshot.watermark) if snapshot.watermark else None,
+                    "count": len(store),
+                    "normalizer": store.normalizer_fingerprint,
+                    "byteorder": sys.byteorder,
+                    "checksum": digest.hexdigest(),
+                    **described,
+                },
+                ensure_ascii=False,
+                default=str
+            ).encode("utf-8")
+            meta_offset = f.tell()
+            f.write(meta)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, meta_offset, len(meta)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    return meta_offset + len(meta)
+
+
+def write_segment(directory: str, snapshot: CatalogSnapshot, keep: int = 2) -> str:
+    """
+    Записать снимок в новый сегмент и сделать его текущим
+
+    Args:
+        directory: Каталог сегментов
+        snapshot: Опубликованный снимок
+        keep: Сколько последних сегментов оставлять на диске
+
+    Returns:
+        Путь к файлу сегмента
+    """
+    file_name = segment_file_name(snapshot.generation)
+    path = os.path.join(directory, file_name)
+    write_segment_file(path, snapshot)
+
+    _write_current(directory, snapshot.generation, file_name, snapshot.loaded_at)
+    _remove_old_segments(directory, keep=max(1, keep))
+    return path
+
+
+def _write_current(directory: str, generation: int, file_name: str, verified_at: Optional[datetime]) -> None:
+    """Атомарно переключить CURRENT на сегмент"""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".current-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({
+            "generation": generation,
+            "file": file_name,
+            "verified_at": verified_at.isoformat() if verified_at else None,
+        }, f)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+
+def mark_verified(directory: str, generation: int, verified_at: datetime) -> bool:
+    """
+    Отметить, что текущее поколение сверено с источником и не изменилось
+
+    Читатели берут это время для возраста снимка, поэтому delta-обновление
+    без изменений не делает их каталог устаревшим.
+
+    Returns:
+        False если текущим уже стало другое поколение (отметка не записана)
+    """
+    current = read_current(directory)
+    if current is None or current["generation"] != generation:
+        return False
+    _write_current(directory, generation, current["file"], verified_at)
+    return True
+
+
+def _remove_old_segments(directory: str, keep: int) -> None:
+    """Удалить сегменты старше keep последних"""
+    segments = sorted(name for name in os.listdir(directory) if name.startswith("catalog-") and name.endswith(".seg"))
+    for name in segments[:-keep]:
+        try:
+            os.unlink(os.path.join(directory, name))
+        except OSError as e:
+            logger.warning(f"Cannot remove old segment {name}: {e}")
+
+
+def read_current(directory: str) -> Optional[Dict[str, Any]]:
+    """
+    Текущее поколение сегмента
+
+    Returns:
+        {"generation": N, "file": имя файла} или None, если сегмента ещё нет
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            current = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        raise SegmentError(f"Cannot read {CURRENT_FILE} in {directory}: {e}") from e
+    if not isinstance(current, dict) or not isinstance(current.get("generation"), int):
+        raise SegmentError(f"Malformed {CURRENT_FILE} in {directory}")
+    return current
+
+
+def _decode_column(buffer: memoryview, column: Dict[str, Any]) -> Sequence:
+    """Колонка поверх отображённого файла"""
+    blocks = [buffer[offset:offset + length] for offset, length in column["blocks"]]
+    kind = column["kind"]
+    if kind == "int64":
+        return blocks[0].cast("q")
+    if kind == "float64":
+        return blocks[0].cast("d")
+    if kind == "str":
+        return StrColumn(blocks[0].cast("Q"), blocks[1])
+    if kind == "json":
+        return JsonColumn(blocks[0].cast("Q"), blocks[1])
+    if kind == "dict":
+        return DictColumn(blocks[0].cast("I"), column["values"])
+    raise SegmentError(f"Unknown column kind {kind!r}")
+
+
+def open_segment(path: str, verify: bool = False) -> CatalogSnapshot:
+    """
+    Подключиться к файлу сегмента только на чтение
+
+    Args:
+        path: Путь к файлу сегмента
+        verify: Сверить sha256 блоков колонок (читает файл целиком,
+            но ничего не десериализует)
+
+    Returns:
+        CatalogSnapshot, колонки которого читаются прямо из отображённого файла
+
+    Raises:
+        SegmentError: файла нет, он повреждён, другой версии формата
+            или построен с другими словарями нормализатора
+    """
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SegmentError(f"Cannot open segment {path}: {e}") from e
+
+    if len(mm) < HEADER.size:
+        raise SegmentError(f"Segment {path} is truncated")
+    magic, version, _, meta_offset, meta_len = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise SegmentError(f"{path} is not a catalog segment")
+    if version != FORMAT_VERSION:
+        raise SegmentError(f"Segment format v{version}, expected v{FORMAT_VERSION}")
+    if meta_offset + meta_len != len(mm):
+        raise SegmentError(f"Segment {path} is truncated")
+
+    try:
+        meta = json.loads(mm[meta_offset:meta_offset + meta_len])
+    except ValueError as e:
+        raise SegmentError(f"Segment {path} metadata is corrupted: {e}") from e
+    if meta["byteorder"] != sys.byteorder:
+        raise SegmentError(f"Segment {path} was written on a {meta['byteorder']}-endian host")
+    # Нормализованные названия сегмента должны совпадать с теми, что посчитает этот процесс
+    if meta["normalizer"] != refresh_normalizer():
+        raise SegmentError(f"Segment {path} was built with other normalizer dictionaries")
+
+    # Колонки — срезы memoryview: отображение живёт, пока на него ссылается снимок
+    buffer = memoryview(mm)
+    if verify and hashlib.sha256(buffer[HEADER.size:meta_offset]).hexdigest() != meta["checksum"]:
+        raise SegmentError(f"Segment {path} checksum mismatch")
+    columns = [_decode_column(buffer, column) for column in meta["columns"]]
+    derived = {column["name"]: _decode_column(buffer, column) for column in meta["derived"]}
+
+    store = OfferStore(
+        tuple(column["name"] for column in meta["columns"]),
+        columns,
+        derived["prices"],
+        derived["clean_names"],
+        derived["normalized_names"],
+        derived["attributes"],
+        meta["normalizer"]
+    )
+    return CatalogSnapshot.from_store(
+        store,
+        generation=meta["generation"],
+        loaded_at=datetime.fromisoformat(meta["loaded_at"]) if meta["loaded_at"] else None,
+        watermark=tuple(meta["watermark"]) if meta["watermark"] else None,
+        lower_titles=derived["lower_titles"]
+    )
+
+
+def attach_segment(directory: str) -> CatalogSnapshot:
+    """
+    Подключиться к текущему сегменту каталога (для воркеров и CLI-инструментов)
+
+    Args:
+        directory: Каталог сегментов (CACHE_SHARED_DIR)
+
+    Returns:
+        CatalogSnapshot текущего поколения
+
+    Raises:
+        SegmentError: сегмента ещё нет или он непригоден
+    """
+    current = read_current(directory)
+    if current is None:
+        raise SegmentError(f"No catalog segment in {directory} yet")
+    return open_segment(os.path.join(directory, current["file"]))
@@ -0,0 +1,269 @@
+"""
+Неизменяемый снимок каталога
+
+Снимок строится целиком при полной загрузке кэша, а при delta-обновлении
+собирается из предыдущего с заменой изменившихся строк. Новый снимок
+подменяет текущий атомарно (одной операцией присваивания ссылки), поэтому
+читатели работают без блокировок и копирования и видят одну согласованную
+версию каталога.
+"""
+from array import array
+from datetime import datetime
+from types import MappingProxyType
+from typing import List, Dict, AbstractSet, Any, Iterable, Mapping, Optional, Sequence, Tuple
+from app.cache.catalog_index import CatalogIndex, build_catalog_index, patch_catalog_index
+from app.cache.offer_store import OfferRow, OfferStore, normalize_offer_id, plan_rows
+from app.cache.postings import OfferPostings, TitleText
+from app.services.title_normalizer import refresh_normalizer
+
+
+class CatalogSnapshot:
+    """
+    Снимок каталога одного поколения (generation)
+
+    Все поля только для чтения: офферы хранятся по колонкам в OfferStore,
+    индексы обёрнуты в MappingProxyType и хранят номера строк.
+    """
+
+    __slots__ = (
+        "generation",
+        "offers",
+        "offers_by_seller",
+        "unique_sellers",
+        "seller_info",
+        "catalog_index",
+        "postings",
+        "loaded_at",
+        "watermark",
+        "_title_text",
+    )
+
+    def __init__(
+            self,
+            generation: int,
+            offers: OfferStore,
+            offers_by_seller: Mapping[str, array],
+            seller_info: Mapping[str, Dict[str, Any]],
+            catalog_index: CatalogIndex,
+            postings: OfferPostings,
+            loaded_at: Optional[datetime],
+            watermark: Optional[Tuple[str, Any]] = None
+    ):
+        self.generation = generation
+        self.offers = offers
+        self.offers_by_seller = offers_by_seller
+        self.unique_sellers: Tuple[str, ...] = tuple(sorted(offers_by_seller))
+        self.seller_info = seller_info
+        self.catalog_index = catalog_index
+        # Вторичные индексы для фильтров /api/offers
+        self.postings = postings
+        self.loaded_at = loaded_at
+        # (колонка, значение) — с какого места забирать изменения при delta-обновлении
+        self.watermark = watermark
+        # Названия одной строкой для поиска подстроки (строятся при первом обращении)
+        self._title_text: Optional[Tuple[TitleText, TitleText]] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """Снимок построен из загруженных данных (а не пустой стартовый)"""
+        return self.generation > 0
+
+    @classmethod
+    def empty(cls) -> "CatalogSnapshot":
+        """Пустой снимок до первой загрузки"""
+        return cls.from_store(OfferStore.build([]), generation=0, loaded_at=None)
+
+    @classmethod
+    def build(
+            cls,
+            offers: Iterable[Mapping[str, Any]],
+            generation: int,
+            previous: Optional["CatalogSnapshot"] = None,
+            watermark: Optional[Tuple[str, Any]] = None
+    ) -> "CatalogSnapshot":
+        """
+        Построить снимок и все производные структуры из офферов БД
+
+        Args:
+            offers: Офферы из БД (dict или строки предыдущего снимка)
+            generation: Номер поколения снимка
+            previous: Предыдущий снимок для переиспользования производных полей
+            watermark: Водяной знак для следующего delta-обновления
+
+        Returns:
+            CatalogSnapshot
+        """
+        store = OfferStore.build(offers, previous=previous.offers if previous is not None else None)
+        return cls.from_store(store, generation, loaded_at=datetime.now(), watermark=watermark)
+
+    @classmethod
+    def from_store(
+            cls,
+            store: OfferStore,
+            generation: int,
+            loaded_at: Optional[datetime],
+            watermark: Optional[Tuple[str, Any]] = None,
+            lower_titles: Optional[Sequence[str]] = None
+    ) -> "CatalogSnapshot":
+        """
+        Построить снимок поверх готового хранилища (например, из файла снимка)
+
+        Args:
+            store: Колоночное хранилище офферов
+            generation: Номер поколения снимка
+            loaded_at: Время загрузки данных из БД
+            watermark: Водяной знак для следующего delta-обновления
+            lower_titles: Готовые названия в нижнем регистре для индексов
+
+        Returns:
+            CatalogSnapshot
+        """
+        return cls.from_index(
+            store,
+            build_catalog_index(store, version=generation),
+            OfferPostings.build(store, lower_titles=lower_titles),
+            generation,
+            loaded_at=loaded_at,
+            watermark=watermark
+        )
+
+    @classmethod
+    def patch(
+            cls,
+            previous: "CatalogSnapshot",
+            replaced: Mapping[int, Mapping[str, Any]],
+            added: Sequence[Mapping[str, Any]],
+            deleted: AbstractSet[int],
+            generation: int,
+            watermark: Optional[Tuple[str, Any]] = None
+    ) -> "CatalogSnapshot":
+        """
+        Снимок из предыдущего с заменой отдельных строк (delta-обновление, приём изменений)
+
+        Нормализуются только новые и изменённые офферы, индекс каталога
+        перестраивается только для продавцов с затронутыми строками, posting
+        lists переиспользуются, если ключи фильтров не менялись. Если словари
+        нормализатора изменились, снимок строится целиком.
+
+        Args:
+            previous: Текущий снимок
+            replaced: Номер строки → новое содержимое оффера
+            added: Новые офферы
+            deleted: Номера удалённых строк
+            generation: Номер поколения снимка
+            watermark: Водяной знак для следующего delta-обновления
+
+        Returns:
+            CatalogSnapshot
+        """
+        previous_store = previous.offers
+        sources, size = plan_rows(len(previous_store), replaced, added, deleted)
+        if previous_store.normalizer_fingerprint != refresh_normalizer():
+            offers = (sources.get(row, row) for row in range(size))
+            return cls.build(
+                (previous_store.row(source) if isinstance(source, int) else source for source in offers),
+                generation,
+                previous=previous,
+                watermark=watermark
+            )
+
+        store = previous_store.patch(sources, size)
+        touched_rows = sources.keys() | range(size, len(previous_store))
+        return cls.from_index(
+            store,
+            patch_catalog_index(previous.catalog_index, previous_store, store, touched_rows, version=generation),
+            OfferPostings.patch(previous.postings, previous_store, store, touched_rows),
+            generation,
+            loaded_at=datetime.now(),
+            watermark=watermark
+        )
+
+    @classmethod
+    def from_index(
+            cls,
+            store: OfferStore,
+            catalog_index: CatalogIndex,
+            postings: OfferPostings,
+            generation: int,
+            loaded_at: Optional[datetime],
+            watermark: Optional[Tuple[str, Any]] = None
+    ) -> "CatalogSnapshot":
+        """Собрать снимок из хранилища и готовых индексов"""
+        # Офферы продавцов — те же номера строк, что и в индексе каталога
+        offers_by_seller = {
+            seller_name: seller["offers"].rows
+            for seller_name, seller in catalog_index.sellers.items()
+        }
+        seller_info = {
+            seller_name: {"name": seller_name, "id": seller_name}
+            for seller_name in offers_by_seller
+        }
+
+        return cls(
+            generation=generation,
+            offers=store,
+            offers_by_seller=MappingProxyType(offers_by_seller),
+            seller_info=MappingProxyType(seller_info),
+            catalog_index=catalog_index,
+            postings=postings,
+            loaded_at=loaded_at,
+            watermark=watermark,
+        )
+
+    def memory_structures(self) -> List[Tuple[str, Any]]:
+        """
+        Структуры снимка для учёта памяти (в порядке приоритета учёта)
+
+        Общие объекты относятся к первой структуре, в которой встретились,
+        поэтому производные колонки идут раньше хранилища, а группы — после него.
+        """
+        store = self.offers
+        return [
+            ("normalized_titles", (
+                store.clean_names, store.normalized_names, self.postings.lower_titles, self._title_text
+            )),
+            ("offer_id_index", store.row_by_id),
+            ("offers", store),
+            ("category_buckets", tuple(seller["categories"] for seller in self.catalog_index.sellers.values())),
+            ("token_index", tuple(seller["search"] for seller in self.catalog_index.sellers.values())),
+            ("seller_groups", self.catalog_index),
+            ("postings", self.postings),
+            ("seller_info", (self.offers_by_seller, self.seller_info)),
+        ]
+
+    def title_text(self) -> Tuple[TitleText, TitleText]:
+        """
+        Названия в нижнем регистре и нормализованные названия в порядке строк хранилища
+
+        Собираются из готовых колонок (lower_titles индексов и normalized_names)
+        при первом обращении и живут, пока жив снимок.
+        """
+        title_text = self._title_text
+        if title_text is None:
+            postings = self.postings
+            lower_titles: List[str] = [""] * len(self.offers)
+            for rank, row in enumerate(postings.order):
+                lower_titles[row] = postings.lower_titles[rank]
+            title_text = (TitleText(lower_titles), TitleText(self.offers.normalized_names))
+            self._title_text = title_text
+        return title_text
+
+    def get_offer(self, offer_id: Any) -> Optional[OfferRow]:
+        """Получить оффер по ID за O(1)"""
+        row = self.offers.find_row(offer_id)
+        return self.offers.row(row) if row is not None else None
+
+    def get_offers_by_ids(self, offer_ids: Iterable[Any]) -> Dict[Any, OfferRow]:
+        """Получить найденные офферы {offer_id: оффер} в порядке запроса"""
+        found: Dict[Any, OfferRow] = {}
+        for offer_id in offer_ids:
+            key = normalize_offer_id(offer_id)
+            row = self.offers.row_by_id.get(key)
+            if row is not None:
+                found[key] = self.offers.row(row)
+        return found
+
+    def get_offers_by_seller(self, seller_name: str) -> Sequence[OfferRow]:
+        """Получить офферы продавца"""
+        rows = self.offers_by_seller.get(seller_name)
+        return self.offers.rows(rows) if rows is not None else ()
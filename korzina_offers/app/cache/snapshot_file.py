@@ -0,0 +1,60 @@
+"""
+Файл снимка каталога для быстрого тёплого старта
+
+Каждый опубликованный снимок сохраняется на диск вместе с предрассчитанными
+нормализованными названиями и атрибутами. При старте воркер поднимает
+каталог из файла без обращения к БД и без повторной нормализации, а свежие
+изменения догружает delta-обновлением в фоне.
+
+Файл снимка — один сегмент в формате общего сегмента каталога
+(shared_segment): заголовок, сырые колонки фиксированной ширины, таблицы
+строк и JSON-метаданные. Файл отображается в память (mmap), колонки читаются
+из него без десериализации (заново строятся только индексы по номерам строк),
+а содержимое файла никогда не исполняется как код.
+При чтении сверяется sha256 блоков колонок — это защита от повреждения
+файла, а не подпись.
+"""
+from app.cache.shared_segment import SegmentError, open_segment, write_segment_file
+from app.cache.snapshot import CatalogSnapshot
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SnapshotFileError(Exception):
+    """Файл снимка отсутствует, повреждён или несовместим"""
+
+
+def write_snapshot_file(path: str, snapshot: CatalogSnapshot) -> int:
+    """
+    Сохранить снимок в файл атомарно (через временный файл и os.replace)
+
+    Args:
+        path: Путь к файлу снимка
+        snapshot: Опубликованный снимок
+
+    Returns:
+        Размер записанного файла в байтах
+    """
+    return write_segment_file(path, snapshot)
+
+
+def read_snapshot_file(path: str) -> CatalogSnapshot:
+    """
+    Восстановить снимок из файла
+
+    Args:
+        path: Путь к файлу снимка
+
+    Returns:
+        CatalogSnapshot того же поколения и с тем же водяным знаком,
+        колонки которого читаются из отображённого файла
+
+    Raises:
+        SnapshotFileError: файла нет, он повреждён, другой версии формата
+            или построен с другими словарями нормализатора
+    """
+    try:
+        return open_segment(path, verify=True)
+    except SegmentError as e:
+        raise SnapshotFileError(str(e)) from e
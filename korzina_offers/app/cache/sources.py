@@ -0,0 +1,412 @@
+"""
+Источники данных каталога для кэша
+
+CacheManager не зависит от конкретной БД: он работает с источником,
+который умеет полную загрузку, выборку изменений после водяного знака
+(обе — с проекцией на горячие колонки), догрузку холодных полей по ID
+и проверку доступности.
+
+    - SupabaseCatalogSource — таблица analog_offers в Supabase (PostgREST),
+      постраничная параллельная загрузка через PagedLoader;
+    - LocalCatalogSource — локальный файл: SQLite-база с таблицей
+      analog_offers или JSON/NDJSON-фикстура. Нужен для бенчмарков и
+      нагрузочных тестов без живого проекта Supabase.
+
+Источник выбирается настройкой DATA_SOURCE (см. create_data_source).
+"""
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+import httpx
+from supabase import Client, ClientOptions, create_client
+from app.cache.loader import PagedLoader, PageLoadError
+from app.cache.offer_store import normalize_offer_id
+from app.cache.postings import offer_id_key
+from app.config import Config, config
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+OFFERS_TABLE = "analog_offers"
+
+DATA_SOURCE_SUPABASE = "supabase"
+DATA_SOURCE_LOCAL = "local"
+DATA_SOURCES = (DATA_SOURCE_SUPABASE, DATA_SOURCE_LOCAL)
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Сколько ID передавать в одном запросе холодных полей
+DETAILS_CHUNK_SIZE = 200
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    """Разбить список на части не длиннее size"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CatalogDataSource(ABC):
+    """Источник офферов каталога"""
+
+    # Имя источника для логов и /api/cache/info
+    name = "abstract"
+
+    @abstractmethod
+    def load_all(self, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Загрузить все офферы, упорядоченные по offer_id
+
+        Args:
+            columns: Загружаемые колонки (None — все)
+
+        Raises:
+            Exception: загрузка не удалась
+        """
+
+    @abstractmethod
+    def load_changes(
+            self,
+            column: str,
+            value: Any,
+            columns: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Загрузить офферы, изменившиеся начиная с водяного знака
+
+        Для колонки offer_id выбираются только строки строго после value
+        (новые офферы), для колонки времени изменения — начиная с value
+        включительно. Строки упорядочены по column, затем по offer_id.
+
+        Args:
+            column: Колонка водяного знака
+            value: Значение водяного знака
+            columns: Загружаемые колонки (None — все)
+        """
+
+    @abstractmethod
+    def load_details(self, offer_ids: Sequence[Any], columns: Sequence[str]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Загрузить холодные поля нескольких офферов
+
+        Args:
+            offer_ids: ID офферов
+            columns: Колонки без offer_id
+
+        Returns:
+            {offer_id: {колонка: значение}} для найденных офферов
+        """
+
+    @abstractmethod
+    def ping(self) -> None:
+        """
+        Минимальный запрос к источнику
+
+        Raises:
+            Exception: источник недоступен
+        """
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+def default_loader() -> PagedLoader:
+    """PagedLoader с параметрами из конфигурации"""
+    return PagedLoader(
+        page_size=config.CACHE_PAGE_SIZE,
+        max_workers=config.CACHE_LOAD_CONCURRENCY,
+        max_retries=config.CACHE_PAGE_RETRIES,
+        backoff_seconds=config.CACHE_RETRY_BACKOFF
+    )
+
+
+class SupabaseCatalogSource(CatalogDataSource):
+    """Таблица офферов в Supabase"""
+
+    name = DATA_SOURCE_SUPABASE
+
+    def __init__(self, client: Client, loader: Optional[PagedLoader] = None):
+        """
+        Args:
+            client: Клиент Supabase
+            loader: Постраничный загрузчик (по умолчанию — из конфигурации)
+        """
+        self.client = client
+        self.loader = loader or default_loader()
+        # Страницы неудачной полной загрузки сохраняются, чтобы следующая
+        # попытка догрузила только недостающие
+        self._resume_pages: Optional[Tuple[int, Dict[int, List[Dict[str, Any]]]]] = None
+
+    def _offers_table(self) -> Any:
+        """Запрос к таблице офферов"""
+        return self.client.table(OFFERS_TABLE)
+
+    def _select(self, projection: Optional[Sequence[str]], *columns: str, **kwargs: Any) -> Any:
+        """select() с проекцией: страницы PagedLoader ("*") читают только нужные колонки"""
+        if projection and columns == ("*",):
+            columns = tuple(projection)
+        return self._offers_table().select(*columns, **kwargs)
+
+    def load_all(self, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        resume_total, resume_pages = self._resume_pages or (None, None)
+        try:
+            rows = self.loader.load(
+                lambda *selected, **kwargs: self._select(columns, *selected, **kwargs).order("offer_id"),
+                resume=resume_pages,
+                expected_total=resume_total
+            )
+        except PageLoadError as e:
+            self._resume_pages = (e.total, e.completed)
+            raise
+        self._resume_pages = None
+        return rows
+
+    def load_changes(
+            self,
+            column: str,
+            value: Any,
+            columns: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        if column == "offer_id":
+            return self.loader.load(
+                lambda *selected, **kwargs: self._select(columns, *selected, **kwargs)
+                .gt(column, value).order(column)
+            )
+        return self.loader.load(
+            lambda *selected, **kwargs: self._select(columns, *selected, **kwargs)
+            .gte(column, value).order(column).order("offer_id")
+        )
+
+    def load_details(self, offer_ids: Sequence[Any], columns: Sequence[str]) -> Dict[Any, Dict[str, Any]]:
+        details: Dict[Any, Dict[str, Any]] = {}
+        for chunk in _chunks(list(offer_ids), DETAILS_CHUNK_SIZE):
+            result = self._offers_table().select("offer_id", *columns).in_("offer_id", list(chunk)).execute()
+            for row in result.data or []:
+                offer_id = row.pop("offer_id", None)
+                details[offer_id] = row
+        return details
+
+    def ping(self) -> None:
+        self._offers_table().select("offer_id").limit(1).execute()
+
+
+class LocalCatalogSource(CatalogDataSource):
+    """
+    Локальный файл каталога: SQLite (.db/.sqlite/.sqlite3) или JSON/NDJSON
+
+    SQLite-база должна содержать таблицу analog_offers; текстовые значения
+    с JSON-массивами и объектами (например, tags) декодируются.
+    JSON-файл — массив офферов, любой другой — NDJSON (оффер на строку).
+    Файл перечитывается при каждой загрузке, поэтому изменения фикстуры
+    видны delta-обновлению.
+    """
+
+    name = DATA_SOURCE_LOCAL
+
+    def __init__(self, path: str, page_size: Optional[int] = None):
+        """
+        Args:
+            path: Путь к файлу каталога
+            page_size: Сколько строк SQLite читать за раз
+        """
+        self.path = path
+        self.page_size = page_size or config.CACHE_PAGE_SIZE
+
+    @property
+    def is_sqlite(self) -> bool:
+        """Файл — база SQLite"""
+        return self.path.lower().endswith(SQLITE_EXTENSIONS)
+
+    def load_all(self, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        if self.is_sqlite:
+            return self._query_sqlite(columns, "", (), "offer_id")
+        offers = sorted(self._read_fixture(), key=lambda offer: offer_id_key(offer.get("offer_id")))
+        return self._project(offers, columns)
+
+    def load_changes(
+            self,
+            column: str,
+            value: Any,
+            columns: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        strict = column == "offer_id"
+        if self.is_sqlite:
+            operator = ">" if strict else ">="
+            quoted = self._quote_columns([column], strict=True)
+            return self._query_sqlite(columns, f"WHERE {quoted} {operator} ?", (value,), f"{quoted}, offer_id")
+
+        changed = [
+            offer for offer in self._read_fixture()
+            if self._is_after(offer.get(column), value, strict)
+        ]
+        changed.sort(key=lambda offer: (offer[column], offer_id_key(offer.get("offer_id"))))
+        return self._project(changed, columns)
+
+    def load_details(self, offer_ids: Sequence[Any], columns: Sequence[str]) -> Dict[Any, Dict[str, Any]]:
+        if self.is_sqlite:
+            details: Dict[Any, Dict[str, Any]] = {}
+            for chunk in _chunks(list(offer_ids), DETAILS_CHUNK_SIZE):
+                placeholders = ", ".join("?" * len(chunk))
+                for row in self._query_sqlite(
+                        ["offer_id", *columns], f"WHERE offer_id IN ({placeholders})", tuple(chunk), "offer_id"
+                ):
+                    details[row.pop("offer_id", None)] = row
+            return details
+
+        wanted = {normalize_offer_id(offer_id) for offer_id in offer_ids}
+        return {
+            offer["offer_id"]: {column: offer[column] for column in columns if column in offer}
+            for offer in self._read_fixture()
+            if normalize_offer_id(offer.get("offer_id")) in wanted
+        }
+
+    def ping(self) -> None:
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(f"Catalog file {self.path} does not exist")
+        if self.is_sqlite:
+            with self._connect() as connection:
+                connection.execute(f"SELECT offer_id FROM {OFFERS_TABLE} LIMIT 1").fetchall()
+
+    @staticmethod
+    def _is_after(current: Any, value: Any, strict: bool) -> bool:
+        """Значение колонки не раньше водяного знака (несравнимые пропускаются)"""
+        if current is None:
+            return False
+        try:
+            return current > value if strict else current >= value
+        except TypeError:
+            return False
+
+    def _read_fixture(self) -> List[Dict[str, Any]]:
+        """Прочитать офферы из JSON-массива или NDJSON"""
+        with open(self.path, encoding="utf-8") as f:
+            if self.path.lower().endswith(".json"):
+                offers = json.load(f)
+                if not isinstance(offers, list):
+                    raise ValueError(f"{self.path}: expected a JSON array of offers")
+                return offers
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой только на чтение"""
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(f"Catalog file {self.path} does not exist")
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    @staticmethod
+    def _project(offers: List[Dict[str, Any]], columns: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        """Оставить в офферах только выбранные колонки"""
+        if not columns:
+            return offers
+        return [{column: offer[column] for column in columns if column in offer} for offer in offers]
+
+    def _quote_columns(self, columns: Sequence[str], strict: bool = False) -> str:
+        """
+        Список колонок для SQL (только существующие колонки таблицы)
+
+        Args:
+            columns: Имена колонок
+            strict: Ошибка, если колонки нет (иначе она пропускается,
+                как отсутствующее в фикстуре поле)
+        """
+        with self._connect() as connection:
+            existing = {row[1] for row in connection.execute(f"PRAGMA table_info({OFFERS_TABLE})")}
+        quoted = []
+        for column in columns:
+            if column not in existing:
+                if strict:
+                    raise ValueError(f"Column {column!r} not found in {OFFERS_TABLE}")
+                continue
+            quoted.append('"' + column.replace('"', '""') + '"')
+        return ", ".join(quoted)
+
+    def _query_sqlite(
+            self,
+            columns: Optional[Sequence[str]],
+            where: str,
+            params: Tuple[Any, ...],
+            order_by: str
+    ) -> List[Dict[str, Any]]:
+        """Выбрать офферы из SQLite страницами по page_size"""
+        selected = (self._quote_columns(columns) or "offer_id") if columns else "*"
+        rows: List[Dict[str, Any]] = []
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                f"SELECT {selected} FROM {OFFERS_TABLE} {where} ORDER BY {order_by}", params
+            )
+            columns = [description[0] for description in cursor.description]
+            while True:
+                batch = cursor.fetchmany(self.page_size)
+                if not batch:
+                    break
+                rows.extend(
+                    {column: self._decode(value) for column, value in zip(columns, values)}
+                    for values in batch
+                )
+        finally:
+            connection.close()
+        return rows
+
+    @staticmethod
+    def _decode(value: Any) -> Any:
+        """Декодировать JSON-массивы и объекты, сохранённые текстом"""
+        if isinstance(value, str) and value[:1] in ("[", "{"):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        return value
+
+    def __repr__(self) -> str:
+        return f"LocalCatalogSource({self.path!r})"
+
+
+def create_supabase_client(settings: Config = config) -> Client:
+    """
+    Клиент Supabase с общим пулом соединений keep-alive
+
+    Все запросы процесса (страницы загрузки, холодные поля, проверки
+    доступности) идут через один пул: соединения переиспользуются,
+    а одновременно открыто не больше SUPABASE_POOL_SIZE — лишние запросы
+    ждут свободное соединение не дольше SUPABASE_TIMEOUT.
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_POOL_SIZE,
+            max_keepalive_connections=settings.SUPABASE_POOL_SIZE,
+            keepalive_expiry=settings.SUPABASE_KEEPALIVE_SECONDS
+        ),
+        timeout=settings.SUPABASE_TIMEOUT
+    )
+    options = ClientOptions(httpx_client=http_client, postgrest_client_timeout=settings.SUPABASE_TIMEOUT)
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY, options=options)
+
+
+def create_data_source(settings: Config = config) -> CatalogDataSource:
+    """
+    Создать источник каталога по настройке DATA_SOURCE
+
+    Args:
+        settings: Конфигурация приложения
+
+    Returns:
+        CatalogDataSource
+
+    Raises:
+        ValueError: неизвестный источник или для него не хватает настроек
+    """
+    source = settings.DATA_SOURCE.lower()
+    if source == DATA_SOURCE_LOCAL:
+        if not settings.LOCAL_CATALOG_PATH:
+            raise ValueError("LOCAL_CATALOG_PATH is required for DATA_SOURCE=local")
+        logger.info(f"Using local catalog source: {settings.LOCAL_CATALOG_PATH}")
+        return LocalCatalogSource(settings.LOCAL_CATALOG_PATH)
+
+    if source == DATA_SOURCE_SUPABASE:
+        if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY are required for DATA_SOURCE=supabase")
+        return SupabaseCatalogSource(create_supabase_client(settings))
+
+    raise ValueError(f"Unknown DATA_SOURCE: {settings.DATA_SOURCE} (expected one of {', '.join(DATA_SOURCES)})")
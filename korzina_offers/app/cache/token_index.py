@@ -0,0 +1,175 @@
+"""
+Инвертированный индекс названий продавца для отбора кандидатов
+
+Полный fuzzy-скоринг (три метрики на три варианта названия) дорог, а почти все
+офферы продавца набирают заметно меньше порога FUZZY_THRESHOLDS['low'].
+Индекс строится при загрузке кэша вместе с CatalogIndex и до скоринга
+оставляет только офферы, у которых с запросом есть общее слово или
+достаточная доля общих символьных триграмм слова (опечатки, другие формы
+слова: «малоко» → «молоко», «молочный»).
+"""
+import re
+from array import array
+from collections import Counter
+from math import ceil
+from typing import Dict, Iterable, Mapping, Set, Tuple
+from app.cache.offer_store import OfferStore, patch_postings
+from app.services.product_service import ProductService
+from app.services.title_normalizer import normalize_title
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Минимальная длина индексируемого слова
+MIN_TOKEN_LENGTH = 2
+# Размер символьной n-граммы и минимальная длина слова для n-грамм
+NGRAM_SIZE = 3
+MIN_NGRAM_TOKEN_LENGTH = 4
+# Доля триграмм слова запроса, которые должны встретиться в названии оффера
+# (одна опечатка в середине слова из пяти букв портит две триграммы из трёх)
+MIN_NGRAM_SHARE = 1 / 3
+
+
+def title_tokens(*titles: str) -> Set[str]:
+    """
+    Слова названий для индекса: нижний регистр, без чисел и одиночных символов
+    """
+    tokens: Set[str] = set()
+    for title in titles:
+        for token in _TOKEN_RE.findall(title.lower()):
+            if len(token) >= MIN_TOKEN_LENGTH and not token.isdigit():
+                tokens.add(token)
+    return tokens
+
+
+def query_tokens(query: str) -> Set[str]:
+    """Слова запроса в тех же вариантах, что сравнивает find_best_product_match"""
+    return title_tokens(ProductService.remove_stop_words(query), normalize_title(query))
+
+
+def token_ngrams(token: str) -> Set[str]:
+    """Символьные триграммы слова (пусто для коротких слов)"""
+    if len(token) < MIN_NGRAM_TOKEN_LENGTH:
+        return set()
+    return {token[i:i + NGRAM_SIZE] for i in range(len(token) - NGRAM_SIZE + 1)}
+
+
+def name_tokens(clean_name: str, normalized_name: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Слова и триграммы строки по её очищенному и нормализованному названию"""
+    words = title_tokens(clean_name, normalized_name)
+    grams: Set[str] = set()
+    for word in words:
+        grams.update(token_ngrams(word))
+    return tuple(words), tuple(grams)
+
+
+class TokenIndex:
+    """
+    Слово / триграмма → отсортированные номера строк офферов продавца
+
+    Строится по clean_name и normalized_name хранилища и дальше только читается.
+    """
+
+    __slots__ = ("tokens", "ngrams")
+
+    def __init__(self, tokens: Mapping[str, array], ngrams: Mapping[str, array]):
+        self.tokens = tokens
+        self.ngrams = ngrams
+
+    @classmethod
+    def build(cls, store: OfferStore, rows: Iterable[int]) -> "TokenIndex":
+        """
+        Построить индекс по строкам продавца
+
+        Args:
+            store: Колоночное хранилище офферов снимка
+            rows: Номера строк продавца по возрастанию
+        """
+        tokens: Dict[str, array] = {}
+        ngrams: Dict[str, array] = {}
+        # Повторяющиеся названия разбираем на слова один раз
+        parsed: Dict[Tuple[str, str], Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+
+        for row in rows:
+            names = (store.clean_names[row], store.normalized_names[row])
+            row_tokens = parsed.get(names)
+            if row_tokens is None:
+                row_tokens = parsed[names] = name_tokens(*names)
+
+            words, grams = row_tokens
+            for word in words:
+                posting = tokens.get(word)
+                if posting is None:
+                    posting = tokens[word] = array("I")
+                posting.append(row)
+            for gram in grams:
+                posting = ngrams.get(gram)
+                if posting is None:
+                    posting = ngrams[gram] = array("I")
+                posting.append(row)
+
+        return cls(tokens, ngrams)
+
+    @classmethod
+    def patch(
+            cls,
+            previous: "TokenIndex",
+            previous_store: OfferStore,
+            store: OfferStore,
+            removed_rows: Iterable[int],
+            added_rows: Iterable[int]
+    ) -> "TokenIndex":
+        """
+        Индекс после замены отдельных строк продавца
+
+        Копируются только posting lists слов и триграмм убранных и добавленных строк.
+
+        Args:
+            previous: Индекс продавца в предыдущем снимке
+            previous_store: Хранилище предыдущего снимка (названия убранных строк)
+            store: Новое хранилище (названия добавленных строк)
+            removed_rows: Строки, которые убираются из индекса
+            added_rows: Строки, которые добавляются в индекс
+        """
+        removed: Tuple[Dict[str, Set[int]], Dict[str, Set[int]]] = ({}, {})
+        added: Tuple[Dict[str, Set[int]], Dict[str, Set[int]]] = ({}, {})
+        for changes, source, rows in ((removed, previous_store, removed_rows), (added, store, added_rows)):
+            for row in rows:
+                for index, keys in zip(changes, name_tokens(source.clean_names[row], source.normalized_names[row])):
+                    for key in keys:
+                        index.setdefault(key, set()).add(row)
+        return cls(
+            patch_postings(previous.tokens, removed[0], added[0]),
+            patch_postings(previous.ngrams, removed[1], added[1])
+        )
+
+    def candidates(self, tokens: Iterable[str]) -> array:
+        """
+        Строки, у которых есть общее слово с запросом или похожее на него слово
+
+        Args:
+            tokens: Слова запроса (query_tokens)
+
+        Returns:
+            Отсортированные номера строк (пустой array, если совпадений нет)
+        """
+        rows: Set[int] = set()
+        for token in tokens:
+            posting = self.tokens.get(token)
+            if posting is not None:
+                rows.update(posting)
+
+            grams = token_ngrams(token)
+            if not grams:
+                continue
+            need = max(1, ceil(len(grams) * MIN_NGRAM_SHARE))
+            counts: Counter = Counter()
+            for gram in grams:
+                posting = self.ngrams.get(gram)
+                if posting is not None:
+                    counts.update(posting)
+            rows.update(row for row, count in counts.items() if count >= need)
+
+        return array("I", sorted(rows))
+
+    def __len__(self) -> int:
+        return len(self.tokens)
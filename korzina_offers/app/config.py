@@ -1,7 +1,7 @@
 """
 Конфигурация приложения
 """
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator
 
@@ -20,10 +20,22 @@ class Config(BaseSettings):
     DEBUG: bool = True
     HOST: str = "0.0.0.0"
     PORT: int = 5000
+    WORKERS: int = 0  # Воркеры app.server (0 — по числу ядер)
     
-    # Supabase настройки
-    SUPABASE_URL: str
-    SUPABASE_KEY: str
+    # Источник каталога: "supabase" или "local" (SQLite/JSON/NDJSON-файл)
+    DATA_SOURCE: str = "supabase"
+    LOCAL_CATALOG_PATH: Optional[str] = None  # Файл каталога для DATA_SOURCE=local
+    
+    # Supabase настройки (обязательны для DATA_SOURCE=supabase)
+    SUPABASE_URL: Optional[str] = None
+    SUPABASE_KEY: Optional[str] = None
+    SUPABASE_POOL_SIZE: int = 8  # Общий пул HTTP-соединений (загрузка, холодные поля, проверки)
+    SUPABASE_KEEPALIVE_SECONDS: float = 30.0  # Сколько держать простаивающее соединение открытым
+    SUPABASE_TIMEOUT: float = 30.0  # Таймаут запроса и ожидания свободного соединения, секунды
+    
+    # Фоновая проверка доступности источника для /api/health
+    HEALTH_PROBE_INTERVAL: float = 15.0  # Период проверки, секунды
+    HEALTH_PROBE_MAX_AGE: Optional[float] = None  # Результат старше считается неизвестным (None — 3 периода)
     
     # Логирование
     LOG_LEVEL: str = "INFO"
@@ -34,10 +46,38 @@ class Config(BaseSettings):
     API_TITLE: str = "Korzina Offers API"
     API_DESCRIPTION: str = "Микросервис для поиска товаров в магазинах с интеллектуальным алгоритмом сопоставления"
     CORS_ORIGINS: str = "*"
+    INGEST_TOKEN: Optional[str] = None  # Токен POST /api/offers/ingest (None — приём изменений выключен)
+    
+    # Кэш каталога
+    CACHE_PAGE_SIZE: int = 1000  # Supabase отдаёт не больше 1000 записей за запрос
+    CACHE_LOAD_CONCURRENCY: int = 4  # Сколько страниц загружается одновременно
+    CACHE_PAGE_RETRIES: int = 3  # Повторы на каждую страницу
+    CACHE_RETRY_BACKOFF: float = 0.5  # Базовая задержка между повторами, секунды
+    CACHE_DELTA_COLUMN: str = "updated_at"  # Колонка водяного знака для delta-обновления
+    CACHE_TOMBSTONE_COLUMN: Optional[str] = None  # Колонка-признак удаления (например, is_deleted)
+    CACHE_FULL_REFRESH_EVERY: int = 60  # Полная сверка после N delta-обновлений подряд
+    CACHE_REFRESH_ENABLED: bool = True  # Фоновое обновление кэша
+    CACHE_REFRESH_INTERVAL: float = 300.0  # Период фонового обновления, секунды
+    CACHE_REFRESH_JITTER: float = 30.0  # Случайный разброс периода (±), секунды
+    CACHE_MAX_STALENESS: float = 3600.0  # Время без сверки с источником, после которого снимок считается устаревшим
+    CACHE_SNAPSHOT_PATH: Optional[str] = None  # Файл снимка каталога для тёплого старта
+    CACHE_MEMORY_BUDGET_MB: Optional[float] = None  # Снимок больше бюджета не публикуется
+    CACHE_MEMORY_HISTORY: int = 50  # Сколько последних поколений хранить в истории памяти
+    CACHE_MEMORY_MEASURE_INTERVAL: float = 300.0  # Точный замер памяти после delta не чаще, секунды (между ними — оценка)
+    CACHE_SNAPSHOT_PERSIST_INTERVAL: float = 300.0  # Файл снимка после delta перезаписывается не чаще, секунды
+    CACHE_HOT_COLUMNS: Optional[str] = None  # Колонки в памяти через запятую (None — все колонки)
+    CACHE_COLD_COLUMNS: str = "description,images"  # Подробные поля, догружаемые по ID для ответа
+    CACHE_DETAILS_CACHE_SIZE: int = 10000  # Сколько офферов с холодными полями держать в LRU
+    CACHE_SHARED_DIR: Optional[str] = None  # Каталог общего mmap-сегмента каталога для всех воркеров
+    CACHE_SHARED_ROLE: str = "reader"  # reader — подключаться к сегменту, writer — загружать и писать его, auto — выбор лидера
+    CACHE_LEADER_BACKEND: str = "file"  # Бэкенд аренды лидера при CACHE_SHARED_ROLE=auto
+    CACHE_SHARED_POLL_INTERVAL: float = 5.0  # Как часто читатель проверяет новое поколение сегмента, секунды
     
     # Бизнес логика
     PENALTY_PRICE: float = 1000.0
     MIN_SIMILARITY_THRESHOLD: float = 0.6
+    FUZZY_WORKERS: int = -1  # Потоки пакетного fuzzy-скоринга process.cdist (-1 — все ядра, 1 — без потоков)
+    TITLE_NORMALIZE_CACHE_SIZE: int = 50000  # Сколько нормализованных названий держать в LRU (0 — без кэша)
     
     @property
     def cors_origins_list(self) -> List[str]:
@@ -46,6 +86,18 @@ class Config(BaseSettings):
             return ["*"]
         return [origin.strip() for origin in self.CORS_ORIGINS.split(',')]
     
+    @property
+    def cache_hot_columns_list(self) -> List[str]:
+        """Горячие колонки кэша (пустой список — загружать все)"""
+        if not self.CACHE_HOT_COLUMNS:
+            return []
+        return [column.strip() for column in self.CACHE_HOT_COLUMNS.split(',') if column.strip()]
+    
+    @property
+    def cache_cold_columns_list(self) -> List[str]:
+        """Холодные колонки, догружаемые по ID"""
+        return [column.strip() for column in self.CACHE_COLD_COLUMNS.split(',') if column.strip()]
+    
     @property
     def is_production(self) -> bool:
         """Проверка на продакшн окружение"""
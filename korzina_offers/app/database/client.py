@@ -1,17 +1,42 @@
 """
 Слой для работы с базой данных и кэшированием
 """
-from supabase import create_client, Client
 from app.config import config
 from app.core.logger import get_logger
-from app.cache import CacheManager
+from app.cache import CacheManager, CacheRefresher
+from app.cache.sources import create_data_source
+from app.database.health import HealthProbe
 
 logger = get_logger(__name__)
 
-# Создаем клиент Supabase для кэш-менеджера
-_supabase_client: Client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+# Источник каталога для кэш-менеджера (Supabase или локальный файл, см. DATA_SOURCE)
+_data_source = create_data_source(config)
 
 # Глобальный экземпляр кэш-менеджера
-cache_manager = CacheManager(_supabase_client)
+cache_manager = CacheManager(
+    _data_source,
+    snapshot_path=config.CACHE_SNAPSHOT_PATH,
+    shared_dir=config.CACHE_SHARED_DIR,
+    shared_role=config.CACHE_SHARED_ROLE
+)
+
+# Фоновое обновление кэша (запускается в lifespan приложения);
+# читатель общего сегмента только часто проверяет новое поколение,
+# при выборе лидера так же часто проверяется аренда (лидер ходит в источник
+# не чаще CACHE_REFRESH_INTERVAL)
+_polls_segment = cache_manager.is_shared_reader or cache_manager.lease is not None
+cache_refresher = CacheRefresher(
+    cache_manager,
+    interval=config.CACHE_SHARED_POLL_INTERVAL if _polls_segment else config.CACHE_REFRESH_INTERVAL,
+    jitter=0 if _polls_segment else config.CACHE_REFRESH_JITTER,
+    max_staleness=config.CACHE_MAX_STALENESS
+)
+
+# Фоновая проверка источника: /api/health отдаёт её последний результат
+health_probe = HealthProbe(
+    cache_manager,
+    interval=config.HEALTH_PROBE_INTERVAL,
+    max_age=config.HEALTH_PROBE_MAX_AGE
+)
 
 logger.info("Cache manager initialized")
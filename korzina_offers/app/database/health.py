@@ -0,0 +1,100 @@
+"""
+Фоновая проверка доступности источника каталога
+
+/api/health отдаёт последний результат проверки, не обращаясь к БД
+на каждый запрос: Docker healthcheck и пробы балансировщика не блокируют
+event loop и не открывают соединений. Сама проверка выполняется в отдельном
+потоке раз в HEALTH_PROBE_INTERVAL секунд.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class HealthProbe:
+    """Периодическая проверка источника с кэшированным результатом"""
+
+    def __init__(self, cache_manager: Any, interval: float, max_age: Optional[float] = None):
+        """
+        Args:
+            cache_manager: Кэш-менеджер, чей health_check() вызывается
+            interval: Период проверки, секунды
+            max_age: Возраст результата, после которого он считается неизвестным
+                (None — три периода)
+        """
+        self.cache_manager = cache_manager
+        self.interval = interval
+        self.max_age = max_age if max_age is not None else 3 * interval
+
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Запустить фоновые проверки (первая — сразу)"""
+        if self.is_running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="health-probe", daemon=True)
+        self._thread.start()
+        logger.info(f"Health probe started (interval {self.interval}s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Остановить фоновые проверки"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        """Фоновый поток запущен"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def probe(self) -> Dict[str, Any]:
+        """Выполнить проверку сейчас и запомнить результат"""
+        started = time.monotonic()
+        try:
+            healthy = bool(self.cache_manager.health_check())
+        except Exception as e:
+            logger.error(f"Health probe failed: {e}")
+            healthy = False
+        result = {
+            "healthy": healthy,
+            "latency_seconds": round(time.monotonic() - started, 3),
+            "checked_at": datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._result = result
+            self._checked_at = time.monotonic()
+        return result
+
+    def get_status(self) -> Optional[Dict[str, Any]]:
+        """
+        Последний результат проверки
+
+        Returns:
+            Словарь healthy/latency_seconds/checked_at/age_seconds/is_stale
+            или None, если проверок ещё не было
+        """
+        with self._lock:
+            if self._result is None:
+                return None
+            age = time.monotonic() - self._checked_at
+            return {
+                **self._result,
+                "age_seconds": round(age, 3),
+                "is_stale": age > self.max_age,
+            }
+
+    def _run(self) -> None:
+        """Цикл фонового потока"""
+        while not self._stopping.is_set():
+            self.probe()
+            self._stopping.wait(self.interval)
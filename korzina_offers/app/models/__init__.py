@@ -181,6 +181,29 @@ class AlternativesRequest(BaseModel):
         return normalized
 
 
+class OffersBatchRequest(BaseModel):
+    """Запрос на получение нескольких офферов по ID"""
+    offer_ids: List[int] = Field(..., description="Список ID офферов", min_length=1, max_length=1000)
+
+
+class OfferChangesRequest(BaseModel):
+    """Пачка изменений офферов для применения к кэшу"""
+    upserts: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Новые и изменённые офферы (offer_id обязателен, остальные поля — только изменившиеся)",
+        max_length=5000
+    )
+    deletes: List[int] = Field(default_factory=list, description="ID удалённых офферов", max_length=5000)
+
+    @field_validator('upserts')
+    @classmethod
+    def validate_upserts(cls, v: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """У каждого оффера должен быть offer_id"""
+        if any(offer.get("offer_id") is None for offer in v):
+            raise ValueError("Every upserted offer must have offer_id")
+        return v
+
+
 class AlternativeMatch(BaseModel):
     """Результат поиска альтернатив для товара"""
     offer_number: int = 1
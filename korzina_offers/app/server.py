@@ -0,0 +1,261 @@
+"""
+Продакшн-запуск: предзагрузка каталога в мастере и fork воркеров
+
+Мастер загружает и индексирует каталог один раз, замораживает объекты
+(gc.freeze) и форкает N воркеров uvicorn на общем слушающем сокете.
+Воркеры получают каталог через copy-on-write: страницы памяти общие,
+пока их никто не меняет, а сборщик мусора воркеров не обходит
+замороженные объекты мастера.
+
+Каталог обновляет только мастер. Когда появляется новое поколение,
+воркеры перезапускаются по одному (новый форк, затем мягкая остановка
+старого), поэтому сервис не прерывается.
+
+Сигналы мастеру:
+    SIGTERM / SIGINT — остановить воркеры и выйти
+    SIGHUP           — обновить каталог сейчас и перезапустить воркеры
+
+Запуск:
+    python -m app.server
+"""
+import gc
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Как часто мастер проверяет воркеры и сигналы, секунды
+MASTER_TICK = 0.5
+# Сколько ждать мягкой остановки воркера перед SIGKILL, секунды
+WORKER_SHUTDOWN_TIMEOUT = 30.0
+
+
+def freeze_heap() -> None:
+    """Собрать мусор и заморозить выжившие объекты перед fork"""
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Heap frozen before fork: {gc.get_freeze_count()} objects")
+
+
+class PreforkServer:
+    """Мастер-процесс: держит N воркеров, обновляет каталог и перезапускает их"""
+
+    def __init__(
+            self,
+            serve: Callable[[], None],
+            workers: int,
+            refresh: Optional[Callable[[], bool]] = None,
+            generation: Optional[Callable[[], int]] = None,
+            refresh_interval: Optional[float] = None,
+            shutdown_timeout: float = WORKER_SHUTDOWN_TIMEOUT
+    ):
+        """
+        Args:
+            serve: Работа воркера (вызывается в дочернем процессе, блокирует до остановки)
+            workers: Количество воркеров
+            refresh: Обновление каталога в мастере (True при успехе)
+            generation: Текущее поколение каталога; при его смене воркеры перезапускаются
+            refresh_interval: Период обновления, секунды (None — только по SIGHUP)
+            shutdown_timeout: Сколько ждать мягкой остановки воркера
+        """
+        self.serve = serve
+        self.workers = max(1, workers)
+        self.refresh = refresh
+        self.generation = generation
+        self.refresh_interval = refresh_interval
+        self.shutdown_timeout = shutdown_timeout
+
+        # pid → поколение каталога, с которым воркер был форкнут
+        self.children: Dict[int, int] = {}
+        self._stopping = False
+        self._reload_requested = False
+        self._next_refresh = time.monotonic() + refresh_interval if refresh_interval else None
+
+    def _current_generation(self) -> int:
+        return self.generation() if self.generation else 0
+
+    def spawn(self) -> int:
+        """Форкнуть воркер"""
+        generation = self._current_generation()
+        pid = os.fork()
+        if pid == 0:
+            # Дочерний процесс: обработчики мастера не нужны, сборка мусора снова включена
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            gc.enable()
+            exit_code = 0
+            try:
+                self.serve()
+            except BaseException as e:
+                logger.error(f"Worker {os.getpid()} crashed: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        self.children[pid] = generation
+        logger.info(f"Worker {pid} started (catalog generation {generation})")
+        return pid
+
+    def spawn_missing(self) -> None:
+        """Дозапустить воркеры до нужного количества"""
+        while len(self.children) < self.workers:
+            self.spawn()
+
+    def reap(self) -> None:
+        """Забрать завершившиеся воркеры и заменить их"""
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                break
+            if pid == 0:
+                break
+            if self.children.pop(pid, None) is not None and not self._stopping:
+                logger.warning(f"Worker {pid} exited with status {status}, restarting")
+        if not self._stopping:
+            self.spawn_missing()
+
+    def stop_worker(self, pid: int) -> None:
+        """Мягко остановить воркер (SIGTERM), при таймауте — SIGKILL"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.children.pop(pid, None)
+            return
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self.children.pop(pid, None)
+                return
+            time.sleep(0.05)
+
+        logger.warning(f"Worker {pid} did not stop in {self.shutdown_timeout}s, killing")
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+        self.children.pop(pid, None)
+
+    def rolling_restart(self) -> None:
+        """Заменить воркеры старых поколений по одному без простоя"""
+        generation = self._current_generation()
+        for pid in [pid for pid, worker_generation in self.children.items() if worker_generation != generation]:
+            self.spawn()
+            self.stop_worker(pid)
+
+    def maybe_refresh(self) -> None:
+        """Обновить каталог по расписанию или по SIGHUP; при новом поколении перезапустить воркеры"""
+        now = time.monotonic()
+        due = self._next_refresh is not None and now >= self._next_refresh
+        if not (due or self._reload_requested) or self.refresh is None:
+            return
+
+        self._reload_requested = False
+        if self.refresh_interval:
+            self._next_refresh = now + self.refresh_interval
+
+        before = self._current_generation()
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Catalog refresh in master failed: {e}")
+            return
+        if self._current_generation() != before:
+            freeze_heap()
+            self.rolling_restart()
+
+    def _handle_stop(self, signum: int, frame: object) -> None:
+        self._stopping = True
+
+    def _handle_reload(self, signum: int, frame: object) -> None:
+        self._reload_requested = True
+
+    def run(self) -> None:
+        """Запустить воркеры и обслуживать их до SIGTERM/SIGINT"""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        freeze_heap()
+        self.spawn_missing()
+        logger.info(f"Master {os.getpid()} is running {self.workers} workers")
+
+        try:
+            while not self._stopping:
+                self.reap()
+                self.maybe_refresh()
+                time.sleep(MASTER_TICK)
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        """Остановить все воркеры"""
+        self._stopping = True
+        for pid in list(self.children):
+            self.stop_worker(pid)
+        logger.info("All workers stopped")
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Слушающий сокет мастера, общий для всех воркеров"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main() -> None:
+    """Загрузить каталог в мастере, заморозить кучу и форкнуть воркеры uvicorn"""
+    # До загрузки: сборка мусора не должна перемешивать долгоживущие объекты
+    # с мусором, иначе страницы станут частными в воркерах при первой же сборке
+    gc.disable()
+
+    import uvicorn
+    from app.api import create_app
+    from app.cache.cache_manager import REFRESH_MODE_FULL
+    from app.config import config
+    from app.database.client import cache_manager
+
+    workers = config.WORKERS or os.cpu_count() or 1
+    logger.info(f"Preloading catalog in master {os.getpid()}...")
+    if cache_manager.load_from_file():
+        # Изменения с водяного знака снимка догружаем до fork
+        cache_manager.refresh_cache()
+    elif not cache_manager.refresh_cache(REFRESH_MODE_FULL):
+        logger.warning("Catalog preload failed, workers will retry on first request")
+
+    # Каталог обновляет мастер, воркеры только обслуживают запросы
+    refresh_interval = config.CACHE_REFRESH_INTERVAL if config.CACHE_REFRESH_ENABLED else None
+    config.CACHE_REFRESH_ENABLED = False
+    app = create_app()
+    sock = bind_socket(config.HOST, config.PORT)
+
+    def serve() -> None:
+        server = uvicorn.Server(uvicorn.Config(app, log_level=config.LOG_LEVEL.lower(), lifespan="on"))
+        server.run(sockets=[sock])
+
+    PreforkServer(
+        serve,
+        workers=workers,
+        refresh=cache_manager.refresh_cache,
+        generation=lambda: cache_manager.get_snapshot().generation,
+        refresh_interval=refresh_interval
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Пакетный fuzzy-скоринг: запросы × названия группы офферов
+
+Вместо трёх вызовов fuzz.* на каждую пару (запрос, оффер) из Python-цикла
+каждая метрика считается одним вызовом rapidfuzz.process.cdist по всей
+матрице (в FUZZY_WORKERS потоках), а взвешенная сумма — средствами NumPy.
+Значения выше порога совпадают с ProductService.calculate_fuzzy_similarity
+для каждой пары.
+"""
+from typing import TYPE_CHECKING, Any, List, Mapping, Optional, Sequence, Union
+import numpy as np
+import numpy.typing as npt
+from rapidfuzz import fuzz, process
+from app.config import config
+from app.core.constants import FUZZY_WEIGHTS
+from app.services.title_attributes import TitleAttributes, parse_normalized_attributes
+from app.services.title_normalizer import normalize_title
+
+if TYPE_CHECKING:
+    # offer_store импортирует product_service, который импортирует этот модуль
+    from app.cache.offer_store import Bucket
+
+# Метрики в том же порядке, что и в calculate_fuzzy_similarity (по убыванию веса)
+_SCORERS = (
+    ("token_set", fuzz.token_set_ratio),
+    ("token_sort", fuzz.token_sort_ratio),
+    ("partial", fuzz.partial_ratio),
+)
+
+# Запас на погрешность сравнения сумм с плавающей точкой (в шкале 0..100)
+_EPSILON = 1e-6
+
+
+def fuzzy_matrix(
+        queries: Sequence[str],
+        choices: Sequence[str],
+        workers: Optional[int] = None,
+        score_cutoff: float = 0.0,
+        top_k: Optional[int] = None,
+        slack: float = 0.0
+) -> npt.NDArray[np.float64]:
+    """
+    Комбинированный fuzzy score всех пар запрос × название
+
+    Метрики считаются по очереди, от самой весомой. После каждой метрики
+    известна верхняя граница score пары (уже посчитанное + максимум
+    оставшихся), и следующая метрика считается только для названий, которым
+    ещё есть смысл: для rapidfuzz это score_cutoff, ниже которого пара
+    не досчитывается. Если нужны только top_k лучших названий строки,
+    порог поднимается до k-й нижней границы (минус slack — сколько
+    вызывающий код может добавить к score бонусами).
+
+    Args:
+        queries: Запросы (строки матрицы)
+        choices: Названия (столбцы матрицы)
+        workers: Потоки cdist (None — FUZZY_WORKERS из конфигурации)
+        score_cutoff: Пары с score ниже порога (0..1) получают 0
+        top_k: Сколько лучших названий строки нужно (None — все выше порога)
+        slack: Наибольшая добавка к score у вызывающего кода (0..1)
+
+    Returns:
+        Матрица float64 формы (len(queries), len(choices)) со значениями 0..1:
+        точный score для пар, которые могут пройти порог и войти в top_k, иначе 0
+    """
+    rows, columns = len(queries), len(choices)
+    combined = np.zeros((rows, columns))
+    if not rows or not columns:
+        return combined
+
+    workers = config.FUZZY_WORKERS if workers is None else workers
+    cutoffs = np.full((rows, 1), score_cutoff * 100.0)
+    remaining = 100.0
+    alive = np.arange(columns)
+
+    for name, scorer in _SCORERS:
+        weight = FUZZY_WEIGHTS[name]
+        remaining -= weight * 100.0
+
+        # Сколько эта метрика должна набрать, чтобы пара ещё могла пройти порог
+        need = (cutoffs - combined[:, alive] - remaining) / weight
+        metric_cutoff = max(0.0, float(need.min()) - _EPSILON)
+        subset = choices if len(alive) == columns else [choices[i] for i in alive.tolist()]
+        scores = process.cdist(
+            queries, subset, scorer=scorer, dtype=np.float64, workers=workers,
+            score_cutoff=metric_cutoff if metric_cutoff > 0 else None
+        )
+        combined[:, alive] += weight * scores
+
+        if top_k is not None and top_k < columns:
+            # Уже посчитанное — нижняя граница: k-я из них отсекает заведомо худших
+            kth = np.partition(combined, columns - top_k, axis=1)[:, columns - top_k]
+            cutoffs = np.maximum(cutoffs, (kth - slack * 100.0)[:, None])
+
+        hopeful = combined[:, alive] + remaining >= cutoffs - _EPSILON
+        alive = alive[hopeful.any(axis=0)]
+        if not len(alive):
+            break
+
+    combined[combined < cutoffs - _EPSILON] = 0.0
+    return combined / 100.0
+
+
+class OfferTitles:
+    """
+    Названия группы офферов в виде списков для пакетного скоринга
+
+    Для групп индекса каталога (Bucket) названия берутся прямо из колонок
+    хранилища (очищенные и нормализованные варианты посчитаны при загрузке),
+    для обычных словарей {offer_id: товар} — из полей товара.
+    Позиция в списках — номер столбца матрицы fuzzy_matrix.
+    """
+
+    __slots__ = ("offer_ids", "rows", "names", "lower", "clean", "normalized", "_bucket", "_items")
+
+    def __init__(self, offers: Union["Bucket", Mapping[Any, Mapping[str, Any]]]):
+        from app.cache.offer_store import Bucket
+
+        self._bucket: Optional[Bucket] = None
+        # Товары обычного словаря (для групп индекса — пусто)
+        self._items: List[Mapping[str, Any]] = []
+        self.rows: Optional[npt.NDArray[np.int64]]
+
+        if isinstance(offers, Bucket):
+            # Группа индекса каталога (Bucket / BucketView)
+            self._bucket = offers
+            store = offers.store
+            rows = list(offers.iter_rows())
+            self.rows = np.array(rows, dtype=np.int64)
+            titles, offer_ids = store.titles, store.offer_ids
+            self.offer_ids = [offer_ids[row] for row in rows]
+            self.names = [title if type(title) is str else "" for title in (titles[row] for row in rows)]
+            self.clean = [store.clean_names[row] for row in rows]
+            self.normalized = [store.normalized_names[row] for row in rows]
+        else:
+            self.rows = None
+            self.offer_ids = list(offers.keys())
+            self._items = list(offers.values())
+            self.names = [item.get("name") or "" for item in self._items]
+            self.clean = [(item.get("clean_name") or "").lower() for item in self._items]
+            self.normalized = [
+                item.get("normalized_name") or normalize_title(name)
+                for item, name in zip(self._items, self.names)
+            ]
+        self.lower = [name.lower() for name in self.names]
+
+    def item(self, position: int) -> Mapping[str, Any]:
+        """Товар по позиции (CatalogItem для групп индекса каталога)"""
+        if self._bucket is None or self.rows is None:
+            return self._items[position]
+        return self._bucket.item(int(self.rows[position]))
+
+    def attributes(self, position: int) -> TitleAttributes:
+        """Атрибуты из названия по позиции (для групп индекса — разобранные при загрузке)"""
+        if self._bucket is None or self.rows is None:
+            return parse_normalized_attributes(self.normalized[position])
+        return self._bucket.store.title_attributes(int(self.rows[position]))
+
+    def mask(self, rows: Optional[Sequence[int]]) -> Optional[npt.NDArray[np.bool_]]:
+        """Маска позиций, чьи строки хранилища входят в rows (None — все позиции)"""
+        if rows is None or self.rows is None:
+            return None
+        return np.isin(self.rows, np.asarray(rows, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.offer_ids)
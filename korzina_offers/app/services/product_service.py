@@ -1,7 +1,8 @@
 """
 Сервис для работы с товарами
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Mapping, Optional, Sequence, Tuple
+import numpy as np
 from rapidfuzz import fuzz
 from app.core.constants import (
     STOP_WORDS, MATCH_PRIORITIES, SIMILARITY_THRESHOLDS, 
@@ -9,6 +10,7 @@ from app.core.constants import (
 )
 from app.models import ProductMatch, MatchType
 from app.core.logger import get_logger
+from app.services.batch_scoring import OfferTitles, fuzzy_matrix
 from app.services.title_normalizer import normalize_title
 
 logger = get_logger(__name__)
@@ -109,10 +111,36 @@ class ProductService:
 
         return 0.0  # Цена отличается больше чем на 30%
 
+    @staticmethod
+    def score_offers(
+            queries: Sequence["PreparedQuery"],
+            titles: OfferTitles
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Fuzzy score всех запросов по всем офферам группы пакетно
+
+        Пары ниже минимального порога FUZZY_THRESHOLDS['low'] не досчитываются
+        и получают 0: сопоставление их всё равно отбрасывает.
+
+        Args:
+            queries: Подготовленные запросы
+            titles: Названия офферов группы
+
+        Returns:
+            Матрицы (полное название, очищенное, нормализованное)
+            формы (len(queries), len(titles))
+        """
+        min_threshold = FUZZY_THRESHOLDS['low'] / 100.0
+        return (
+            fuzzy_matrix([query.lower for query in queries], titles.lower, score_cutoff=min_threshold),
+            fuzzy_matrix([query.clean for query in queries], titles.clean, score_cutoff=min_threshold),
+            fuzzy_matrix([query.normalized for query in queries], titles.normalized, score_cutoff=min_threshold),
+        )
+
     @staticmethod
     def find_best_product_match(
             target_product: str,
-            shop_products: Dict[str, Dict[str, Any]],
+            shop_products: Mapping[Any, Mapping[str, Any]],
             used_products: set,
             target_category: Optional[str] = None,
             target_price: Optional[float] = None
@@ -127,6 +155,39 @@ class ProductService:
             target_category: Целевая категория товара (опционально)
             target_price: Целевая цена товара (опционально)
 
+        Returns:
+            Tuple: (product_id, product_data, similarity_score, match_type)
+        """
+        query = PreparedQuery(target_product)
+        titles = OfferTitles(shop_products)
+        full, clean, norm = ProductService.score_offers([query], titles)
+        return ProductService.pick_best_match(
+            query, titles, (full[0], clean[0], norm[0]), used_products,
+            target_category=target_category, target_price=target_price
+        )
+
+    @staticmethod
+    def pick_best_match(
+            query: "PreparedQuery",
+            titles: OfferTitles,
+            scores: Tuple[np.ndarray, np.ndarray, np.ndarray],
+            used_products: set,
+            target_category: Optional[str] = None,
+            target_price: Optional[float] = None,
+            allowed: Optional[np.ndarray] = None
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]], float, MatchType]:
+        """
+        Выбрать лучшее сопоставление по посчитанным fuzzy score
+
+        Args:
+            query: Подготовленный запрос
+            titles: Названия офферов группы
+            scores: Строки матриц score_offers для этого запроса
+            used_products: Уже использованные товары
+            target_category: Целевая категория товара (опционально)
+            target_price: Целевая цена товара (опционально)
+            allowed: Маска офферов-кандидатов (None — все офферы группы)
+
         Returns:
             Tuple: (product_id, product_data, similarity_score, match_type)
         """
@@ -134,40 +195,43 @@ class ProductService:
         best_combined_score = 0
         best_fuzzy_score = 0
         best_match_type = MatchType.NONE
-        
-        target_lower = target_product.lower()
-        target_clean = ProductService.remove_stop_words(target_product)
-        target_clean_lower = target_clean.lower()
-        target_normalized = normalize_title(target_product)
-        
+
+        target_product = query.text
+        target_lower = query.lower
+        target_clean_lower = query.clean
+        target_normalized = query.normalized
+
         min_threshold = FUZZY_THRESHOLDS['low'] / 100.0
-        
-        logger.debug(f"Fuzzy searching for product: '{target_product}' (clean: '{target_clean}', norm: '{target_normalized}')")
+
+        logger.debug(f"Fuzzy searching for product: '{target_product}' (clean lower: '{target_clean_lower}', norm: '{target_normalized}')")
         logger.debug(f"Target category: {target_category}, Target price: {target_price}")
-        logger.debug(f"Available products count: {len(shop_products)}")
-        
-        for product_id, product_data in shop_products.items():
+        logger.debug(f"Available products count: {len(titles)}")
+
+        scores_full, scores_clean, scores_norm = scores
+        # Пропускаем офферы ниже минимального порога — без обхода в Python
+        eligible = np.maximum(np.maximum(scores_full, scores_clean), scores_norm) >= min_threshold
+        if allowed is not None:
+            eligible &= allowed
+
+        for position in np.flatnonzero(eligible).tolist():
+            product_id = titles.offer_ids[position]
             if product_id in used_products:
                 continue
-            
-            product_name = product_data["name"]
-            product_name_lower = product_name.lower()
-            product_clean = product_data["clean_name"]
-            product_clean_lower = product_clean.lower()
-            product_normalized = product_data.get("normalized_name") or normalize_title(product_name)
+
+            product_data = titles.item(position)
+            product_name = titles.names[position]
+            product_name_lower = titles.lower[position]
+            product_clean_lower = titles.clean[position]
+            product_normalized = titles.normalized[position]
             product_category = product_data.get("category", "")
             product_price = product_data["price"]
 
-            fuzzy_full = ProductService.calculate_fuzzy_similarity(target_lower, product_name_lower)
-            fuzzy_clean = ProductService.calculate_fuzzy_similarity(target_clean_lower, product_clean_lower)
-            fuzzy_norm = ProductService.calculate_fuzzy_similarity(target_normalized, product_normalized)
-            
+            fuzzy_full = float(scores_full[position])
+            fuzzy_clean = float(scores_clean[position])
+            fuzzy_norm = float(scores_norm[position])
+
             fuzzy_score = max(fuzzy_full, fuzzy_clean, fuzzy_norm)
             
-            # Пропускаем если ниже минимального порога
-            if fuzzy_score < min_threshold:
-                continue
-            
             # Определяем match_type на основе fuzzy score
             match_type = MatchType.NONE
             match_priority = 0
@@ -186,6 +250,11 @@ class ProductService:
             
             # 2. ВЫСОКОЕ СХОДСТВО (fuzzy score >= 80%)
             elif fuzzy_score >= FUZZY_THRESHOLDS['high'] / 100.0:
+                # Варианты ниже порога пакетный скоринг не досчитывает — нужны точные
+                if fuzzy_full < min_threshold:
+                    fuzzy_full = ProductService.calculate_fuzzy_similarity(target_lower, product_name_lower)
+                if fuzzy_clean < min_threshold:
+                    fuzzy_clean = ProductService.calculate_fuzzy_similarity(target_clean_lower, product_clean_lower)
                 if fuzzy_full >= fuzzy_clean:
                     match_type = MatchType.PARTIAL_FULL
                     match_priority = MATCH_PRIORITIES['partial_full']
@@ -241,4 +310,21 @@ class ProductService:
             return product_id, product_data, best_fuzzy_score, best_match_type
         
         logger.warning(f"No fuzzy match found for product: '{target_product}'")
-        return None, None, 0, MatchType.NONE
\ No newline at end of file
+        return None, None, 0, MatchType.NONE
+
+
+class PreparedQuery:
+    """
+    Варианты названия искомого товара, посчитанные один раз на запрос
+
+    Очистка от стоп-слов и нормализация запроса не зависят от магазина,
+    поэтому при поиске по всем продавцам выполняются один раз.
+    """
+
+    __slots__ = ("text", "lower", "clean", "normalized")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = text.lower()
+        self.clean = ProductService.remove_stop_words(text).lower()
+        self.normalized = normalize_title(text)
@@ -1,29 +1,31 @@
 """
 Сервис для поиска магазинов
 """
-import re
-from typing import List, Dict, Any, Optional
+import heapq
+from array import array
+from heapq import merge
+from typing import List, Dict, Any, Mapping, Optional, Sequence, Set, Tuple, Union
+import numpy as np
 from rapidfuzz import fuzz
+from app.cache.catalog_index import rows_with_any_tag
+from app.cache.offer_store import BucketsView, OfferRow, tag_values
+from app.cache.snapshot import CatalogSnapshot
+from app.cache.token_index import title_tokens
 from app.database.client import cache_manager
-from app.services.product_service import ProductService
+from app.services.batch_scoring import OfferTitles, fuzzy_matrix
+from app.services.product_service import PreparedQuery, ProductService
 from app.models import ShopSolution, ProductMatch, SearchRequest, MatchType, offer_to_response
 from app.config import config
 from app.core.logger import get_logger
-from app.core.constants import FUZZY_THRESHOLDS, FUZZY_WEIGHTS, CORRIDOR_SETTINGS
+from app.core.constants import FUZZY_THRESHOLDS, CORRIDOR_SETTINGS
+from app.services.title_attributes import TitleAttributes, parse_normalized_attributes, parse_title_attributes
 from app.services.title_normalizer import normalize_title
 
 logger = get_logger(__name__)
 
-# Регулярки для извлечения веса из названия (в граммах)
-_RE_WEIGHT_KG = re.compile(r'(\d+)[.,](\d+)\s*кг', re.IGNORECASE)
-_RE_WEIGHT_KG_WHOLE = re.compile(r'(?<!\d[.,])(\d+)\s*кг(?=\b|\s|$)', re.IGNORECASE)
-_RE_WEIGHT_G = re.compile(r'(\d+)\s*(?:г|гр)(?=\b|\s|$)', re.IGNORECASE)
+# Наибольший суммарный бонус к fuzzy score в _search_in_category (цена + жирность)
+MAX_MATCH_BONUS = 0.15
 
-# Регулярки для извлечения объёма (в миллилитрах)
-_RE_VOLUME_L = re.compile(r'(\d+)[.,](\d+)\s*л(?:итр)?', re.IGNORECASE)
-_RE_VOLUME_L_WHOLE = re.compile(r'(?<!\d[.,])(\d+)\s*л(?:итр)?(?=\b|\s|$)', re.IGNORECASE)
-_RE_VOLUME_ML = re.compile(r'(\d+)\s*мл', re.IGNORECASE)
-_RE_FAT_PERCENT = re.compile(r'(\d+[.,]?\d*)\s*%', re.IGNORECASE)
 
 class ShopSearchService:
     """Сервис для поиска оптимального магазина"""
@@ -32,107 +34,31 @@ class ShopSearchService:
         self.product_service = ProductService()
 
     # =========================================================================
-    # МЕТОДЫ ИЗВЛЕЧЕНИЯ ВЕСА/ОБЪЁМА
+    # АТРИБУТЫ ИЗ НАЗВАНИЯ (ВЕС/ОБЪЁМ/ЖИРНОСТЬ)
     # =========================================================================
 
-    def _extract_weight_from_title(self, title: str) -> Optional[float]:
-        """
-        Извлечь вес из названия товара.
-        Возвращает вес в граммах или None если не найден.
-        """
-        if not title:
-            return None
-
-        title_lower = title.lower()
-
-        # Килограммы с дробной частью: 0.5кг, 1,5кг → граммы
-        match = _RE_WEIGHT_KG.search(title_lower)
-        if match:
-            whole = int(match.group(1))
-            frac_str = match.group(2)
-            frac = int(frac_str)
-            divisor = 10 ** len(frac_str)
-            return (whole + frac / divisor) * 1000
-
-        # Целые килограммы: 1кг, 2кг → граммы
-        match = _RE_WEIGHT_KG_WHOLE.search(title_lower)
-        if match:
-            return int(match.group(1)) * 1000
-
-        # Граммы: 100г, 200гр
-        match = _RE_WEIGHT_G.search(title_lower)
-        if match:
-            return float(match.group(1))
-
-        return None
-
-    def _extract_fat_percent(self, title: str) -> Optional[float]:
-        """
-        Извлечь жирность из названия товара.
-        Возвращает жирность в процентах или None если не найдена.
-        """
-        if not title:
-            return None
-
-        match = _RE_FAT_PERCENT.search(title)
-        if match:
-            fat_str = match.group(1).replace(',', '.')
-            try:
-                return float(fat_str)
-            except ValueError:
-                return None
-
-        return None
-
-    def _extract_volume_from_title(self, title: str) -> Optional[float]:
-        """
-        Извлечь объём из названия товара.
-        Возвращает объём в миллилитрах или None если не найден.
+    @staticmethod
+    def _offer_attributes(offer: Mapping[str, Any]) -> TitleAttributes:
         """
-        if not title:
-            return None
-
-        title_lower = title.lower()
-
-        # Литры с дробной частью: 0.9л, 1,5л → миллилитры
-        match = _RE_VOLUME_L.search(title_lower)
-        if match:
-            whole = int(match.group(1))
-            frac_str = match.group(2)
-            frac = int(frac_str)
-            divisor = 10 ** len(frac_str)
-            return (whole + frac / divisor) * 1000
-
-        # Целые литры: 1л, 2л → миллилитры
-        match = _RE_VOLUME_L_WHOLE.search(title_lower)
-        if match:
-            return int(match.group(1)) * 1000
+        Атрибуты оффера из названия
 
-        # Миллилитры: 100мл, 500мл
-        match = _RE_VOLUME_ML.search(title_lower)
-        if match:
-            return float(match.group(1))
-
-        return None
-
-    def _extract_quantity_from_title(self, title: str) -> Optional[float]:
-        """
-        Извлечь количество (вес или объём) из названия.
-        Сначала пробует вес, потом объём.
+        У офферов кэша (OfferRow) атрибуты разобраны при загрузке,
+        остальные офферы (например, уже сериализованные) разбираются сейчас.
         """
-        weight = self._extract_weight_from_title(title)
-        if weight is not None:
-            return weight
-
-        volume = self._extract_volume_from_title(title)
-        if volume is not None:
-            return volume
+        if isinstance(offer, OfferRow):
+            return offer.title_attributes
+        return parse_title_attributes(offer.get("title") or "")
 
+    @staticmethod
+    def _offer_normalized_title(offer: Mapping[str, Any]) -> Optional[str]:
+        """Нормализованное название оффера кэша (None — у оффера его нет)"""
+        if isinstance(offer, OfferRow):
+            return offer.normalized_title
         return None
 
-        # =========================================================================
-        # МЕТОДЫ ПРОВЕРКИ КОРИДОРА
-        # =========================================================================
+    # =========================================================================
+    # МЕТОДЫ ПРОВЕРКИ КОРИДОРА
+    # =========================================================================
 
     def _is_in_price_corridor(
             self,
@@ -152,16 +78,16 @@ class ShopSearchService:
 
     def _is_in_weight_corridor(
             self,
-            target_title: str,
-            candidate_title: str,
+            target_attributes: TitleAttributes,
+            candidate_attributes: TitleAttributes,
             tolerance: float = None
     ) -> bool:
         """Проверить, попадает ли вес/объём кандидата в коридор."""
         if tolerance is None:
             tolerance = CORRIDOR_SETTINGS['weight_tolerance']
 
-        target_qty = self._extract_quantity_from_title(target_title)
-        candidate_qty = self._extract_quantity_from_title(candidate_title)
+        target_qty = target_attributes.quantity
+        candidate_qty = candidate_attributes.quantity
 
         if target_qty is None or candidate_qty is None or target_qty <= 0:
             return True  # Нельзя сравнить — пропускаем
@@ -183,10 +109,9 @@ class ShopSearchService:
         if not self._is_in_price_corridor(target_price, candidate_price):
             return False
 
-        target_title = target_offer.get("title", "")
-        candidate_title = candidate_offer.get("title", "")
-
-        if not self._is_in_weight_corridor(target_title, candidate_title):
+        if not self._is_in_weight_corridor(
+                self._offer_attributes(target_offer), self._offer_attributes(candidate_offer)
+        ):
             return False
 
         return True
@@ -269,19 +194,22 @@ class ShopSearchService:
         logger.info(f"Starting search for products: {', '.join(search_request.products)}")
 
         try:
-            # Получаем все предложения из кэша
-            all_offers = cache_manager.get_all_offers()
-            target_products_info = self._get_target_products_info(search_request.products, all_offers)
+            # Один снимок кэша на весь запрос
+            snapshot = cache_manager.get_snapshot()
+            target_products_info = self._get_target_products_info(search_request.products, snapshot)
+            # Очистка, нормализация и слова запросов — одни на всех продавцов
+            queries = [PreparedQuery(product) for product in search_request.products]
+            target_tokens = [title_tokens(query.clean, query.normalized) for query in queries]
 
-            # Группируем предложения по продавцам
-            sellers_data = self._group_offers_by_sellers(all_offers)
+            # Предложения, сгруппированные по продавцам при загрузке кэша
+            sellers_data = snapshot.catalog_index.sellers
 
             # Ищем лучшего продавца для каждого
             seller_solutions = []
 
             for seller_name, seller_data in sellers_data.items():
                 solution = self._evaluate_seller(search_request.products, seller_name, seller_data,
-                                                 target_products_info)
+                                                 target_products_info, queries, target_tokens)
                 seller_solutions.append(solution)
 
             # Сортируем по количеству найденных товаров и цене
@@ -309,33 +237,32 @@ class ShopSearchService:
         logger.info(f"=== ALTERNATIVES SEARCH START ===")
         logger.info(f"Searching alternatives for offers: {offer_ids}")
 
-        all_offers = cache_manager.get_all_offers()
+        # Один снимок кэша на весь запрос
+        snapshot = cache_manager.get_snapshot()
 
-        # Находим исходные офферы
-        selected_offers_map: Dict[int, Dict[str, Any]] = {}
-        for offer in all_offers:
-            offer_id = offer.get("offer_id")
-            if offer_id in offer_ids and offer_id not in selected_offers_map:
-                selected_offers_map[offer_id] = offer
+        # Находим исходные офферы по индексу offer_id
+        selected_offers_map = snapshot.get_offers_by_ids(offer_ids)
 
         missing_ids = [offer_id for offer_id in offer_ids if offer_id not in selected_offers_map]
         if missing_ids:
             raise ValueError(f"Offers not found: {missing_ids}")
 
-        target_offers = [
-            selected_offers_map[offer_id]
-            for offer_id in offer_ids
-            if offer_id in selected_offers_map
-        ]
+        target_offers = [selected_offers_map[offer_id] for offer_id in offer_ids]
         logger.info(f"Target offers loaded: {len(target_offers)}")
 
-        # Группируем ВСЕ офферы по продавцам
-        sellers_data = self._group_offers_by_sellers(all_offers)
+        # Все офферы, сгруппированные по продавцам при загрузке кэша
+        sellers_data = snapshot.catalog_index.sellers
         logger.info(f"Grouped into {len(sellers_data)} sellers")
 
         alternatives: Dict[str, List[Dict[str, Any]]] = {}
         ordered_sellers = sorted(sellers_data.keys())
 
+        # Ключевые слова исходных офферов не зависят от магазина
+        search_queries = [
+            self._extract_key_words(target.get("title", ""), normalized=self._offer_normalized_title(target))
+            for target in target_offers
+        ]
+
         for seller_name in ordered_sellers:
             seller_data = sellers_data[seller_name]
             shop_name = seller_data["name"]
@@ -348,9 +275,9 @@ class ShopSearchService:
                 target_category_num = target.get("category_code")
                 target_price = self._normalize_price(target.get("price"))
                 target_id = target.get("offer_id")
-                target_tags = target.get("tags") or []  # <-- ИЗВЛЕКАЕМ ТЕГИ
+                target_tags = tag_values(target.get("tags"))  # <-- ИЗВЛЕКАЕМ ТЕГИ
 
-                search_query = self._extract_key_words(target_title)
+                search_query = search_queries[idx - 1]
 
                 logger.info(f"  [{idx}/{len(target_offers)}] Target: '{target_title[:60]}...'")
                 logger.info(f"    Extracted keywords: '{search_query}'")
@@ -358,25 +285,12 @@ class ShopSearchService:
 
                 # ФИЛЬТРУЕМ товары магазина по тегам исходного оффера
                 if target_tags:
-                    filtered_shop_products = {
-                        offer_id: product
-                        for offer_id, product in seller_data["offers"].items()
-                        if self._has_matching_tag(product, target_tags)
-                    }
+                    filtered_seller_data = self._filter_seller_by_tags(seller_data, target_tags)
                     logger.info(
-                        f"    Filtered by tags: {len(filtered_shop_products)} products (was {len(seller_data['offers'])})")
+                        f"    Filtered by tags: {len(filtered_seller_data['offers'])} products "
+                        f"(was {len(seller_data['offers'])})")
                 else:
-                    filtered_shop_products = seller_data["offers"]
-
-                # Создаём отфильтрованные данные магазина (ВЫНЕСЕНО ИЗ else!)
-                filtered_seller_data = {
-                    "name": seller_data["name"],
-                    "offers": filtered_shop_products,
-                    "categories": self._filter_categories_by_offers(
-                        seller_data.get("categories", {}),
-                        filtered_shop_products
-                    )
-                }
+                    filtered_seller_data = seller_data
 
                 # Ищем лучшую альтернативу С УЧЁТОМ КОРИДОРА
                 best_match = self._find_best_alternative_with_corridor(
@@ -431,110 +345,28 @@ class ShopSearchService:
 
         return alternatives
 
-    def _filter_categories_by_offers(
-            self,
-            categories: Dict[str, Dict[int, Dict[str, Any]]],
-            allowed_offers: Dict[int, Dict[str, Any]]
-    ) -> Dict[str, Dict[int, Dict[str, Any]]]:
-        """Отфильтровать категории, оставив только разрешённые офферы."""
-        filtered = {}
-        allowed_ids = set(allowed_offers.keys())
-
-        for cat_num, cat_offers in categories.items():
-            filtered_cat = {oid: p for oid, p in cat_offers.items() if oid in allowed_ids}
-            if filtered_cat:
-                filtered[cat_num] = filtered_cat
-
-        return filtered
-
-    def _has_matching_tag(self, product: Dict[str, Any], target_tags: List[str]) -> bool:
+    @staticmethod
+    def _filter_seller_by_tags(seller_data: Mapping[str, Any], target_tags: List[str]) -> Dict[str, Any]:
         """
-        Проверить, есть ли у товара хотя бы один совпадающий тег
+        Сузить товары магазина до офферов хотя бы с одним из тегов
+
+        Строки с тегами берутся из индекса тегов продавца (seller_data["tags"]),
+        офферы и категории — представления поверх групп индекса (без копирования);
+        категории фильтруются лениво, только те, к которым обратится поиск.
 
         Args:
-            product: Данные товара из seller_data["offers"]
+            seller_data: Данные магазина из индекса каталога
             target_tags: Теги исходного оффера
 
         Returns:
-            True если есть совпадение
-        """
-        # Теги хранятся в offer_data
-        offer_data = product.get("offer_data", {})
-        product_tags = offer_data.get("tags") or []
-
-        # Проверяем пересечение тегов
-        return bool(set(target_tags) & set(product_tags))
-
-    def _group_offers_by_sellers(self, all_offers: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+            Данные магазина той же структуры
         """
-        Группировать предложения по продавцам и категориям
-        
-        Каждый оффер добавляется во все уровни своей иерархии категорий.
-        Пример: оффер с category_num="1.2.3" будет в categories["1"], ["1.2"], ["1.2.3"]
-        """
-        sellers_data = {}
-
-        for offer in all_offers:
-            seller_name = offer.get("seller_name")
-            if not seller_name:
-                continue
-
-            offer_id = offer["offer_id"]
-            title = offer.get("title", "")
-            price_raw = offer.get("price", 0)
-            category_num = offer.get("category_code", "")
-
-            try:
-                price = float(price_raw) if price_raw else 0
-            except (ValueError, TypeError):
-                logger.warning(f"Invalid price format for offer {offer_id}: {price_raw}")
-                price = 0
-
-            if seller_name not in sellers_data:
-                sellers_data[seller_name] = {
-                    "name": seller_name,
-                    "offers": {},
-                    "categories": {},
-                }
-
-            normalized = normalize_title(title)
-            offer_data_item = {
-                "name": title,
-                "price": price,
-                "clean_name": self.product_service.remove_stop_words(title),
-                "normalized_name": normalized,
-                "category": offer.get("category_name", ""),
-                "category_code": category_num,
-                "offer_data": offer
-            }
-
-            # Добавляем в общий список офферов
-            sellers_data[seller_name]["offers"][offer_id] = offer_data_item
-
-            # Добавляем в категории по иерархии (пропускаем None и "None")
-            if category_num and category_num != "None":
-                for level in self._get_category_hierarchy(category_num):
-                    if level not in sellers_data[seller_name]["categories"]:
-                        sellers_data[seller_name]["categories"][level] = {}
-                    sellers_data[seller_name]["categories"][level][offer_id] = offer_data_item
-
-        # Диагностика: показываем какие категории загружены
-        for seller_name, data in sellers_data.items():
-            categories = list(data.get("categories", {}).keys())[:10]
-            logger.info(f"  {seller_name}: {len(data['offers'])} offers, categories: {categories}")
-        
-        logger.debug(f"Grouped data for {len(sellers_data)} sellers")
-        return sellers_data
-
-    @staticmethod
-    def _get_category_hierarchy(category_num: str) -> List[str]:
-        """
-        Получить все уровни иерархии: "1.2.3" -> ["1", "1.2", "1.2.3"]
-        """
-        if not category_num:
-            return []
-        parts = category_num.split(".")
-        return [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        allowed_rows = rows_with_any_tag(seller_data.get("tags", {}), target_tags)
+        return {
+            "name": seller_data["name"],
+            "offers": seller_data["offers"].view(allowed_rows),
+            "categories": BucketsView(seller_data.get("categories", {}), allowed_rows),
+        }
 
     @staticmethod
     def _get_parent_category(category_num: str) -> Optional[str]:
@@ -545,25 +377,77 @@ class ShopSearchService:
             return None
         return ".".join(category_num.split(".")[:-1])
 
+    @staticmethod
+    def _candidate_offers(
+            seller_data: Mapping[str, Any],
+            target_tokens: Sequence[Set[str]]
+    ) -> Tuple[Mapping[Any, Any], List[Optional[array]]]:
+        """
+        Офферы продавца, которые стоит сравнивать с запросами корзины
+
+        Кандидаты запроса — офферы с общим словом или триграммами слова запроса
+        (seller["search"]). Если у запроса кандидатов нет, он сравнивается со
+        всеми офферами продавца: полный перебор медленнее, но не теряет
+        совпадений, которые fuzzy-метрики находят без общих слов.
+
+        Returns:
+            (офферы для скоринга — объединение кандидатов всех запросов,
+            кандидаты каждого запроса или None — все офферы)
+        """
+        offers = seller_data["offers"]
+        search_index = seller_data.get("search")
+        if search_index is None:
+            return offers, [None] * len(target_tokens)
+
+        candidates = [search_index.candidates(tokens) if tokens else None for tokens in target_tokens]
+        candidates = [rows if rows else None for rows in candidates]
+        if any(rows is None for rows in candidates):
+            return offers, candidates
+
+        union = array("I")
+        for row in merge(*candidates):
+            if not union or union[-1] != row:
+                union.append(row)
+        return offers.view(union), candidates
+
     def _evaluate_seller(self, target_products: List[str], seller_name: str, seller_data: Dict[str, Any],
-                         target_products_info: Dict[str, Dict[str, Any]]) -> ShopSolution:
-        """Оценить продавца для списка товаров"""
+                         target_products_info: Dict[str, Dict[str, Any]],
+                         queries: Optional[List[PreparedQuery]] = None,
+                         target_tokens: Optional[List[Set[str]]] = None) -> ShopSolution:
+        """
+        Оценить продавца для списка товаров
+
+        Fuzzy score всех товаров корзины по офферам-кандидатам продавца
+        считается пакетно (одна матрица на метрику), выбор лучшего оффера
+        для каждого товара — по очереди, с учётом уже занятых офферов.
+        """
         total_price = 0
         found_products = []
         used_offer_ids = set()
 
         logger.debug(f"Evaluating seller: {seller_data['name']}")
 
-        for target_product in target_products:
+        if queries is None:
+            queries = [PreparedQuery(product) for product in target_products]
+        if target_tokens is None:
+            target_tokens = [title_tokens(query.clean, query.normalized) for query in queries]
+
+        offers, candidates = self._candidate_offers(seller_data, target_tokens)
+        titles = OfferTitles(offers)
+        scores_full, scores_clean, scores_norm = self.product_service.score_offers(queries, titles)
+
+        for i, (target_product, query) in enumerate(zip(target_products, queries)):
             # Получаем информацию об искомом товаре
             product_info = target_products_info.get(target_product, {})
 
-            offer_id, offer_data, similarity, match_type = self.product_service.find_best_product_match(
-                target_product,
-                seller_data["offers"],
+            offer_id, offer_data, similarity, match_type = self.product_service.pick_best_match(
+                query,
+                titles,
+                (scores_full[i], scores_clean[i], scores_norm[i]),
                 used_offer_ids,
                 target_category=product_info.get("category"),
-                target_price=product_info.get("price")
+                target_price=product_info.get("price"),
+                allowed=titles.mask(candidates[i])
             )
 
             if offer_id:
@@ -603,8 +487,11 @@ class ShopSearchService:
             products_found_count=products_found_count
         )
 
-    def _get_target_products_info(self, product_names: List[str], all_offers: List[Dict[str, Any]]) -> Dict[
-        str, Dict[str, Any]]:
+    def _get_target_products_info(
+            self,
+            product_names: List[str],
+            all_offers: Union[CatalogSnapshot, Sequence[Mapping[str, Any]]]
+    ) -> Dict[str, Dict[str, Any]]:
         """Получить информацию об искомых товарах из БД"""
         products_info = {}
 
@@ -612,24 +499,41 @@ class ShopSearchService:
             product_name_lower = product_name.lower()
             product_name_normalized = normalize_title(product_name)
 
-            for offer in all_offers:
-                title = offer.get("title", "").lower()
-                title_normalized = normalize_title(title)
-                if product_name_lower in title or product_name_normalized in title_normalized:
-                    price_raw = offer.get("price")
-                    try:
-                        price = float(price_raw) if price_raw else None
-                    except (ValueError, TypeError):
-                        logger.warning(f"Invalid price format for product '{product_name}': {price_raw}")
-                        price = None
-
-                    products_info[product_name] = {
-                        "category": offer.get("category_name"),
-                        "price": price
-                    }
-                    break  # Берём первое найденное совпадение
-
-            if product_name not in products_info:
+            if isinstance(all_offers, CatalogSnapshot):
+                # Первое совпадение ищется по готовым названиям снимка, значения — из колонок
+                store = all_offers.offers
+                lower_text, normalized_text = all_offers.title_text()
+                rows = [
+                    row for row in (
+                        lower_text.first_row(product_name_lower),
+                        normalized_text.first_row(product_name_normalized)
+                    ) if row is not None
+                ]
+                row = min(rows) if rows else None
+                found: Optional[Tuple[Any, Any]] = (
+                    (store.value(row, "category_name"), store.value(row, "price")) if row is not None else None
+                )
+            else:
+                found = next((
+                    (offer.get("category_name"), offer.get("price")) for offer in all_offers
+                    if product_name_lower in offer.get("title", "").lower()
+                    or product_name_normalized in normalize_title(offer.get("title", "").lower())
+                ), None)
+
+            if found is not None:
+                category, price_raw = found
+                try:
+                    price = float(price_raw) if price_raw else None
+                except (ValueError, TypeError):
+                    logger.warning(f"Invalid price format for product '{product_name}': {price_raw}")
+                    price = None
+
+                # Берём первое найденное совпадение
+                products_info[product_name] = {
+                    "category": category,
+                    "price": price
+                }
+            else:
                 products_info[product_name] = {
                     "category": None,
                     "price": None
@@ -638,7 +542,7 @@ class ShopSearchService:
 
         return products_info
 
-    def _extract_key_words(self, title: str, max_words: int = 6) -> str:
+    def _extract_key_words(self, title: str, max_words: int = 6, normalized: Optional[str] = None) -> str:
         """
         Извлечь ключевые слова из названия товара для fuzzy matching.
 
@@ -648,11 +552,13 @@ class ShopSearchService:
         Args:
             title: Полное название товара
             max_words: Максимальное количество слов (по умолчанию 6)
+            normalized: Уже нормализованное название (колонка снимка), если есть
 
         Returns:
             Ключевые слова для поиска
         """
-        normalized = normalize_title(title)
+        if normalized is None:
+            normalized = normalize_title(title)
         clean = self.product_service.remove_stop_words(normalized)
 
         words = clean.split()[:max_words]
@@ -661,38 +567,7 @@ class ShopSearchService:
         logger.debug(f"Extracted key words from '{title}': '{result}'")
         return result
 
-    def _calculate_fuzzy_score(self, query: str, target: str) -> float:
-        """
-        Рассчитать комбинированный fuzzy score используя rapidfuzz
-        
-        Комбинирует несколько метрик:
-        - token_set_ratio: устойчив к перестановкам слов и дубликатам
-        - token_sort_ratio: сортирует слова перед сравнением
-        - partial_ratio: находит лучшее частичное совпадение
-        
-        Args:
-            query: Поисковый запрос
-            target: Строка для сравнения
-            
-        Returns:
-            Нормализованный score от 0 до 1
-        """
-        # Получаем разные метрики (rapidfuzz возвращает 0-100)
-        token_set = fuzz.token_set_ratio(query, target)
-        token_sort = fuzz.token_sort_ratio(query, target)
-        partial = fuzz.partial_ratio(query, target)
-        
-        # Комбинируем с весами
-        combined = (
-            FUZZY_WEIGHTS['token_set'] * token_set +
-            FUZZY_WEIGHTS['token_sort'] * token_sort +
-            FUZZY_WEIGHTS['partial'] * partial
-        )
-        
-        # Нормализуем к 0-1
-        return combined / 100.0
-
-    def _normalize_title_for_identity(self, title: str) -> str:
+    def _normalize_title_for_identity(self, title: str, normalized: Optional[str] = None) -> str:
         """
         Нормализовать название для определения идентичности.
 
@@ -702,11 +577,13 @@ class ShopSearchService:
 
         Args:
             title: Исходное название
+            normalized: Уже нормализованное название (колонка снимка), если есть
 
         Returns:
             Нормализованное название
         """
-        normalized = normalize_title(title)
+        if normalized is None:
+            normalized = normalize_title(title)
 
         normalized = self.product_service.remove_stop_words(normalized)
 
@@ -750,8 +627,12 @@ class ShopSearchService:
             return True
         
         # Нормализуем названия для более точного сравнения
-        source_normalized = self._normalize_title_for_identity(source_title)
-        matched_normalized = self._normalize_title_for_identity(matched_title)
+        source_normalized = self._normalize_title_for_identity(
+            source_title, self._offer_normalized_title(source_offer)
+        )
+        matched_normalized = self._normalize_title_for_identity(
+            matched_title, self._offer_normalized_title(matched_offer)
+        )
         
         # Если нормализованные названия идентичны - точно один товар
         if source_normalized == matched_normalized and source_normalized:
@@ -866,16 +747,13 @@ class ShopSearchService:
             category_products = categories.get(current_category, {})
             
             if category_products:
-                matches = self._search_in_category(
-                    search_lower, category_products, target_price, min_threshold, search_query
+                top_matches = self._search_in_category(
+                    search_lower, category_products, target_price, min_threshold, search_query, limit
                 )
                 
-                if matches:
-                    matches.sort(key=lambda x: x["similarity"], reverse=True)
-                    top_matches = matches[:limit]
-                    
+                if top_matches:
                     logger.info(
-                        f"Found {len(matches)} matches in category '{current_category}', "
+                        f"Found matches in category '{current_category}', "
                         f"returning top {len(top_matches)}"
                     )
                     for i, match in enumerate(top_matches, 1):
@@ -901,18 +779,51 @@ class ShopSearchService:
             category_products: Dict[int, Dict[str, Any]],
             target_price: Optional[float],
             min_threshold: float,
-            search_query: str
+            search_query: str,
+            limit: int = 5
     ) -> List[Dict[str, Any]]:
-        """Поиск совпадений внутри одной категории"""
-        matches = []
-        
-        for offer_id, product in category_products.items():
-            product_name = product.get("name", "")
-            product_clean = product.get("clean_name", "")
+        """
+        Поиск лучших совпадений внутри одной категории
+
+        Fuzzy score запроса по всем офферам категории считается пакетно,
+        пары без шансов попасть в топ отсекаются уже внутри rapidfuzz
+        (score_cutoff). Бонусы за цену и жирность (вместе не больше
+        MAX_MATCH_BONUS) считаются по убыванию score, пока оффер ещё может
+        вытеснить худший из limit лучших; топ хранится в куче размера limit.
+
+        Returns:
+            Не больше limit совпадений по убыванию similarity
+        """
+        titles = OfferTitles(category_products)
+        cutoff = min_threshold - MAX_MATCH_BONUS
+        scores = fuzzy_matrix(
+            [search_lower], titles.lower, score_cutoff=cutoff, top_k=limit, slack=MAX_MATCH_BONUS
+        )[0]
+        if len(scores) > limit:
+            # k-й score по полному названию — нижняя граница k-го результата
+            kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            cutoff = max(cutoff, float(kth) - MAX_MATCH_BONUS)
+        scores = np.maximum(scores, fuzzy_matrix(
+            [search_lower], titles.clean, score_cutoff=cutoff, top_k=limit, slack=MAX_MATCH_BONUS
+        )[0])
+
+        # Запрос — ключевые слова нормализованного названия (_extract_key_words)
+        target_fat = parse_normalized_attributes(search_query).fat_percent
+        candidates = np.flatnonzero(scores)
+        # По убыванию score, при равенстве — в порядке офферов категории
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        # Куча (similarity, -позиция, score): в корне — худшее из лучших
+        top: List[Tuple[float, int, float]] = []
+
+        for position in candidates.tolist():
+            best_score = float(scores[position])
+            # Дальше score только меньше: бонусов не хватит, чтобы вытеснить худшего
+            # (1e-9 — запас на погрешность сложения с плавающей точкой)
+            if len(top) == limit and best_score + MAX_MATCH_BONUS + 1e-9 < top[0][0]:
+                break
 
-            score_full = self._calculate_fuzzy_score(search_lower, product_name.lower())
-            score_clean = self._calculate_fuzzy_score(search_lower, product_clean.lower())
-            best_score = max(score_full, score_clean)
+            product = titles.item(position)
 
             # Бонус за близость цены
             price_bonus = 0.0
@@ -925,8 +836,7 @@ class ShopSearchService:
 
             # Бонус за совпадение жирности
             fat_bonus = 0.0
-            target_fat = self._extract_fat_percent(search_query)
-            product_fat = self._extract_fat_percent(product_name)
+            product_fat = titles.attributes(position).fat_percent
             if target_fat is not None and product_fat is not None:
                 if target_fat == product_fat:
                     fat_bonus = 0.10  # +10% за точное совпадение жирности
@@ -934,30 +844,43 @@ class ShopSearchService:
                     fat_bonus = 0.05  # +5% за близкую жирность (±0.5%)
 
             final_score = min(best_score + price_bonus + fat_bonus, 1.0)
+            if final_score < min_threshold:
+                continue
 
-            if final_score >= min_threshold:
-                match_type = self._determine_match_type(
-                    best_score, search_query, product_name, product_clean
-                )
-                offer_data = product.get("offer_data")
-                offer_payload = (
-                    offer_data
-                    if offer_data
-                    else offer_to_response({
-                        "offer_id": offer_id,
-                        "title": product_name,
-                        "price": product.get("price"),
-                        "category_name": product.get("category"),
-                        **(product.get("offer_data") or {}),
-                    })
-                )
-                matches.append({
+            entry = (final_score, -position, best_score)
+            if len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        matches = []
+        for final_score, negative_position, best_score in sorted(top, reverse=True):
+            position = -negative_position
+            offer_id = titles.offer_ids[position]
+            product = titles.item(position)
+            product_name = titles.names[position]
+            match_type = self._determine_match_type(
+                best_score, search_query, product_name, titles.clean[position]
+            )
+            offer_data = product.get("offer_data")
+            offer_payload = (
+                offer_data
+                if offer_data
+                else offer_to_response({
                     "offer_id": offer_id,
-                    "similarity": final_score,
-                    "match_type": match_type,
-                    "offer": offer_payload,
+                    "title": product_name,
+                    "price": product.get("price"),
+                    "category_name": product.get("category"),
+                    **(product.get("offer_data") or {}),
                 })
-        
+            )
+            matches.append({
+                "offer_id": offer_id,
+                "similarity": final_score,
+                "match_type": match_type,
+                "offer": offer_payload,
+            })
+
         return matches
 
     def find_similar_offers_in_same_shop(self, offer_id: int, limit: int = 10) -> List[Dict[str, Any]]:
@@ -967,7 +890,7 @@ class ShopSearchService:
         Использует ту же логику, что и find_alternatives_for_offers:
         - Извлечение ключевых слов через _extract_key_words
         - Поиск совпадений через _find_top_matches
-        - Группировка офферов через _group_offers_by_sellers
+        - Группировка офферов из индекса каталога текущего снимка кэша
         
         Args:
             offer_id: ID исходного оффера
@@ -978,15 +901,11 @@ class ShopSearchService:
         """
         logger.info(f"Searching similar offers for offer_id: {offer_id}")
         
-        # Получаем все офферы из кэша
-        all_offers = cache_manager.get_all_offers()
-        
-        # Находим исходный оффер
-        source_offer = None
-        for offer in all_offers:
-            if offer.get("offer_id") == offer_id:
-                source_offer = offer
-                break
+        # Один снимок кэша на весь запрос
+        snapshot = cache_manager.get_snapshot()
+
+        # Находим исходный оффер по индексу offer_id
+        source_offer = snapshot.get_offer(offer_id)
         
         if not source_offer:
             logger.warning(f"Offer {offer_id} not found")
@@ -1003,28 +922,23 @@ class ShopSearchService:
         
         logger.info(f"Source offer: '{source_title[:60]}...' from shop: {source_seller}, category_num: {source_category_num}")
         
-        sellers_data = self._group_offers_by_sellers(all_offers)
+        seller_data = snapshot.catalog_index.get_seller(source_seller)
         
-        if source_seller not in sellers_data:
+        if seller_data is None:
             logger.warning(f"Shop {source_seller} not found in sellers data")
             return []
         
-        seller_data = sellers_data[source_seller]
-        
-        # Создаём копию seller_data с исключённым исходным оффером
+        # Представление групп продавца без исходного оффера (группы не копируются)
+        excluded_rows = frozenset([snapshot.offers.find_row(offer_id)])
         filtered_seller_data = {
             "name": seller_data["name"],
-            "offers": {oid: p for oid, p in seller_data["offers"].items() if oid != offer_id},
-            "categories": {}
+            "offers": seller_data["offers"].view(excluded_rows=excluded_rows),
+            "categories": BucketsView(seller_data.get("categories", {}), excluded_rows=excluded_rows)
         }
-        for cat_num, cat_offers in seller_data.get("categories", {}).items():
-            filtered = {oid: p for oid, p in cat_offers.items() if oid != offer_id}
-            if filtered:
-                filtered_seller_data["categories"][cat_num] = filtered
         
-        logger.info(f"Found {len(filtered_seller_data['offers'])} offers in shop {source_seller} (excluding source)")
+        logger.info(f"Found {len(seller_data['offers']) - 1} offers in shop {source_seller} (excluding source)")
         
-        search_query = self._extract_key_words(source_title)
+        search_query = self._extract_key_words(source_title, normalized=self._offer_normalized_title(source_offer))
         logger.info(f"Extracted keywords: '{search_query}'")
         
         similar_offers = self._find_top_matches(
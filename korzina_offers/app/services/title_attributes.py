@@ -0,0 +1,116 @@
+"""
+Структурированные атрибуты товара из названия: жирность, вес, объём, фасовка
+
+Разбор идёт по нормализованному названию: TitleNormalizer уже привёл единицы
+к каноничному виду (литры → мл, килограммы → г, «6 х 0,9 л» → «6x900мл»),
+поэтому перевод единиц живёт только в нормализаторе, а здесь — простые
+регулярки по каноничной записи. Для офферов атрибуты считаются один раз
+при загрузке кэша и хранятся в OfferStore рядом с нормализованными названиями.
+"""
+import math
+import re
+from typing import Optional, Sequence, Tuple
+from app.services.title_normalizer import normalize_title
+
+# Порядок атрибутов в колонке OfferStore.attributes
+ATTRIBUTE_FIELDS = ("fat_percent", "grams", "milliliters", "multipack", "pieces")
+ATTRIBUTE_COUNT = len(ATTRIBUTE_FIELDS)
+
+_RE_FAT_PERCENT = re.compile(r'(?<![\d.])(\d+(?:\.\d+)?)\s*%')
+_RE_GRAMS = re.compile(r'(?<![\d.])(\d+(?:\.\d+)?)г(?!\w)')
+_RE_MILLILITERS = re.compile(r'(?<![\d.])(\d+(?:\.\d+)?)мл(?!\w)')
+_RE_MULTIPACK = re.compile(r'(?<![\d.])(\d+)x(?=\d)')
+_RE_PIECES = re.compile(r'(?<![\d.])(\d+)шт(?!\w)')
+
+
+class TitleAttributes:
+    """Атрибуты товара из названия (None — в названии не указано)"""
+
+    __slots__ = ATTRIBUTE_FIELDS
+
+    def __init__(
+            self,
+            fat_percent: Optional[float] = None,
+            grams: Optional[float] = None,
+            milliliters: Optional[float] = None,
+            multipack: Optional[int] = None,
+            pieces: Optional[int] = None
+    ):
+        self.fat_percent = fat_percent
+        self.grams = grams
+        self.milliliters = milliliters
+        # Штук в мультиупаковке («6x900мл» → 6)
+        self.multipack = multipack
+        # Штук в упаковке («10шт» → 10)
+        self.pieces = pieces
+
+    @property
+    def quantity(self) -> Optional[float]:
+        """Вес в граммах, а если его нет — объём в миллилитрах"""
+        return self.grams if self.grams is not None else self.milliliters
+
+    def to_values(self) -> Tuple[float, ...]:
+        """Значения для колонки хранилища (NaN вместо None)"""
+        return tuple(
+            math.nan if value is None else float(value)
+            for value in (self.fat_percent, self.grams, self.milliliters, self.multipack, self.pieces)
+        )
+
+    @classmethod
+    def from_values(cls, values: Sequence[float]) -> "TitleAttributes":
+        """Восстановить атрибуты из значений колонки хранилища"""
+        fat_percent, grams, milliliters, multipack, pieces = (
+            None if math.isnan(value) else value for value in values
+        )
+        return cls(
+            fat_percent,
+            grams,
+            milliliters,
+            None if multipack is None else int(multipack),
+            None if pieces is None else int(pieces)
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TitleAttributes):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in ATTRIBUTE_FIELDS)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in ATTRIBUTE_FIELDS if getattr(self, field) is not None
+        )
+        return f"TitleAttributes({fields})"
+
+
+def _first_number(pattern: re.Pattern, text: str) -> Optional[float]:
+    match = pattern.search(text)
+    return float(match.group(1)) if match else None
+
+
+def parse_normalized_attributes(normalized: str) -> TitleAttributes:
+    """
+    Разобрать атрибуты из уже нормализованного названия (normalize_title)
+
+    Args:
+        normalized: Нормализованное название
+
+    Returns:
+        TitleAttributes
+    """
+    if not normalized:
+        return TitleAttributes()
+
+    multipack = _first_number(_RE_MULTIPACK, normalized)
+    pieces = _first_number(_RE_PIECES, normalized)
+    return TitleAttributes(
+        fat_percent=_first_number(_RE_FAT_PERCENT, normalized),
+        grams=_first_number(_RE_GRAMS, normalized),
+        milliliters=_first_number(_RE_MILLILITERS, normalized),
+        multipack=None if multipack is None else int(multipack),
+        pieces=None if pieces is None else int(pieces)
+    )
+
+
+def parse_title_attributes(title: str) -> TitleAttributes:
+    """Разобрать атрибуты из исходного названия"""
+    return parse_normalized_attributes(normalize_title(title))
@@ -6,9 +6,23 @@
 - Раскрытие сокращений (пастер. → пастеризованное)
 - Замена синонимов на каноничные формы
 - Очистка от шума (маркировки, спецсимволы)
+
+Результаты normalize_title запоминаются в LRU ограниченного размера
+(TITLE_NORMALIZE_CACHE_SIZE): одни и те же запросы и заголовки нормализуются
+на каждый /api/search много раз. Нормализованные названия офферов снимка
+хранятся в колонке OfferStore.normalized_names. При каждой загрузке кэша
+refresh_normalizer сверяет отпечаток словарей и, если словари изменились,
+пересобирает нормализатор и сбрасывает LRU.
 """
+import hashlib
 import re
-from typing import Optional
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+from app.config import config
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 # ---------------------------------------------------------------------------
@@ -209,6 +223,22 @@ def _normalize_fat_percent(match: re.Match) -> str:
     return f"{match.group(1)}%"
 
 
+def dictionaries_fingerprint(
+    abbreviations: Optional[dict[str, str]] = None,
+    synonyms: Optional[dict[str, str]] = None,
+    markings: Optional[list[str]] = None,
+) -> str:
+    """Отпечаток словарей нормализации (меняется при любой правке словарей)."""
+    digest = hashlib.sha1()
+    for part in (
+        sorted((ABBREVIATIONS if abbreviations is None else abbreviations).items()),
+        sorted((SYNONYMS if synonyms is None else synonyms).items()),
+        list(MARKINGS_TO_REMOVE if markings is None else markings),
+    ):
+        digest.update(repr(part).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
 class TitleNormalizer:
     """
     Нормализатор названий товаров.
@@ -225,13 +255,18 @@ class TitleNormalizer:
         synonyms: Optional[dict[str, str]] = None,
         markings: Optional[list[str]] = None,
     ):
-        self._abbreviations = abbreviations or ABBREVIATIONS
-        self._synonyms = synonyms or SYNONYMS
-        self._markings = markings or MARKINGS_TO_REMOVE
+        # Пустой словарь отключает соответствующий шаг, None — словарь по умолчанию
+        self._abbreviations = ABBREVIATIONS if abbreviations is None else abbreviations
+        self._synonyms = SYNONYMS if synonyms is None else synonyms
+        self._markings = MARKINGS_TO_REMOVE if markings is None else markings
 
         self._abbr_pattern = self._build_abbr_pattern(self._abbreviations)
         self._marking_patterns = self._build_marking_patterns(self._markings)
         self._synonym_pattern = self._build_synonym_pattern(self._synonyms)
+        # Отпечаток словарей, по которым собраны регулярки
+        self.fingerprint = dictionaries_fingerprint(
+            self._abbreviations, self._synonyms, self._markings
+        )
 
     # ---- public API -------------------------------------------------------
 
@@ -326,6 +361,70 @@ class TitleNormalizer:
         return re.compile(r'(?<!\w)(' + '|'.join(escaped) + r')(?!\w)', re.IGNORECASE)
 
 
+class NormalizationCache:
+    """LRU нормализованных названий {название: нормализованное название}"""
+
+    def __init__(self, normalize: Callable[[str], str], max_size: int = 50000):
+        """
+        Args:
+            normalize: Функция нормализации (вызывается при промахе)
+            max_size: Сколько названий держать в LRU (0 — не кэшировать)
+        """
+        self._normalize = normalize
+        self.max_size = max(0, max_size)
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = Lock()
+        # Увеличивается при каждом сбросе: результат, посчитанный
+        # до него старым нормализатором, в LRU не попадает
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, title: str) -> str:
+        """Нормализованное название (из LRU или посчитанное заново)."""
+        if not title:
+            return ""
+
+        with self._lock:
+            normalized = self._entries.get(title)
+            if normalized is not None:
+                self._entries.move_to_end(title)
+                self.hits += 1
+                return normalized
+            self.misses += 1
+            epoch = self._epoch
+
+        normalized = self._normalize(title)
+
+        with self._lock:
+            if epoch == self._epoch and self.max_size > 0:
+                self._entries[title] = normalized
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return normalized
+
+    def clear(self) -> None:
+        """Забыть всё (после смены словарей)."""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика LRU."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 # Singleton-экземпляр для переиспользования
 _default_normalizer: Optional[TitleNormalizer] = None
 
@@ -338,6 +437,37 @@ def get_normalizer() -> TitleNormalizer:
     return _default_normalizer
 
 
+_title_cache = NormalizationCache(
+    lambda title: get_normalizer().normalize(title),
+    max_size=config.TITLE_NORMALIZE_CACHE_SIZE,
+)
+
+
+def get_title_cache() -> NormalizationCache:
+    """LRU нормализованных названий (для статистики и учёта памяти)."""
+    return _title_cache
+
+
+def refresh_normalizer() -> str:
+    """
+    Пересобрать нормализатор, если словари изменились с момента его сборки.
+
+    Вызывается при каждой загрузке кэша: при смене словарей сбрасывается LRU,
+    а нормализованные названия прошлого снимка не переиспользуются
+    (OfferStore сравнивает отпечатки).
+
+    Returns:
+        Отпечаток текущих словарей
+    """
+    global _default_normalizer
+    fingerprint = dictionaries_fingerprint()
+    if get_normalizer().fingerprint != fingerprint:
+        logger.info(f"Title normalizer dictionaries changed ({fingerprint}), rebuilding and clearing cache")
+        _default_normalizer = TitleNormalizer()
+        _title_cache.clear()
+    return fingerprint
+
+
 def normalize_title(title: str) -> str:
-    """Удобная функция-обёртка для быстрой нормализации."""
-    return get_normalizer().normalize(title)
+    """Удобная функция-обёртка для быстрой нормализации (с LRU)."""
+    return _title_cache.normalize(title)
@@ -0,0 +1,20 @@
+"""
+Общие фикстуры для тестов
+"""
+import pytest
+from app.database.client import cache_manager
+
+
+@pytest.fixture
+def cached_offers():
+    """Загрузить офферы в кэш напрямую (без БД) и восстановить состояние после теста"""
+    saved_state = dict(vars(cache_manager))
+
+    def _load(offers):
+        cache_manager.publish_offers(offers)
+        return cache_manager
+
+    yield _load
+
+    vars(cache_manager).clear()
+    vars(cache_manager).update(saved_state)
@@ -1,10 +1,14 @@
 """
 Тесты для API
 """
+import json
+import time
 import pytest
 from unittest.mock import Mock, patch
 from fastapi.testclient import TestClient
 from app.api import create_app
+from app.config import config
+from app.database.client import health_probe
 from app.models import SearchRequest, ShopSolution, ProductMatch, MatchType
 
 
@@ -48,6 +52,7 @@ class TestHealthEndpoint:
     def test_health_check_success(self, mock_health_check, client):
         """Тест успешной проверки здоровья (GET)"""
         mock_health_check.return_value = True
+        health_probe.probe()
         
         response = client.get('/api/health')
         
@@ -60,6 +65,7 @@ class TestHealthEndpoint:
     def test_health_check_success_post(self, mock_health_check, client):
         """Тест успешной проверки здоровья (POST)"""
         mock_health_check.return_value = True
+        health_probe.probe()
         
         response = client.post('/api/health')
         
@@ -72,12 +78,35 @@ class TestHealthEndpoint:
     def test_health_check_failure(self, mock_health_check, client):
         """Тест неудачной проверки здоровья"""
         mock_health_check.return_value = False
+        health_probe.probe()
         
         response = client.get('/api/health')
         
         assert response.status_code == 500
         data = response.json()
         assert data['detail'] == 'Database connection failed'
+    
+    @patch('app.database.client.cache_manager.health_check')
+    def test_health_check_uses_probe_result(self, mock_health_check, client):
+        """Тест: запросы к /health не обращаются к БД, отдаётся результат фоновой проверки"""
+        mock_health_check.return_value = True
+        health_probe.probe()
+        
+        for _ in range(3):
+            assert client.get('/api/health').status_code == 200
+        
+        mock_health_check.assert_called_once()
+    
+    @patch('app.database.client.cache_manager.health_check')
+    def test_health_check_stale_probe(self, mock_health_check, client):
+        """Тест: давно не обновлявшийся результат проверки не считается здоровым"""
+        mock_health_check.return_value = True
+        health_probe.probe()
+        
+        with patch.object(health_probe, 'max_age', -1):
+            response = client.get('/api/health')
+        
+        assert response.status_code == 500
 
 
 class TestStatsEndpoint:
@@ -105,13 +134,12 @@ class TestStatsEndpoint:
 class TestOffersEndpoint:
     """Тесты для endpoint /api/offers"""
     
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_get_offers_default(self, mock_offers, client):
+    def test_get_offers_default(self, cached_offers, client):
         """Тест получения офферов с дефолтными параметрами"""
-        mock_offers.return_value = [
+        cached_offers([
             {'offer_id': i, 'title': f'Product {i}', 'seller_name': 'Test Seller'}
             for i in range(1, 26)
-        ]
+        ])
         
         response = client.get('/api/offers')
         
@@ -123,13 +151,12 @@ class TestOffersEndpoint:
         assert data['count'] == 20
         assert len(data['offers']) == 20
     
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_get_offers_pagination(self, mock_offers, client):
+    def test_get_offers_pagination(self, cached_offers, client):
         """Тест пагинации офферов"""
-        mock_offers.return_value = [
+        cached_offers([
             {'offer_id': i, 'title': f'Product {i}', 'seller_name': 'Test Seller'}
             for i in range(1, 26)
-        ]
+        ])
         
         response = client.get('/api/offers?limit=5&offset=10')
         
@@ -140,15 +167,15 @@ class TestOffersEndpoint:
         assert data['offset'] == 10
         assert data['count'] == 5
         assert len(data['offers']) == 5
+        assert data['offers'][0]['offer_id'] == 11
     
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_get_offers_filter_by_seller(self, mock_offers, client):
+    def test_get_offers_filter_by_seller(self, cached_offers, client):
         """Тест фильтрации по продавцу"""
-        mock_offers.return_value = [
+        cached_offers([
             {'offer_id': 1, 'title': 'Product 1', 'seller_name': 'Seller A'},
             {'offer_id': 2, 'title': 'Product 2', 'seller_name': 'Seller B'},
             {'offer_id': 3, 'title': 'Product 3', 'seller_name': 'Seller A'},
-        ]
+        ])
         
         response = client.get('/api/offers?seller=Seller A')
         
@@ -158,6 +185,275 @@ class TestOffersEndpoint:
         assert data['count'] == 2
         assert all(o['seller_name'] == 'Seller A' for o in data['offers'])
 
+    def test_get_offers_combined_filters(self, cached_offers, client):
+        """Тест пересечения фильтров по продавцу, категории, тегу и названию"""
+        cached_offers([
+            {'offer_id': 1, 'title': 'Молоко 3.2%', 'seller_name': 'Seller A',
+             'category_name': 'Молоко', 'tags': ['молоко', 'акция']},
+            {'offer_id': 2, 'title': 'Молоко 1.5%', 'seller_name': 'Seller A',
+             'category_name': 'Молоко', 'tags': ['молоко']},
+            {'offer_id': 3, 'title': 'Молоко 3.2%', 'seller_name': 'Seller B',
+             'category_name': 'Молоко', 'tags': ['молоко', 'акция']},
+            {'offer_id': 4, 'title': 'Кефир', 'seller_name': 'Seller A',
+             'category_name': 'Кефир', 'tags': ['акция']},
+        ])
+
+        response = client.get('/api/offers?seller=Seller A&category=Молоко&tag=акция&q=МОЛОКО')
+
+        data = response.json()
+        assert data['total'] == 1
+        assert [o['offer_id'] for o in data['offers']] == [1]
+
+        response = client.get('/api/offers?tag=акция&limit=1&offset=1')
+
+        data = response.json()
+        assert data['total'] == 3
+        assert [o['offer_id'] for o in data['offers']] == [3]
+
+        response = client.get('/api/offers?seller=Unknown')
+
+        assert response.json()['total'] == 0
+
+
+class TestOffersCursorAndExport:
+    """Тесты для курсорной пагинации и выгрузки /api/offers/export"""
+
+    @staticmethod
+    def _offers(ids):
+        return [
+            {'offer_id': i, 'title': f'Product {i}', 'seller_name': 'Seller A' if i % 2 else 'Seller B'}
+            for i in ids
+        ]
+
+    def test_cursor_walks_catalog_across_refresh(self, cached_offers, client):
+        """Тест: курсор продолжает обход после обновления кэша без пропусков и повторов"""
+        manager = cached_offers(self._offers([5, 1, 4, 2, 3]))
+
+        first = client.get('/api/offers?limit=2').json()
+        assert [o['offer_id'] for o in first['offers']] == [1, 2]
+        assert first['next_cursor']
+
+        # Между страницами каталог обновился: оффер 1 удалён, добавлен 6
+        manager.publish_offers(self._offers([2, 3, 4, 5, 6]))
+
+        seen = [o['offer_id'] for o in first['offers']]
+        cursor = first['next_cursor']
+        while cursor:
+            page = client.get(f'/api/offers?limit=2&cursor={cursor}').json()
+            assert page['generation'] == first['generation'] + 1
+            seen.extend(o['offer_id'] for o in page['offers'])
+            cursor = page['next_cursor']
+
+        assert seen == [1, 2, 3, 4, 5, 6]
+
+    def test_cursor_with_filter(self, cached_offers, client):
+        """Тест: курсор работает вместе с фильтрами"""
+        cached_offers(self._offers(range(1, 8)))
+
+        first = client.get('/api/offers?seller=Seller A&limit=2').json()
+        second = client.get(f"/api/offers?seller=Seller A&limit=2&cursor={first['next_cursor']}").json()
+
+        assert [o['offer_id'] for o in first['offers']] == [1, 3]
+        assert [o['offer_id'] for o in second['offers']] == [5, 7]
+        assert second['next_cursor'] is None
+
+    def test_invalid_cursor(self, client):
+        """Тест некорректного курсора"""
+        response = client.get('/api/offers?cursor=not-a-cursor')
+
+        assert response.status_code == 400
+
+    def test_export_streams_ndjson(self, cached_offers, client):
+        """Тест выгрузки офферов в NDJSON"""
+        cached_offers(self._offers([3, 1, 2]))
+
+        response = client.get('/api/offers/export?seller=Seller A')
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row['offer_id'] for row in rows] == [1, 3]
+        assert rows[0]['title'] == 'Product 1'
+
+
+class TestOfferLookupEndpoints:
+    """Тесты для endpoint /api/offer, /api/offers/batch и /api/compare_prices"""
+
+    @pytest.fixture(autouse=True)
+    def offers(self, cached_offers):
+        cached_offers([
+            {"offer_id": 1, "title": "Молоко", "seller_name": "Shop A", "price": 100},
+            {"offer_id": 2, "title": "Молоко", "seller_name": "Shop B", "price": 90},
+            {"offer_id": 3, "title": "Хлеб", "seller_name": "Shop B", "price": 40},
+        ])
+
+    def test_get_offer_by_id(self, client):
+        """Тест получения оффера по ID"""
+        response = client.get('/api/offer?offer_id=2')
+
+        assert response.status_code == 200
+        assert response.json()['offer']['seller_name'] == 'Shop B'
+
+    def test_get_offer_not_found(self, client):
+        """Тест отсутствующего оффера"""
+        response = client.get('/api/offer?offer_id=42')
+
+        assert response.status_code == 404
+
+    def test_get_offers_batch(self, client):
+        """Тест получения нескольких офферов за один запрос"""
+        response = client.post('/api/offers/batch', json={'offer_ids': [3, 42, 1]})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['count'] == 2
+        assert [o['offer_id'] for o in data['offers']] == [3, 1]
+        assert data['missing_ids'] == [42]
+
+    def test_compare_prices(self, client):
+        """Тест сравнения цен по ID офферов"""
+        response = client.post('/api/compare_prices?offer_ids=2&offer_ids=3&offer_ids=1')
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['shop_name'] == 'Shop A'
+        assert data['total_price'] == 100
+
+
+class TestCacheRefreshEndpoints:
+    """Тесты для endpoint /api/cache/refresh"""
+
+    @patch('app.database.client.cache_manager.refresh_cache', return_value=True)
+    def test_refresh_returns_pollable_job(self, mock_refresh, client):
+        """Тест: обновление ставится в очередь, статус задачи можно опросить"""
+        response = client.post('/api/cache/refresh?mode=delta')
+
+        assert response.status_code == 202
+        job_id = response.json()['job']['job_id']
+
+        for _ in range(100):
+            job = client.get(f'/api/cache/refresh/{job_id}').json()['job']
+            if job['status'] in ('succeeded', 'failed'):
+                break
+            time.sleep(0.01)
+
+        assert job['status'] == 'succeeded'
+        mock_refresh.assert_called_once_with('delta')
+
+    def test_refresh_unknown_mode(self, client):
+        """Тест неизвестного режима обновления"""
+        response = client.post('/api/cache/refresh?mode=sometimes')
+
+        assert response.status_code == 400
+
+    def test_refresh_job_not_found(self, client):
+        """Тест опроса несуществующей задачи"""
+        response = client.get('/api/cache/refresh/unknown')
+
+        assert response.status_code == 404
+
+
+class TestCacheMetricsEndpoints:
+    """Тесты для /api/cache/info и /api/metrics"""
+
+    def test_cache_info_reports_memory(self, cached_offers, client):
+        """Тест: в информации о кэше есть память по структурам"""
+        cached_offers([{'offer_id': 1, 'title': 'Молоко', 'seller_name': 'Shop A', 'price': 100}])
+
+        data = client.get('/api/cache/info').json()
+
+        assert data['memory']['total_bytes'] > 0
+        assert 'offers' in data['memory']['structures']
+        assert 'title_normalize_cache' in data['memory']['structures']
+        assert data['normalizer']['fingerprint'] == data['normalizer']['snapshot_fingerprint']
+
+    def test_metrics_in_prometheus_format(self, cached_offers, client):
+        """Тест метрик в формате Prometheus"""
+        cached_offers([{'offer_id': 1, 'title': 'Молоко', 'seller_name': 'Shop A', 'price': 100}])
+
+        response = client.get('/api/metrics')
+
+        assert response.status_code == 200
+        assert 'korzina_cache_offers 1' in response.text
+        assert 'korzina_cache_memory_bytes{structure="offers"}' in response.text
+
+
+class TestOfferDetailsHydration:
+    """Тесты догрузки холодных полей в ответы"""
+
+    def test_offer_endpoints_hydrate_cold_fields(self, cached_offers, client):
+        """Тест: описание догружается только для офферов ответа"""
+        from app.config import config
+        from app.database.client import cache_manager
+        manager = cached_offers([
+            {'offer_id': i, 'title': f'Товар {i}', 'seller_name': 'Shop A', 'price': 10} for i in range(1, 6)
+        ])
+        manager.details.clear()
+        source = Mock()
+        source.load_details.side_effect = lambda ids, columns: {i: {'description': f'Описание {i}'} for i in ids}
+
+        with patch.object(config, 'CACHE_HOT_COLUMNS', 'title,price,seller_name'), \
+                patch.object(cache_manager.details, 'data_source', source):
+            offer = client.get('/api/offer', params={'offer_id': '3'}).json()['offer']
+            page = client.get('/api/offers', params={'limit': 2}).json()['offers']
+
+        assert offer['description'] == 'Описание 3'
+        assert [o['description'] for o in page] == ['Описание 1', 'Описание 2']
+        requested = [list(call.args[0]) for call in source.load_details.call_args_list]
+        assert requested == [[3], [1, 2]]
+
+
+class TestIngestEndpoint:
+    """Тесты для endpoint /api/offers/ingest"""
+
+    @pytest.fixture(autouse=True)
+    def offers(self, cached_offers):
+        cached_offers([
+            {"offer_id": 1, "title": "Молоко", "seller_name": "Shop A", "price": 100},
+            {"offer_id": 2, "title": "Хлеб", "seller_name": "Shop B", "price": 40},
+        ])
+
+    def test_ingest_disabled_without_token(self, client):
+        """Тест: без INGEST_TOKEN приём изменений выключен"""
+        with patch.object(config, 'INGEST_TOKEN', None):
+            response = client.post('/api/offers/ingest', json={'deletes': [1]})
+
+        assert response.status_code == 503
+
+    def test_ingest_rejects_wrong_token(self, client):
+        """Тест: неверный токен"""
+        with patch.object(config, 'INGEST_TOKEN', 'secret'):
+            response = client.post('/api/offers/ingest', json={'deletes': [1]}, headers={'X-Ingest-Token': 'wrong'})
+
+        assert response.status_code == 401
+        assert client.get('/api/offer?offer_id=1').status_code == 200
+
+    def test_ingest_applies_changes(self, client):
+        """Тест: изменения видны сразу после ответа"""
+        with patch.object(config, 'INGEST_TOKEN', 'secret'):
+            response = client.post(
+                '/api/offers/ingest',
+                json={'upserts': [{'offer_id': 2, 'price': 35}], 'deletes': [1]},
+                headers={'X-Ingest-Token': 'secret'}
+            )
+
+        assert response.status_code == 200
+        assert response.json()['changed'] == 1
+        assert response.json()['deleted'] == 1
+        assert client.get('/api/offer?offer_id=2').json()['offer']['price'] == 35
+        assert client.get('/api/offer?offer_id=1').status_code == 404
+
+    def test_ingest_requires_offer_id(self, client):
+        """Тест: upsert без offer_id отклоняется"""
+        with patch.object(config, 'INGEST_TOKEN', 'secret'):
+            response = client.post(
+                '/api/offers/ingest',
+                json={'upserts': [{'price': 35}]},
+                headers={'X-Ingest-Token': 'secret'}
+            )
+
+        assert response.status_code == 422
+
 
 class TestSearchEndpoint:
     """Тесты для endpoint /api/search"""
@@ -244,15 +540,14 @@ class TestSearchGetEndpoint:
 class TestAllAlternativesEndpoint:
     """Тесты для endpoint /api/all_alternatives"""
 
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_all_alternatives_success(self, mock_offers, client):
+    def test_all_alternatives_success(self, cached_offers, client):
         """Тест успешного получения альтернатив"""
-        mock_offers.return_value = [
+        cached_offers([
             {"offer_id": 1, "title": "Яблоки", "seller_name": "Shop A", "price": 100, "category_name": "Фрукты"},
             {"offer_id": 2, "title": "Бананы", "seller_name": "Shop A", "price": 80, "category_name": "Фрукты"},
             {"offer_id": 3, "title": "Яблоки", "seller_name": "Shop B", "price": 90, "category_name": "Фрукты"},
             {"offer_id": 4, "title": "Бананы", "seller_name": "Shop B", "price": 70, "category_name": "Фрукты"},
-        ]
+        ])
 
         response = client.post('/api/all_alternatives', json={'offer_ids': [1, 2]})
 
@@ -268,12 +563,11 @@ class TestAllAlternativesEndpoint:
                 assert match['target_offer_id'] in [1, 2]
                 assert match['matched_offer'] is not None
 
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_all_alternatives_missing_offer(self, mock_offers, client):
+    def test_all_alternatives_missing_offer(self, cached_offers, client):
         """Тест запроса с отсутствующим оффером"""
-        mock_offers.return_value = [
+        cached_offers([
             {"offer_id": 1, "title": "Яблоки", "seller_name": "Shop A", "price": 100, "category_name": "Фрукты"},
-        ]
+        ])
 
         response = client.post('/api/all_alternatives', json={'offer_ids': [2]})
 
@@ -282,13 +576,12 @@ class TestAllAlternativesEndpoint:
         assert 'detail' in data
         assert 'Offers not found' in data['detail']
 
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_all_alternatives_returns_empty_offer_when_no_match(self, mock_offers, client):
+    def test_all_alternatives_returns_empty_offer_when_no_match(self, cached_offers, client):
         """Тест возвращает пустой оффер, если альтернативы не найдены"""
-        mock_offers.return_value = [
+        cached_offers([
             {"offer_id": 1, "title": "Арбузик 123", "seller_name": "Shop A", "price": 100, "category_name": "Фрукты"},
             {"offer_id": 2, "title": "Совсем другое название", "seller_name": "Shop B", "price": 120, "category_name": "Овощи"},
-        ]
+        ])
 
         response = client.post('/api/all_alternatives', json={'offer_ids': [1]})
 
@@ -0,0 +1,1101 @@
+"""
+Тесты для кэша
+"""
+import json
+import os
+import sqlite3
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event
+from unittest.mock import Mock, patch
+import pytest
+from app.cache import CacheManager, CacheRefresher
+from app.cache.cache_manager import ChangesRejected
+from app.cache.catalog_index import build_catalog_index, get_category_hierarchy, rows_with_any_tag
+from app.cache.leader import FileLease
+from app.cache.loader import PagedLoader, PageLoadError
+from app.cache.details import OfferDetailsCache
+from app.cache.memory import MemoryBudgetExceeded, deep_sizeof
+from app.cache.snapshot import CatalogSnapshot
+from app.cache.offer_store import BucketsView, OfferRow, OfferStore
+from app.cache.shared_segment import FORMAT_VERSION, SegmentError, attach_segment, read_current, write_segment
+from app.cache.sources import CatalogDataSource, LocalCatalogSource, create_data_source
+from app.cache.snapshot_file import SnapshotFileError, read_snapshot_file, write_snapshot_file
+from app.cache.token_index import TokenIndex, query_tokens
+from app.services.title_attributes import TitleAttributes
+from app.config import config
+from app.services import title_normalizer
+
+
+@pytest.fixture
+def sample_offers():
+    """Небольшой каталог из двух магазинов"""
+    return [
+        {"offer_id": 1, "title": "Молоко 3,2% 0.9 л", "seller_name": "Shop A", "price": 90,
+         "category_name": "Молоко", "category_code": "1.1"},
+        {"offer_id": 2, "title": "Кефир 1%", "seller_name": "Shop A", "price": "75.5",
+         "category_name": "Кефир", "category_code": "1.2"},
+        {"offer_id": 3, "title": "Молоко 2.5%", "seller_name": "Shop B", "price": None,
+         "category_name": "Молоко", "category_code": "1.1"},
+        {"offer_id": 4, "title": "Без продавца", "seller_name": None, "price": 10},
+    ]
+
+
+class TestCatalogIndex:
+    """Тесты для индекса каталога"""
+
+    def test_category_hierarchy(self):
+        """Тест разворачивания иерархии категорий"""
+        assert get_category_hierarchy("1.2.3") == ["1", "1.2", "1.2.3"]
+        assert get_category_hierarchy("") == []
+
+    def test_build_groups_by_seller_and_category(self, sample_offers):
+        """Тест группировки по продавцам и уровням категорий"""
+        index = build_catalog_index(OfferStore.build(sample_offers), version=3)
+
+        assert index.version == 3
+        assert index.offers_count == 3
+        assert sorted(index.sellers) == ["Shop A", "Shop B"]
+
+        shop_a = index.get_seller("Shop A")
+        assert set(shop_a["offers"]) == {1, 2}
+        assert set(shop_a["categories"]["1"]) == {1, 2}
+        assert set(shop_a["categories"]["1.1"]) == {1}
+
+        item = shop_a["offers"][1]
+        assert item["normalized_name"] == "молоко 3.2% 900мл"
+        assert item["price"] == 90.0
+        assert item["offer_data"] == sample_offers[0]
+        assert shop_a["offers"][2]["price"] == 75.5
+        assert index.get_seller("Shop B")["offers"][3]["price"] == 0
+
+    def test_tag_filter_is_view_over_buckets(self, sample_offers):
+        """Тест: фильтр по тегам сужает группы продавца без копирования офферов"""
+        sample_offers[0]["tags"] = ["milk", "promo"]
+        sample_offers[1]["tags"] = "promo"
+        sample_offers.append({"offer_id": 5, "title": "Сливки", "seller_name": "Shop A", "price": 150,
+                              "category_name": "Сливки", "category_code": "1.3", "tags": ["cream"]})
+        index = build_catalog_index(OfferStore.build(sample_offers), version=1)
+        shop_a = index.get_seller("Shop A")
+
+        assert dict(shop_a["tags"]) == {"milk": array("I", [0]), "promo": array("I", [0, 1]), "cream": array("I", [4])}
+        allowed = rows_with_any_tag(shop_a["tags"], ["milk", "cream", "unknown"])
+        assert list(allowed) == [0, 4]
+
+        offers = shop_a["offers"].view(allowed)
+        categories = BucketsView(shop_a["categories"], allowed)
+        assert set(offers) == {1, 5}
+        assert offers[5]["name"] == "Сливки"
+        assert set(categories["1"]) == {1, 5}
+        assert "1.2" not in categories
+        assert categories.get("1.2", {}) == {}
+        assert sorted(categories) == ["1", "1.1", "1.3"]
+
+    def test_bucket_view_excludes_rows(self, sample_offers):
+        """Тест: представление группы без исключённого оффера"""
+        sample_offers[2]["seller_name"] = "Shop A"
+        index = build_catalog_index(OfferStore.build(sample_offers), version=1)
+        shop_a = index.get_seller("Shop A")
+
+        offers = shop_a["offers"].view(excluded_rows={0})
+        categories = BucketsView(shop_a["categories"], excluded_rows={0})
+
+        assert list(offers) == [2, 3]
+        assert len(offers) == 2
+        assert len(shop_a["offers"].view(excluded_rows={0, 3})) == 2
+        assert list(offers.iter_rows()) == [1, 2]
+        assert 1 not in offers
+        assert [item["name"] for item in offers.values()] == [sample_offers[1]["title"], sample_offers[2]["title"]]
+        assert list(categories["1.1"]) == [3]
+        assert "1.1" in categories and list(categories["1"]) == [2, 3]
+        assert len(shop_a["offers"]) == 3
+
+    def test_nested_bucket_views(self, sample_offers):
+        """Тест: представление поверх представления пересекает фильтры исходной группы"""
+        sample_offers[2]["seller_name"] = "Shop A"
+        index = build_catalog_index(OfferStore.build(sample_offers), version=1)
+        offers = index.get_seller("Shop A")["offers"]
+
+        tagged = offers.view(array("I", [0, 2]), excluded_rows={1})
+        nested = tagged.view(array("I", [1, 2]))
+
+        assert isinstance(tagged.rows, array) and list(tagged.rows) == [0, 2]
+        assert list(nested.rows) == [2] and list(nested) == [3]
+        assert 1 not in nested and 3 in nested
+        assert list(tagged.view(excluded_rows={2})) == [1]
+        assert list(nested.view(excluded_rows={2})) == []
+
+    def test_token_index_candidates(self, sample_offers):
+        """Тест: кандидаты по общим словам и по триграммам слова с опечаткой"""
+        sample_offers.append({"offer_id": 5, "title": "Кефир Простоквашино 2.5%", "seller_name": "Shop A",
+                              "price": 70, "category_code": "1.3"})
+        index = build_catalog_index(OfferStore.build(sample_offers), version=1)
+        search = index.get_seller("Shop A")["search"]
+
+        assert isinstance(search, TokenIndex)
+        assert list(search.candidates(query_tokens("кефир"))) == [1, 4]
+        assert list(search.candidates(query_tokens("кифир"))) == [1, 4]
+        assert list(search.candidates(query_tokens("простаквашино"))) == [4]
+        assert search.candidates(query_tokens("шоколад")) == array("I")
+
+    def test_index_is_read_only(self, sample_offers):
+        """Тест неизменяемости опубликованного индекса"""
+        index = build_catalog_index(OfferStore.build(sample_offers), version=1)
+
+        with pytest.raises(TypeError):
+            index.get_seller("Shop A")["offers"][99] = {}
+        with pytest.raises(TypeError):
+            index.get_seller("Shop A")["offers"][1]["price"] = 0
+
+    def test_cache_publishes_new_version_per_load(self, cached_offers, sample_offers):
+        """Тест: каждая загрузка кэша публикует новую версию индекса"""
+        manager = cached_offers(sample_offers)
+        first = manager.get_catalog_index()
+
+        manager.publish_offers(sample_offers[:1])
+        second = manager.get_catalog_index()
+
+        assert second.version == first.version + 1
+        assert list(second.sellers) == ["Shop A"]
+        assert manager.get_cache_info()["generation"] == second.version
+
+
+class TestOfferStore:
+    """Тесты для колоночного хранилища офферов"""
+
+    def test_rows_behave_like_offer_dicts(self, sample_offers):
+        """Тест: строки хранилища читаются как исходные словари"""
+        store = OfferStore.build(sample_offers)
+
+        assert len(store) == 4
+        row = store[1]
+        assert isinstance(row, OfferRow)
+        assert row == sample_offers[1]
+        assert row["title"] == "Кефир 1%"
+        assert row.get("missing", "default") == "default"
+        assert row.to_dict() == sample_offers[1]
+        # Поля, которых нет у оффера, не появляются в строке
+        assert "category_code" not in store[3]
+        assert [r["offer_id"] for r in store[1:3]] == [2, 3]
+
+    def test_columns_are_compact(self, sample_offers):
+        """Тест: ID и цены в массивах, повторяющиеся строки интернированы"""
+        offers = [dict(offer, seller_name="".join(["Shop ", "A"])) for offer in sample_offers]
+        store = OfferStore.build(offers)
+
+        assert store.offer_ids.typecode == "q"
+        assert list(store.prices) == [90.0, 75.5, 0.0, 10.0]
+        assert store[0]["seller_name"] is store[2]["seller_name"]
+        assert store.find_row("3") == 2
+
+    def test_unchanged_titles_are_not_renormalized(self, sample_offers):
+        """Тест: нормализованные названия переиспользуются из предыдущего хранилища"""
+        previous = OfferStore.build(sample_offers)
+        changed = [dict(sample_offers[0], title="Ряженка 4%")] + sample_offers[1:]
+
+        with patch("app.cache.offer_store.normalize_title", return_value="new") as mock_normalize:
+            store = OfferStore.build(changed, previous=previous)
+
+        mock_normalize.assert_called_once_with("Ряженка 4%")
+        assert store.normalized_names[1] == previous.normalized_names[1]
+
+    def test_dictionary_change_renormalizes_titles(self, sample_offers):
+        """Тест: после смены словарей нормализатора названия не переиспользуются"""
+        previous = OfferStore.build(sample_offers)
+
+        try:
+            with patch.dict(title_normalizer.SYNONYMS, {"кефир": "кефирный продукт"}):
+                store = OfferStore.build(sample_offers, previous=previous)
+        finally:
+            title_normalizer.refresh_normalizer()
+
+        assert store.normalizer_fingerprint != previous.normalizer_fingerprint
+        assert store.normalized_names[1] == "кефирный продукт 1%"
+        assert OfferStore.build(sample_offers).normalized_names[1] == "кефир 1%"
+
+    def test_title_attributes_are_parsed_on_load(self, sample_offers):
+        """Тест: жирность и объём разобраны из нормализованного названия при загрузке"""
+        store = OfferStore.build(sample_offers)
+
+        attributes = store[0].title_attributes
+        assert attributes == TitleAttributes(fat_percent=3.2, milliliters=900.0)
+        assert attributes.quantity == 900.0
+        assert store.title_attributes(1) == TitleAttributes(fat_percent=1.0)
+        assert store.title_attributes(3) == TitleAttributes()
+
+        with patch("app.cache.offer_store.parse_normalized_attributes") as mock_parse:
+            OfferStore.build(sample_offers, previous=store)
+        mock_parse.assert_not_called()
+
+
+class TestCacheSnapshots:
+    """Тесты для снимков каталога в CacheManager"""
+
+    @staticmethod
+    def _make_db_client(pages, delay=0.0):
+        """Мок клиента Supabase, отдающий страницы по очереди"""
+        calls = []
+
+        def execute():
+            calls.append(1)
+            time.sleep(delay)
+            return Mock(data=pages[len(calls) - 1] if len(calls) <= len(pages) else [])
+
+        db_client = Mock()
+        db_client.table.return_value.select.return_value.order.return_value.range.return_value \
+            .execute.side_effect = execute
+        return db_client, calls
+
+    def test_readers_get_snapshot_without_copy(self, cached_offers, sample_offers):
+        """Тест: читатели получают ссылку на снимок, а не копию"""
+        manager = cached_offers(sample_offers)
+        snapshot = manager.get_snapshot()
+
+        assert manager.get_all_offers() is snapshot.offers
+        assert manager.get_offer("2") == sample_offers[1]
+        assert list(manager.get_offers_by_seller("Shop A")) == sample_offers[:2]
+        assert manager.get_unique_sellers() == ("Shop A", "Shop B")
+
+    def test_snapshot_is_swapped_not_mutated(self, cached_offers, sample_offers):
+        """Тест: старый снимок остаётся согласованным после обновления"""
+        manager = cached_offers(sample_offers)
+        old = manager.get_snapshot()
+
+        manager.publish_offers(sample_offers[2:])
+
+        assert len(old.offers) == 4
+        assert old.get_offer(1) is not None
+        assert manager.get_snapshot().generation == old.generation + 1
+        assert manager.get_offer(1) is None
+
+    def test_concurrent_cold_start_loads_once(self, sample_offers):
+        """Тест: параллельные запросы на холодном старте ждут одну загрузку"""
+        db_client, calls = self._make_db_client([sample_offers], delay=0.05)
+        manager = CacheManager(db_client)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: manager.get_all_offers(), range(8)))
+
+        assert len(calls) == 1
+        assert all(len(offers) == 4 for offers in results)
+        assert manager.get_cache_info()["generation"] == 1
+
+
+class TestDeltaRefresh:
+    """Тесты для инкрементального обновления кэша"""
+
+    @pytest.fixture
+    def db_client(self, sample_offers):
+        """Мок клиента: полная загрузка и выборка изменений по updated_at"""
+        for i, offer in enumerate(sample_offers):
+            offer["updated_at"] = f"2026-01-0{i + 1}T00:00:00"
+        client = Mock()
+        full_query = client.table.return_value.select.return_value.order.return_value
+        full_query.range.return_value.execute.return_value = Mock(data=sample_offers)
+        full_query.limit.return_value.execute.return_value = Mock(count=len(sample_offers))
+        return client
+
+    @staticmethod
+    def _set_delta(client, rows):
+        delta_query = client.table.return_value.select.return_value.gte.return_value.order.return_value.order.return_value
+        delta_query.range.return_value.execute.return_value = Mock(data=rows)
+        delta_query.limit.return_value.execute.return_value = Mock(count=len(rows))
+
+    def test_full_load_sets_watermark(self, db_client):
+        """Тест: полная загрузка запоминает водяной знак"""
+        manager = CacheManager(db_client)
+
+        assert manager.refresh_cache() is True
+
+        info = manager.get_cache_info()
+        assert info["watermark"] == {"column": "updated_at", "value": "2026-01-04T00:00:00"}
+        assert info["last_refresh"]["mode"] == "full"
+
+    def test_delta_merges_changes_and_tombstones(self, db_client, sample_offers):
+        """Тест: delta-обновление сливает изменения и удаления со снимком"""
+        manager = CacheManager(db_client)
+        manager.refresh_cache("full")
+        old_index = manager.get_catalog_index()
+
+        self._set_delta(db_client, [
+            dict(sample_offers[3]),
+            {**sample_offers[0], "price": 80, "updated_at": "2026-02-01T00:00:00"},
+            {**sample_offers[2], "is_deleted": True, "updated_at": "2026-02-02T00:00:00"},
+            {"offer_id": 5, "title": "Сметана", "seller_name": "Shop B", "price": 120,
+             "updated_at": "2026-02-03T00:00:00"},
+        ])
+        with patch.object(config, "CACHE_TOMBSTONE_COLUMN", "is_deleted"):
+            assert manager.refresh_cache() is True
+
+        info = manager.get_cache_info()
+        assert info["last_refresh"]["mode"] == "delta"
+        assert info["last_refresh"]["changed"] == 2
+        assert info["last_refresh"]["deleted"] == 1
+        assert info["watermark"]["value"] == "2026-02-03T00:00:00"
+        assert manager.get_offer(1)["price"] == 80
+        assert manager.get_offer(3) is None
+        assert manager.get_offer(5) is not None
+
+        new_index = manager.get_catalog_index()
+        assert new_index.get_seller("Shop A")["offers"][2] == old_index.get_seller("Shop A")["offers"][2]
+        assert new_index.get_seller("Shop A")["offers"][1]["price"] == 80
+
+    def test_noop_delta_resets_staleness(self, db_client):
+        """Тест: delta без изменений подтверждает снимок — он не устаревает, обновления не учащаются"""
+        manager = CacheManager(db_client)
+        manager.refresh_cache("full")
+        hours_ago = datetime.now() - timedelta(hours=2)
+        manager._snapshot.loaded_at = manager._verified_at = hours_ago
+        assert manager.get_cache_info()["is_stale"] is True
+        
+        self._set_delta(db_client, [])
+        assert manager.refresh_cache("delta") is True
+        
+        info = manager.get_cache_info()
+        assert info["generation"] == 1
+        assert info["last_update"] == hours_ago.isoformat()
+        assert info["is_stale"] is False and info["cache_age_seconds"] < 60
+        refresher = CacheRefresher(manager, interval=300, jitter=0, max_staleness=3600)
+        assert refresher._next_delay() == 300
+
+    @staticmethod
+    def _layout(snapshot):
+        """Содержимое индексов снимка в терминах offer_id (не зависит от номеров строк)"""
+        store = snapshot.offers
+        ids = lambda rows: sorted(store.offer_ids[row] for row in rows)
+        sellers = {
+            name: (
+                ids(seller["offers"].rows),
+                {level: ids(bucket.rows) for level, bucket in seller["categories"].items()},
+                {tag: ids(rows) for tag, rows in seller["tags"].items()},
+                {token: ids(rows) for token, rows in seller["search"].tokens.items()},
+                {gram: ids(rows) for gram, rows in seller["search"].ngrams.items()},
+            )
+            for name, seller in snapshot.catalog_index.sellers.items()
+        }
+        postings = snapshot.postings
+        ranks = lambda index: {key: [store.offer_ids[postings.order[rank]] for rank in value]
+                               for key, value in index.items()}
+        return (
+            sellers,
+            ranks(postings.by_seller), ranks(postings.by_category), ranks(postings.by_tag),
+            {offer_id: store.row(row).to_dict() for offer_id, row in store.row_by_id.items()},
+            [(store.offer_ids[row], postings.lower_titles[rank]) for rank, row in enumerate(postings.order)],
+            {store.offer_ids[row]: (store.normalized_names[row], repr(store.attribute_values(row))) for row in range(len(store))},
+        )
+
+    def test_delta_rebuilds_only_affected_sellers(self, sample_offers):
+        """Тест: снимок из предыдущего с заменой строк совпадает с полной сборкой, другие продавцы не перестраиваются"""
+        offers = sample_offers + [
+            {"offer_id": 6, "title": "Хлеб", "seller_name": "Shop C", "price": 40, "tags": ["хлеб"]},
+            {"offer_id": 7, "title": "Батон", "seller_name": "Shop C", "price": 45, "tags": ["хлеб"]},
+        ]
+        previous = CatalogSnapshot.build(offers, generation=1)
+        shop_c = previous.catalog_index.get_seller("Shop C")
+        cases = [
+            # только цена: ранги и posting lists переиспользуются
+            ({0: {**offers[0], "price": 80}}, [], set()),
+            # новое название и теги у продавца, смена продавца, новые офферы сверх удалённых
+            ({0: {**offers[0], "title": "Ряженка 4%", "tags": ["ряженка"]}, 1: {**offers[1], "seller_name": "Shop B"}},
+             [{"offer_id": 8, "title": "Сметана", "seller_name": "Shop D", "price": 120, "category_code": "1.3"},
+              {"offer_id": 9, "title": "Творог", "seller_name": "Shop A", "price": 99}], {2}),
+            # удалённых больше, чем новых: дыры закрываются последними строками
+            ({}, [], {0, 3, 4}),
+        ]
+        for replaced, added, deleted in cases:
+            patched = CatalogSnapshot.patch(previous, replaced, added, deleted, generation=2)
+            merged = [replaced.get(row, offer) for row, offer in enumerate(offers) if row not in deleted] + added
+            rebuilt = CatalogSnapshot.build(merged, generation=2)
+
+            assert self._layout(patched) == self._layout(rebuilt)
+            assert len(patched.offers) == len(merged)
+            assert patched.get_offer(7)["title"] == "Батон"
+            shop_c_moved = len(merged) <= 5
+            assert (patched.catalog_index.get_seller("Shop C")["search"] is shop_c["search"]) is not shop_c_moved
+            assert patched.catalog_index.get_seller("Shop C")["offers"].store is patched.offers
+            if not added and not deleted:
+                assert patched.postings.by_seller is previous.postings.by_seller
+                assert patched.catalog_index.get_seller("Shop A")["search"] is (
+                    previous.catalog_index.get_seller("Shop A")["search"]
+                )
+
+    def test_auto_mode_reconciles_periodically(self, db_client):
+        """Тест: в режиме auto периодически выполняется полная сверка"""
+        manager = CacheManager(db_client)
+        manager.refresh_cache()
+        self._set_delta(db_client, [])
+
+        with patch.object(config, "CACHE_FULL_REFRESH_EVERY", 2):
+            modes = []
+            for _ in range(3):
+                manager.refresh_cache()
+                modes.append(manager.get_cache_info()["last_refresh"]["mode"])
+
+        assert modes == ["delta", "delta", "full"]
+
+    def test_apply_pushed_changes(self, db_client, sample_offers):
+        """Тест: присланные изменения применяются без обращения к источнику"""
+        manager = CacheManager(db_client)
+        manager.refresh_cache("full")
+        db_client.reset_mock()
+
+        result = manager.apply_changes(
+            upserts=[
+                {"offer_id": 1, "price": 80},
+                {"offer_id": 5, "title": "Сметана 20%", "seller_name": "Shop B", "price": 120,
+                 "category_name": "Сметана", "category_code": "1.3"},
+            ],
+            deletes=[3]
+        )
+
+        assert result == {"generation": 2, "changed": 2, "deleted": 1}
+        assert manager.get_offer(1)["price"] == 80
+        assert manager.get_offer(1)["title"] == sample_offers[0]["title"]
+        assert manager.get_offer(3) is None
+        assert [o["offer_id"] for o in manager.get_offers_by_seller("Shop B")] == [5]
+        assert len(manager.get_catalog_index().get_seller("Shop B")["categories"]["1.3"]) == 1
+        assert manager.get_snapshot().postings.page(10, q="сметана").total == 1
+        assert manager.get_cache_info()["watermark"]["value"] == "2026-01-04T00:00:00"
+        assert manager.get_cache_info()["last_refresh"]["mode"] == "ingest"
+        db_client.table.assert_not_called()
+
+    def test_pushed_changes_are_written_in_background(self, db_client, tmp_path):
+        """Тест: приём изменений не ждёт записи файла снимка и обхода структур для учёта памяти"""
+        path = str(tmp_path / "catalog.snapshot")
+        manager = CacheManager(db_client, snapshot_path=path)
+        manager.refresh_cache("full")
+        release = Event()
+        
+        def slow_write(*args):
+            release.wait(2)
+            return write_snapshot_file(*args)
+        
+        with patch("app.cache.cache_manager.write_snapshot_file", side_effect=slow_write), \
+                patch.object(config, "CACHE_SNAPSHOT_PERSIST_INTERVAL", 0):
+            started = time.monotonic()
+            result = manager.apply_changes(upserts=[{"offer_id": 1, "price": 80}])
+            assert time.monotonic() - started < 1
+            assert read_snapshot_file(path).generation == 1
+            assert manager.get_memory_info()["history"][-1]["estimated"] is True
+            release.set()
+            manager.flush_writes()
+        
+        assert result["generation"] == 2
+        assert read_snapshot_file(path).generation == 2
+
+    def test_apply_changes_requires_loaded_catalog(self, db_client):
+        """Тест: изменения не применяются к незагруженному каталогу и без offer_id"""
+        manager = CacheManager(db_client)
+
+        with pytest.raises(ChangesRejected):
+            manager.apply_changes(upserts=[{"offer_id": 1, "price": 80}])
+        with pytest.raises(ValueError):
+            manager.apply_changes(upserts=[{"price": 80}])
+
+    def test_unknown_mode(self, db_client):
+        """Тест неизвестного режима обновления"""
+        with pytest.raises(ValueError):
+            CacheManager(db_client).refresh_cache("sometimes")
+
+
+class FakeQuery:
+    """Запрос PostgREST поверх списка строк с управляемыми сбоями страниц"""
+
+    def __init__(self, rows, failures, calls):
+        self.rows = rows
+        self.failures = failures
+        self.calls = calls
+        self._range = None
+        self._count = None
+
+    def __call__(self, *columns, count=None):
+        query = FakeQuery(self.rows, self.failures, self.calls)
+        query._count = count
+        return query
+
+    def limit(self, _):
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        if self._count:
+            return Mock(count=len(self.rows))
+        start, end = self._range
+        self.calls.append(start)
+        if self.failures.get(start, 0) > 0:
+            self.failures[start] -= 1
+            raise ConnectionError("page timeout")
+        return Mock(data=self.rows[start:end + 1])
+
+
+class TestPagedLoader:
+    """Тесты для параллельного загрузчика страниц"""
+
+    def test_pages_are_reassembled_in_order(self):
+        """Тест: страницы загружаются параллельно и собираются по порядку"""
+        rows = [{"offer_id": i} for i in range(25)]
+        loader = PagedLoader(page_size=10, max_workers=3, backoff_seconds=0)
+
+        assert loader.load(FakeQuery(rows, {}, [])) == rows
+
+    def test_failed_page_is_retried_alone(self):
+        """Тест: упавшая страница повторяется отдельно от остальных"""
+        rows = [{"offer_id": i} for i in range(25)]
+        calls = []
+        loader = PagedLoader(page_size=10, max_workers=3, max_retries=2, backoff_seconds=0)
+
+        assert loader.load(FakeQuery(rows, {10: 2}, calls)) == rows
+        assert sorted(calls) == [0, 10, 10, 10, 20]
+
+    def test_load_resumes_from_completed_pages(self):
+        """Тест: следующая попытка догружает только недостающие страницы"""
+        rows = [{"offer_id": i} for i in range(25)]
+        calls = []
+        loader = PagedLoader(page_size=10, max_workers=3, max_retries=0, backoff_seconds=0)
+
+        with pytest.raises(PageLoadError) as exc_info:
+            loader.load(FakeQuery(rows, {20: 1}, calls))
+        assert exc_info.value.failed_pages == [2]
+
+        calls.clear()
+        result = loader.load(
+            FakeQuery(rows, {}, calls),
+            resume=exc_info.value.completed,
+            expected_total=exc_info.value.total
+        )
+        assert result == rows
+        assert calls == [20]
+
+
+class TestCacheRefresher:
+    """Тесты для фонового обновления кэша"""
+
+    @staticmethod
+    def _wait(job, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not job.is_done and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_manual_trigger_runs_job(self):
+        """Тест: ручной запуск выполняется в фоне и отражается в статусе задачи"""
+        manager = Mock()
+        manager.refresh_cache.return_value = True
+        manager.get_cache_info.return_value = {"generation": 7, "cache_age_seconds": 0}
+        refresher = CacheRefresher(manager, interval=60)
+
+        job = refresher.trigger("delta")
+        self._wait(job)
+
+        manager.refresh_cache.assert_called_once_with("delta")
+        assert refresher.get_job(job.job_id).to_dict()["status"] == "succeeded"
+        assert job.generation == 7
+
+    def test_pending_jobs_are_coalesced(self):
+        """Тест: запросы, пришедшие пока задача ждёт, схлопываются в неё"""
+        manager = Mock()
+        manager.get_cache_info.return_value = {"generation": 1, "cache_age_seconds": 0}
+        refresher = CacheRefresher(manager, interval=60)
+        refresher._thread = Mock(is_alive=Mock(return_value=True))  # поток «занят»
+
+        first = refresher.trigger("delta")
+        second = refresher.trigger("full")
+
+        assert second is first
+        assert first.mode == "full"
+        refresher._run_pending()
+        manager.refresh_cache.assert_called_once_with("full")
+
+    def test_failed_refresh_marks_job_failed(self):
+        """Тест: ошибка обновления не роняет планировщик и видна в задаче"""
+        manager = Mock()
+        manager.refresh_cache.side_effect = ConnectionError("db down")
+        manager.get_cache_info.return_value = {"generation": 1, "cache_age_seconds": 0}
+        refresher = CacheRefresher(manager, interval=60)
+
+        job = refresher.trigger()
+        self._wait(job)
+
+        assert job.status == "failed"
+        assert job.error == "db down"
+
+    def test_staleness_shortens_delay(self):
+        """Тест: устаревающий снимок обновляется раньше периода"""
+        manager = Mock()
+        manager.get_cache_info.return_value = {"cache_age_seconds": 3590}
+        refresher = CacheRefresher(manager, interval=300, jitter=30, max_staleness=3600)
+
+        assert refresher._next_delay() <= 10
+
+        with pytest.raises(ValueError):
+            refresher.trigger("sometimes")
+
+
+class TestSnapshotFile:
+    """Тесты для файла снимка каталога"""
+
+    def test_round_trip_keeps_generation_and_names(self, tmp_path, sample_offers):
+        """Тест: снимок восстанавливается без повторной нормализации"""
+        path = str(tmp_path / "catalog.snapshot")
+        original = CatalogSnapshot.build(sample_offers, generation=5, watermark=("offer_id", 4))
+        write_snapshot_file(path, original)
+
+        with patch("app.cache.offer_store.normalize_title") as mock_normalize:
+            restored = read_snapshot_file(path)
+        mock_normalize.assert_not_called()
+
+        assert restored.generation == 5
+        assert restored.watermark == ("offer_id", 4)
+        assert restored.loaded_at == original.loaded_at
+        assert list(restored.offers) == list(original.offers)
+        item = restored.catalog_index.get_seller("Shop A")["offers"][1]
+        assert item["normalized_name"] == "молоко 3.2% 900мл"
+        assert restored.offers.title_attributes(0) == original.offers.title_attributes(0)
+        assert item["offer_data"] == restored.get_offer(1)
+        # Колонки читаются из отображённого файла, а не десериализуются
+        assert isinstance(restored.offers.prices, memoryview)
+
+    def test_file_is_not_pickle(self, tmp_path, sample_offers):
+        """Тест: файл снимка — сегмент с сырыми колонками, pickle не используется"""
+        path = tmp_path / "catalog.snapshot"
+        write_snapshot_file(str(path), CatalogSnapshot.build(sample_offers, generation=1))
+
+        assert path.read_bytes().startswith(b"KRZSEG")
+        with patch("pickle.loads") as mock_loads:
+            read_snapshot_file(str(path))
+        mock_loads.assert_not_called()
+
+    def test_corrupted_file_is_rejected(self, tmp_path, sample_offers):
+        """Тест: повреждённый файл не принимается"""
+        path = tmp_path / "catalog.snapshot"
+        write_snapshot_file(str(path), CatalogSnapshot.build(sample_offers, generation=1))
+        data = bytearray(path.read_bytes())
+        # Байт в блоках колонок (сразу после заголовка)
+        data[40] ^= 0xFF
+        path.write_bytes(bytes(data))
+
+        with pytest.raises(SnapshotFileError, match="checksum"):
+            read_snapshot_file(str(path))
+
+    def test_other_normalizer_dictionaries_are_rejected(self, tmp_path, sample_offers):
+        """Тест: снимок, построенный с другими словарями нормализатора, не читается"""
+        path = str(tmp_path / "catalog.snapshot")
+        write_snapshot_file(path, CatalogSnapshot.build(sample_offers, generation=1))
+
+        with patch("app.cache.shared_segment.refresh_normalizer", return_value="other"):
+            with pytest.raises(SnapshotFileError, match="normalizer"):
+                read_snapshot_file(path)
+
+    def test_other_format_version_is_rejected(self, tmp_path, sample_offers):
+        """Тест: файл другой версии формата не принимается"""
+        path = str(tmp_path / "catalog.snapshot")
+        write_snapshot_file(path, CatalogSnapshot.build(sample_offers, generation=1))
+
+        with patch("app.cache.shared_segment.FORMAT_VERSION", FORMAT_VERSION + 1):
+            with pytest.raises(SnapshotFileError, match="format"):
+                read_snapshot_file(path)
+
+    def test_manager_warm_starts_from_file(self, tmp_path, sample_offers):
+        """Тест: менеджер сохраняет каждый снимок и поднимается из файла без БД"""
+        path = str(tmp_path / "catalog.snapshot")
+        CacheManager(Mock(), snapshot_path=path).publish_offers(sample_offers)
+
+        db_client = Mock()
+        manager = CacheManager(db_client, snapshot_path=path)
+
+        assert manager.load_from_file() is True
+        assert manager.get_offer(2)["title"] == "Кефир 1%"
+        assert manager.get_cache_info()["last_refresh"]["mode"] == "file"
+        db_client.table.assert_not_called()
+
+    def test_missing_file(self, tmp_path):
+        """Тест: без файла тёплый старт не выполняется"""
+        manager = CacheManager(Mock(), snapshot_path=str(tmp_path / "missing.snapshot"))
+
+        assert manager.load_from_file() is False
+        assert manager.get_cache_info()["is_loaded"] is False
+
+
+class TestMemoryAccounting:
+    """Тесты для учёта памяти кэша"""
+
+    def test_deep_sizeof_counts_shared_objects_once(self):
+        """Тест: общий объект учитывается один раз"""
+        shared = ["x" * 1000]
+        seen = set()
+
+        first = deep_sizeof({"a": shared}, seen)
+        second = deep_sizeof({"b": shared}, seen)
+
+        assert first > 1000
+        assert second < 1000
+
+    def test_memory_is_tracked_per_generation(self, cached_offers, sample_offers):
+        """Тест: размер снимка по структурам и история по поколениям"""
+        manager = cached_offers(sample_offers)
+        manager.publish_offers(sample_offers[:2])
+
+        memory = manager.get_cache_info()["memory"]
+        assert memory["total_bytes"] == sum(memory["structures"].values())
+        assert {"offers", "normalized_titles", "category_buckets", "seller_groups", "postings"} <= set(
+            memory["structures"])
+        generations = [report["generation"] for report in memory["history"]]
+        assert generations[-2:] == [generations[-1] - 1, generations[-1]]
+
+    def test_snapshot_over_budget_is_rejected(self, cached_offers, sample_offers):
+        """Тест: снимок сверх бюджета памяти не подменяет текущий"""
+        manager = cached_offers(sample_offers[:1])
+        current = manager.get_snapshot()
+
+        with patch.object(config, "CACHE_MEMORY_BUDGET_MB", 0.0001):
+            with pytest.raises(MemoryBudgetExceeded):
+                manager.publish_offers(sample_offers)
+
+        assert manager.get_snapshot() is current
+        assert manager.get_memory_info()["rejected_snapshots"] == 1
+
+
+class TestLocalCatalogSource:
+    """Тесты для локального источника каталога (SQLite/JSON/NDJSON)"""
+
+    @pytest.fixture
+    def offers(self, sample_offers):
+        for i, offer in enumerate(sample_offers):
+            offer["updated_at"] = f"2026-01-0{i + 1}T00:00:00"
+            offer["tags"] = ["milk"] if i % 2 == 0 else []
+        return list(reversed(sample_offers))
+
+    @staticmethod
+    def _write(path, offers):
+        """Записать фикстуру в формате по расширению файла"""
+        path = str(path)
+        if path.endswith(".db"):
+            connection = sqlite3.connect(path)
+            connection.execute(
+                "CREATE TABLE analog_offers (offer_id INTEGER, title TEXT, seller_name TEXT, price TEXT, "
+                "category_name TEXT, category_code TEXT, updated_at TEXT, tags TEXT)"
+            )
+            connection.executemany(
+                "INSERT INTO analog_offers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (o["offer_id"], o["title"], o["seller_name"], o["price"], o.get("category_name"),
+                     o.get("category_code"), o["updated_at"], json.dumps(o["tags"]))
+                    for o in offers
+                ]
+            )
+            connection.commit()
+            connection.close()
+        elif path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(offers, f, ensure_ascii=False)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(o, ensure_ascii=False) + "\n" for o in offers)
+        return path
+
+    @pytest.mark.parametrize("name", ["catalog.db", "catalog.json", "catalog.ndjson"])
+    def test_load_all_and_changes(self, tmp_path, offers, name):
+        """Тест: полная загрузка по offer_id и выборка изменений по водяному знаку"""
+        source = LocalCatalogSource(self._write(tmp_path / name, offers), page_size=2)
+
+        rows = source.load_all()
+        assert [row["offer_id"] for row in rows] == [1, 2, 3, 4]
+        assert rows[0]["tags"] == ["milk"]
+
+        changed = source.load_changes("updated_at", "2026-01-03T00:00:00")
+        assert [row["offer_id"] for row in changed] == [3, 4]
+        assert [row["offer_id"] for row in source.load_changes("offer_id", 2)] == [3, 4]
+        source.ping()
+
+    def test_cache_manager_runs_on_local_source(self, tmp_path, offers):
+        """Тест: полная и delta-загрузка кэша из локального файла"""
+        path = self._write(tmp_path / "catalog.ndjson", offers)
+        manager = CacheManager(LocalCatalogSource(path))
+
+        assert manager.refresh_cache("full") is True
+        assert manager.get_cache_info()["data_source"] == "local"
+        assert manager.health_check() is True
+
+        offers[0] = dict(offers[0], title="Шоколад", updated_at="2026-02-01T00:00:00")
+        self._write(path, offers)
+        assert manager.refresh_cache("delta") is True
+        assert manager.get_offer(4)["title"] == "Шоколад"
+        assert len(manager.get_all_offers()) == 4
+
+    def test_missing_file(self, tmp_path):
+        """Тест: отсутствующий файл — ошибка загрузки, а не исключение наружу"""
+        manager = CacheManager(LocalCatalogSource(str(tmp_path / "missing.db")))
+
+        assert manager.health_check() is False
+        assert manager.load_all_data() is False
+
+    def test_factory_validates_settings(self, tmp_path):
+        """Тест: выбор источника по DATA_SOURCE"""
+        with patch.object(config, "DATA_SOURCE", "local"), \
+                patch.object(config, "LOCAL_CATALOG_PATH", str(tmp_path / "catalog.json")):
+            assert isinstance(create_data_source(config), LocalCatalogSource)
+        with patch.object(config, "DATA_SOURCE", "local"), patch.object(config, "LOCAL_CATALOG_PATH", None):
+            with pytest.raises(ValueError):
+                create_data_source(config)
+        with patch.object(config, "DATA_SOURCE", "oracle"):
+            with pytest.raises(ValueError):
+                create_data_source(config)
+
+
+class TestOfferDetails:
+    """Тесты для горячих колонок и холодных полей офферов"""
+
+    @pytest.fixture
+    def catalog_path(self, tmp_path, sample_offers):
+        for i, offer in enumerate(sample_offers):
+            offer["updated_at"] = f"2026-01-0{i + 1}T00:00:00"
+            offer["description"] = "Описание " * 50
+            offer["images"] = [f"https://img/{offer['offer_id']}.jpg"]
+        path = tmp_path / "catalog.ndjson"
+        path.write_text("\n".join(json.dumps(o, ensure_ascii=False) for o in sample_offers), encoding="utf-8")
+        return str(path)
+
+    def test_snapshot_keeps_only_hot_columns(self, catalog_path):
+        """Тест: в снимке только горячие колонки, холодные догружаются для ответа"""
+        manager = CacheManager(LocalCatalogSource(catalog_path))
+        with patch.object(config, "CACHE_HOT_COLUMNS", "title,price,seller_name"):
+            assert manager.load_all_data() is True
+            offer = manager.get_offer(1)
+            assert "description" not in offer
+            assert offer["updated_at"] == "2026-01-01T00:00:00"
+
+            hydrated = manager.hydrate_offers([offer, manager.get_offer(2)])
+            assert hydrated[0]["images"] == ["https://img/1.jpg"]
+            assert hydrated[1]["description"].startswith("Описание")
+
+            manager.hydrate_offers([offer])
+            stats = manager.get_cache_info()["details"]
+            assert (stats["hits"], stats["misses"], stats["fetches"]) == (1, 2, 1)
+
+    def test_without_hot_columns_offers_are_complete(self, catalog_path):
+        """Тест: без CACHE_HOT_COLUMNS офферы загружаются целиком и не догружаются"""
+        manager = CacheManager(LocalCatalogSource(catalog_path))
+        assert manager.load_all_data() is True
+
+        offer = manager.get_offer(1)
+        assert manager.hydrate_offers([offer]) == [offer]
+        assert manager.get_cache_info()["details"]["misses"] == 0
+
+    def test_lru_eviction_and_invalidation(self):
+        """Тест: LRU вытесняет старые записи, изменённые офферы забываются"""
+        source = Mock()
+        source.load_details.side_effect = lambda ids, columns: {i: {"description": f"d{i}"} for i in ids}
+        details = OfferDetailsCache(source, max_size=2)
+
+        details.get_many([1, 2], ["description"])
+        details.get_many([3], ["description"])
+        assert len(details) == 2
+
+        details.invalidate(["3"])
+        assert details.get_many([2, 3], ["description"])[3] == {"description": "d3"}
+        assert source.load_details.call_args_list[-1].args[0] == [3]
+
+    def test_source_failure_returns_hot_fields(self, catalog_path):
+        """Тест: ошибка догрузки не ломает ответ"""
+        manager = CacheManager(LocalCatalogSource(catalog_path))
+        with patch.object(config, "CACHE_HOT_COLUMNS", "title"):
+            manager.load_all_data()
+            offer = manager.get_offer(1)
+            with patch.object(manager.data_source, "load_details", side_effect=OSError("down")):
+                assert manager.hydrate_offers([offer]) == [offer]
+
+
+class TestSharedSegment:
+    """Тесты для общего mmap-сегмента каталога"""
+
+    @pytest.fixture
+    def offers(self, sample_offers):
+        sample_offers[0]["tags"] = ["milk", "dairy"]
+        sample_offers[1]["rating"] = 4.5
+        return sample_offers
+
+    def test_segment_round_trip(self, tmp_path, offers):
+        """Тест: снимок из сегмента совпадает с исходным"""
+        snapshot = CatalogSnapshot.build(offers, generation=3, watermark=("offer_id", 4))
+        write_segment(str(tmp_path), snapshot)
+
+        attached = attach_segment(str(tmp_path))
+
+        assert attached.generation == 3
+        assert attached.watermark == ("offer_id", 4)
+        assert [dict(row) for row in attached.offers] == [dict(row) for row in snapshot.offers]
+        assert "rating" not in attached.get_offer(1)
+        assert list(attached.offers.normalized_names) == list(snapshot.offers.normalized_names)
+        assert attached.get_offer(1).title_attributes.milliliters == 900.0
+        assert attached.postings.page(10, tag="milk").rows == [0]
+        assert attached.postings.page(10, q="МОЛОКО").total == 2
+        assert dict(attached.catalog_index.sellers["Shop A"]["offers"]) == \
+            dict(snapshot.catalog_index.sellers["Shop A"]["offers"])
+
+    def test_attached_store_can_be_persisted(self, tmp_path, offers):
+        """Тест: снимок из сегмента сохраняется в файл снимка"""
+        write_segment(str(tmp_path), CatalogSnapshot.build(offers, generation=1))
+        attached = attach_segment(str(tmp_path))
+
+        path = str(tmp_path / "catalog.snapshot")
+        write_snapshot_file(path, attached)
+
+        assert [dict(row) for row in read_snapshot_file(path).offers] == [dict(row) for row in attached.offers]
+
+    def test_generations_are_swapped(self, tmp_path, offers):
+        """Тест: CURRENT переключается, старые сегменты удаляются"""
+        for generation in range(1, 5):
+            write_segment(str(tmp_path), CatalogSnapshot.build(offers[:generation], generation=generation))
+
+        assert read_current(str(tmp_path))["generation"] == 4
+        assert len(list(tmp_path.glob("catalog-*.seg"))) == 2
+        assert len(attach_segment(str(tmp_path)).offers) == 4
+
+    def test_missing_segment(self, tmp_path):
+        """Тест: без сегмента — понятная ошибка"""
+        with pytest.raises(SegmentError):
+            attach_segment(str(tmp_path))
+
+    def test_reader_follows_writer(self, tmp_path, offers):
+        """Тест: писатель публикует поколения, читатель подключается без обращения к источнику"""
+        shared_dir = str(tmp_path / "shared")
+        writer = CacheManager(Mock(), shared_dir=shared_dir, shared_role="writer")
+        reader_source = Mock()
+        reader = CacheManager(reader_source, shared_dir=shared_dir, shared_role="reader")
+
+        assert reader.refresh_cache() is False
+        writer.publish_offers(offers)
+        assert reader.refresh_cache() is True
+        assert reader.get_offer(2) == writer.get_offer(2)
+
+        writer.publish_offers(offers[:2])
+        assert reader.refresh_cache("full") is True
+        assert reader.get_cache_info()["generation"] == 2
+        assert reader.get_cache_info()["last_refresh"]["mode"] == "shared"
+        assert len(reader.get_all_offers()) == 2
+        reader_source.load_all.assert_not_called()
+        reader_source.load_changes.assert_not_called()
+
+    def test_reader_sees_writer_verification(self, tmp_path, offers):
+        """Тест: сверка писателя без нового поколения видна читателю через CURRENT"""
+        shared_dir = str(tmp_path / "shared")
+        source = Mock(spec=CatalogDataSource)
+        source.load_changes.return_value = []
+        writer = CacheManager(source, shared_dir=shared_dir, shared_role="writer")
+        reader = CacheManager(Mock(), shared_dir=shared_dir, shared_role="reader")
+        snapshot = writer.publish_offers(offers)
+        snapshot.watermark = ("offer_id", 3)
+        assert reader.refresh_cache() is True
+        reader._verified_at = datetime.now() - timedelta(hours=2)
+        
+        assert writer.refresh_cache("delta") is True
+        assert reader.refresh_cache() is True
+        assert reader.get_cache_info()["verified_at"] == writer.get_cache_info()["verified_at"]
+        assert reader.get_cache_info()["is_stale"] is False
+
+    def test_unknown_role(self):
+        """Тест: неизвестная роль процесса"""
+        with pytest.raises(ValueError):
+            CacheManager(Mock(), shared_dir="/tmp", shared_role="leader")
+
+
+class TestLeaderElection:
+    """Тесты для выбора лидера при CACHE_SHARED_ROLE=auto"""
+
+    @staticmethod
+    def _source(offers):
+        source = Mock(spec=CatalogDataSource)
+        source.name = "mock"
+        source.load_all.return_value = offers
+        source.load_changes.return_value = []
+        return source
+
+    def test_single_leader_loads_from_source(self, tmp_path, sample_offers):
+        """Тест: в источник ходит только лидер, остальные подхватывают его поколение"""
+        shared_dir = str(tmp_path)
+        sources = [self._source(sample_offers) for _ in range(3)]
+        managers = [CacheManager(source, shared_dir=shared_dir, shared_role="auto") for source in sources]
+
+        results = [manager.refresh_cache() for manager in managers]
+
+        assert results == [True, True, True]
+        assert [manager.is_leader for manager in managers] == [True, False, False]
+        assert sum(source.load_all.call_count for source in sources) == 1
+        assert {manager.get_cache_info()["generation"] for manager in managers} == {1}
+        assert managers[2].get_offer(2) == managers[0].get_offer(2)
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="нужен os.fork")
+    def test_forked_worker_does_not_release_master_lease(self, tmp_path):
+        """Тест: воркер, унаследовавший аренду через fork, не отпускает блокировку мастера"""
+        path = str(tmp_path / "leader.lock")
+        master = FileLease(path)
+        assert master.try_acquire()
+
+        pid = os.fork()
+        if pid == 0:
+            # Дочерний процесс: аренда не его, release только закрывает дескриптор
+            code = 0 if not master.is_held else 1
+            master.release()
+            code = code or (0 if not master.try_acquire() else 2)
+            os._exit(code)
+
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert master.is_held
+        assert not FileLease(path).try_acquire()
+        assert master.holder()["worker_id"].endswith(f":{os.getpid()}")
+        master.release()
+        assert FileLease(path).try_acquire()
+
+    def test_follower_takes_over(self, tmp_path, sample_offers):
+        """Тест: после ухода лидера аренду берёт другой процесс и продолжает его поколения"""
+        shared_dir = str(tmp_path)
+        leader = CacheManager(self._source(sample_offers), shared_dir=shared_dir, shared_role="auto")
+        follower_source = self._source(sample_offers)
+        follower = CacheManager(follower_source, shared_dir=shared_dir, shared_role="auto")
+        leader.refresh_cache()
+        follower.refresh_cache()
+
+        leader.release_leadership()
+        follower_source.load_changes.return_value = [dict(sample_offers[0], price="1")]
+        assert follower.refresh_cache() is True
+
+        assert follower.is_leader and not leader.is_leader
+        follower_source.load_all.assert_not_called()
+        assert follower.get_cache_info()["generation"] == 2
+        assert leader.refresh_cache() is True
+        assert leader.get_offer(1)["price"] == "1"
+
+    def test_leader_throttles_scheduled_refresh(self, tmp_path, sample_offers):
+        """Тест: частый опрос не приводит к лишним запросам лидера в источник"""
+        source = self._source(sample_offers)
+        leader = CacheManager(source, shared_dir=str(tmp_path), shared_role="auto")
+
+        leader.refresh_cache()
+        leader.refresh_cache()
+        source.load_changes.assert_not_called()
+
+        leader.refresh_cache("delta")
+        source.load_changes.assert_called_once()
+
+    def test_info_shows_leader_and_workers(self, tmp_path, sample_offers):
+        """Тест: в информации о кэше видны лидер и поколения процессов"""
+        manager = CacheManager(self._source(sample_offers), shared_dir=str(tmp_path), shared_role="auto")
+        manager.refresh_cache()
+
+        shared = manager.get_cache_info()["shared"]
+
+        assert shared["is_leader"] is True
+        assert shared["effective_role"] == "writer"
+        assert shared["leader"]["worker_id"] == shared["worker_id"]
+        assert [(w["worker_id"], w["generation"]) for w in shared["workers"]] == [(shared["worker_id"], 1)]
+
+    def test_unknown_backend(self, tmp_path):
+        """Тест: неизвестный бэкенд аренды"""
+        with patch.object(config, "CACHE_LEADER_BACKEND", "zookeeper"):
+            with pytest.raises(ValueError):
+                CacheManager(Mock(), shared_dir=str(tmp_path), shared_role="auto")
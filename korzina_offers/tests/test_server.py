@@ -0,0 +1,90 @@
+"""
+Тесты для мастер-процесса с предзагрузкой и fork воркеров
+"""
+import os
+import signal
+import time
+import pytest
+from app.server import PreforkServer
+
+
+def _sleep_forever():
+    """Работа воркера в тестах: ждать SIGTERM"""
+    while True:
+        time.sleep(1)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.fixture
+def server():
+    """Мастер без uvicorn; воркеры останавливаются после теста"""
+    state = {"generation": 1}
+
+    def refresh():
+        state["generation"] += 1
+        return True
+
+    prefork = PreforkServer(
+        _sleep_forever,
+        workers=2,
+        refresh=refresh,
+        generation=lambda: state["generation"],
+        shutdown_timeout=5.0
+    )
+    yield prefork
+    prefork.shutdown()
+
+
+class TestPreforkServer:
+    """Тесты для PreforkServer"""
+
+    def test_spawns_requested_workers(self, server):
+        """Тест: мастер держит нужное число воркеров"""
+        server.spawn_missing()
+
+        assert len(server.children) == 2
+        assert all(_alive(pid) for pid in server.children)
+
+    def test_dead_worker_is_replaced(self, server):
+        """Тест: упавший воркер перезапускается"""
+        server.spawn_missing()
+        dead = next(iter(server.children))
+        os.kill(dead, signal.SIGKILL)
+
+        deadline = time.monotonic() + 5
+        while dead in server.children and time.monotonic() < deadline:
+            server.reap()
+            time.sleep(0.01)
+
+        assert dead not in server.children
+        assert len(server.children) == 2
+
+    def test_new_generation_restarts_workers(self, server):
+        """Тест: после обновления каталога воркеры перефоркаются с новым поколением"""
+        server.spawn_missing()
+        old_pids = set(server.children)
+
+        server._reload_requested = True
+        server.maybe_refresh()
+
+        assert len(server.children) == 2
+        assert not old_pids & set(server.children)
+        assert set(server.children.values()) == {2}
+        assert not any(_alive(pid) for pid in old_pids)
+
+    def test_shutdown_stops_workers(self, server):
+        """Тест: остановка мастера останавливает все воркеры"""
+        server.spawn_missing()
+        pids = list(server.children)
+
+        server.shutdown()
+
+        assert server.children == {}
+        assert not any(_alive(pid) for pid in pids)
@@ -3,8 +3,12 @@
 """
 import pytest
 from unittest.mock import Mock, patch
+from app.cache.token_index import query_tokens
+from app.services.batch_scoring import fuzzy_matrix
 from app.services.product_service import ProductService
 from app.services.shop_search_service import ShopSearchService
+from app.services.title_attributes import parse_title_attributes
+from app.services.title_normalizer import NormalizationCache, TitleNormalizer, dictionaries_fingerprint
 from app.models import SearchRequest, MatchType
 
 
@@ -88,17 +92,16 @@ class TestProductService:
 class TestShopSearchService:
     """Тесты для ShopSearchService"""
     
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_find_cheapest_shop_success(self, mock_offers):
+    def test_find_cheapest_shop_success(self, cached_offers):
         """Тест успешного поиска магазина"""
-        mock_offers.return_value = [
+        cached_offers([
             {
                 "offer_id": 1,
                 "title": "Яблоки",
                 "seller_name": "Test Shop",
                 "price": 50
             }
-        ]
+        ])
         
         service = ShopSearchService()
         search_request = SearchRequest(products=["яблоки"])
@@ -110,17 +113,16 @@ class TestShopSearchService:
         assert result.total_price == 50.0
         assert result.products_found_count == 1
     
-    @patch('app.database.client.cache_manager.get_all_offers')
-    def test_find_cheapest_shop_no_results(self, mock_offers):
+    def test_find_cheapest_shop_no_results(self, cached_offers):
         """Тест поиска без результатов"""
-        mock_offers.return_value = [
+        cached_offers([
             {
                 "offer_id": 1,
                 "title": "Бананы",
                 "seller_name": "Test Shop",
                 "price": 50
             }
-        ]
+        ])
         
         service = ShopSearchService()
         search_request = SearchRequest(products=["яблоки"])
@@ -128,3 +130,164 @@ class TestShopSearchService:
         result = service.find_cheapest_shop(search_request)
         
         assert result is None
+    
+    def test_find_alternatives_filters_by_tags(self, cached_offers):
+        """Тест: альтернативы ищутся только среди офферов с тегами исходного"""
+        cached_offers([
+            {"offer_id": 1, "title": "Молоко Простоквашино 3.2% 930 мл", "seller_name": "Shop A", "price": 90,
+             "category_code": "1.1", "tags": ["молоко"]},
+            {"offer_id": 2, "title": "Молоко Простоквашино 3.2% 930 мл", "seller_name": "Shop B", "price": 95,
+             "category_code": "1.1", "tags": ["безлактозное"]},
+            {"offer_id": 3, "title": "Молоко Домик в деревне 3.2% 930 мл", "seller_name": "Shop B", "price": 99,
+             "category_code": "1.1", "tags": ["молоко"]},
+        ])
+        
+        service = ShopSearchService()
+        alternatives = service.find_alternatives_for_offers([1])
+        
+        match = alternatives["Shop B"][0]
+        assert match["is_duplicated"] is False
+        assert match["matched_offer"]["offer_id"] == 3
+    
+    def test_find_cheapest_shop_scores_only_candidates(self, cached_offers):
+        """Тест: fuzzy-скоринг только по кандидатам из индекса слов, без кандидатов — все офферы"""
+        cache = cached_offers([
+            {"offer_id": 1, "title": "Молоко Простоквашино 3.2% 930 мл", "seller_name": "Shop A", "price": 90,
+             "category_code": "1.1"},
+            {"offer_id": 2, "title": "Хлеб Бородинский", "seller_name": "Shop A", "price": 50,
+             "category_code": "2.1"},
+        ])
+        service = ShopSearchService()
+        seller_data = cache.get_snapshot().catalog_index.get_seller("Shop A")
+        
+        offers, candidates = service._candidate_offers(seller_data, [query_tokens("малоко простоквашино")])
+        assert list(offers) == [1] and list(candidates[0]) == [0]
+        offers, candidates = service._candidate_offers(
+            seller_data, [query_tokens("малоко простоквашино"), query_tokens("xyz")]
+        )
+        assert list(offers) == [1, 2] and candidates[1] is None
+        
+        result = service.find_cheapest_shop(SearchRequest(products=["малоко простоквашино"]))
+        assert result.found_products[0].product_id == "1"
+    
+    def test_target_products_info_first_match_from_columns(self, cached_offers):
+        """Тест: информация об искомых товарах — первое совпадение по строкам, без OfferRow на оффер"""
+        cache = cached_offers([
+            {"offer_id": 5, "title": "Кефир 1%", "seller_name": "Shop A", "price": 60, "category_code": "1.2"},
+            {"offer_id": 2, "title": "Молоко Простоквашино 3.2%", "seller_name": "Shop A", "price": 90,
+             "category_code": "1.1"},
+            {"offer_id": 1, "title": "Молоко Домик в деревне", "seller_name": "Shop B", "price": 99,
+             "category_code": "1.1"},
+        ])
+        snapshot = cache.get_snapshot()
+        service = ShopSearchService()
+        
+        with patch("app.cache.offer_store.OfferRow.__init__", side_effect=AssertionError):
+            info = service._get_target_products_info(["молоко", "КЕФИР", "творог", "о\nк"], snapshot)
+        
+        expected = service._get_target_products_info(["молоко", "КЕФИР", "творог"], list(snapshot.offers))
+        assert info["молоко"] == expected["молоко"] == {"category": snapshot.offers.value(1, "category_name"),
+                                                        "price": 90.0}
+        assert info["КЕФИР"] == expected["КЕФИР"] and info["КЕФИР"]["price"] == 60.0
+        assert info["творог"] == info["о\nк"] == {"category": None, "price": None}
+    
+    def test_batch_scoring_matches_pairwise(self):
+        """Тест: пакетный скоринг совпадает с попарным calculate_fuzzy_similarity"""
+        queries = ["молоко простоквашино", "хлеб"]
+        titles = ["молоко простоквашино 3.2% 930 мл", "хлеб бородинский", "кефир"]
+        
+        matrix = fuzzy_matrix(queries, titles, workers=1)
+        
+        assert matrix.shape == (2, 3)
+        for i, query in enumerate(queries):
+            for j, title in enumerate(titles):
+                assert matrix[i, j] == ProductService.calculate_fuzzy_similarity(query, title)
+    
+    def test_batch_scoring_cutoff_and_top_k(self):
+        """Тест: пары ниже порога и вне top-k получают 0, остальные — точный score"""
+        titles = ["молоко 3.2%", "молоко 2.5%", "молоко топлёное", "кефир", "хлеб", "сыр"]
+        exact = [ProductService.calculate_fuzzy_similarity("молоко", title) for title in titles]
+        
+        cut = fuzzy_matrix(["молоко"], titles, workers=1, score_cutoff=0.45)[0]
+        assert [score for score in cut if score] == [score for score in exact if score >= 0.45]
+        assert cut[3] == cut[4] == cut[5] == 0
+        
+        top = fuzzy_matrix(["молоко"], titles, workers=1, score_cutoff=0.45, top_k=1)[0]
+        assert top.max() == max(exact)
+        assert all(score in (0, exact[i]) for i, score in enumerate(top))
+    
+    def test_title_attributes_units_and_multipacks(self):
+        """Тест: атрибуты названия в каноничных единицах"""
+        water = parse_title_attributes("Вода 6 х 1,5 л")
+        assert (water.milliliters, water.multipack, water.quantity) == (1500.0, 6, 1500.0)
+        
+        cheese = parse_title_attributes("Сыр Российский 45% 0,2 кг")
+        assert (cheese.fat_percent, cheese.grams, cheese.milliliters) == (45.0, 200.0, None)
+        assert parse_title_attributes("Яйца С1 10 шт").pieces == 10
+    
+    def test_corridor_uses_precomputed_attributes(self, cached_offers):
+        """Тест: коридор веса сравнивает атрибуты, разобранные при загрузке"""
+        cache = cached_offers([
+            {"offer_id": 1, "title": "Молоко 3.2% 0,9 л", "seller_name": "Shop A", "price": 90},
+            {"offer_id": 2, "title": "Молоко 3.2% 930 мл", "seller_name": "Shop B", "price": 95},
+            {"offer_id": 3, "title": "Молоко 3.2% 2 л", "seller_name": "Shop B", "price": 150},
+        ])
+        service = ShopSearchService()
+        target, close, far = (cache.get_offer(offer_id) for offer_id in (1, 2, 3))
+        
+        with patch("app.services.shop_search_service.parse_title_attributes") as mock_parse:
+            assert service._is_in_corridor(target, close)
+            assert not service._is_in_corridor(target, far)
+        mock_parse.assert_not_called()
+    
+    def test_normalization_cache_is_bounded_lru(self):
+        """Тест: LRU нормализации считает попадания и вытесняет самые старые названия"""
+        normalize = Mock(side_effect=str.upper)
+        cache = NormalizationCache(normalize, max_size=2)
+        
+        assert [cache.normalize(title) for title in ("a", "b", "a", "c", "b")] == ["A", "B", "A", "C", "B"]
+        
+        assert [call.args[0] for call in normalize.call_args_list] == ["a", "b", "c", "b"]
+        stats = cache.get_stats()
+        assert (stats["size"], stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 1, 4, 0.2)
+        
+        cache.clear()
+        cache.normalize("a")
+        assert normalize.call_count == 5
+    
+    def test_empty_dictionary_changes_fingerprint(self):
+        """Тест: явно пустой словарь отключает шаг и даёт другой отпечаток"""
+        assert dictionaries_fingerprint(synonyms={}) != dictionaries_fingerprint()
+        assert dictionaries_fingerprint(synonyms=None) == dictionaries_fingerprint()
+        
+        normalizer = TitleNormalizer(synonyms={})
+        assert normalizer.fingerprint == dictionaries_fingerprint(synonyms={})
+        assert normalizer.normalize("Молочко 200 гр") == "молочко 200г"
+    
+    def test_identity_uses_snapshot_normalized_titles(self, cached_offers):
+        """Тест: идентичность офферов кэша сравнивает нормализованные названия снимка"""
+        cache = cached_offers([
+            {"offer_id": 1, "title": "Молоко пастер. 3,2% 0.9 л", "seller_name": "Shop A", "price": 90},
+            {"offer_id": 2, "title": "Молоко пастеризованное 3.2% 900 мл БЗМЖ", "seller_name": "Shop B", "price": 95},
+        ])
+        service = ShopSearchService()
+        
+        with patch("app.services.shop_search_service.normalize_title") as mock_normalize:
+            assert service._is_identical_offer(cache.get_offer(1), cache.get_offer(2))
+        mock_normalize.assert_not_called()
+    
+    def test_find_similar_offers_excludes_source(self, cached_offers):
+        """Тест: похожие офферы ищутся в том же магазине без исходного"""
+        cached_offers([
+            {"offer_id": 1, "title": "Молоко Простоквашино 3.2% 930 мл", "seller_name": "Shop A", "price": 90,
+             "category_code": "1.1"},
+            {"offer_id": 2, "title": "Молоко Простоквашино 2.5% 930 мл", "seller_name": "Shop A", "price": 85,
+             "category_code": "1.1"},
+            {"offer_id": 3, "title": "Молоко Простоквашино 3.2% 930 мл", "seller_name": "Shop B", "price": 95,
+             "category_code": "1.1"},
+        ])
+        
+        service = ShopSearchService()
+        similar = service.find_similar_offers_in_same_shop(1)
+        
+        assert [offer["offer_id"] for offer in similar] == [2]